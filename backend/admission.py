@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Coroutine, Deque, Dict, Optional
+import config
+
+logger = logging.getLogger(__name__)
+
+# Queue position updates are sent in the background; keep references until they finish
+_background_tasks = set()
+
+class AdmissionController:
+    """Global limit on the turns being answered at once.
+
+    Up to ``max_active`` turns run concurrently. Further turns wait in a FIFO
+    of at most ``max_queued`` entries and are told their position whenever it
+    changes; once the queue is full new turns are refused straight away, so a
+    spike turns into explicit busy replies instead of a pile of coroutines all
+    waiting on the upstream APIs.
+
+    There is no separate per-connection limit: a connection has at most one
+    turn running or queued, because ``ClientConnection.start_turn`` cancels
+    the previous turn (barge-in) before the next one asks for a slot.
+    """
+
+    def __init__(self, max_active: int, max_queued: int):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = 0
+        self._waiters: Deque[list] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def saturated(self) -> bool:
+        return self.active >= self.max_active
+
+    def _positions_changed(self):
+        if self._waiters:
+            task = asyncio.create_task(self._notify_positions())
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+    async def _notify_positions(self):
+        for position, (_, notify) in enumerate(list(self._waiters), start=1):
+            try:
+                await notify(position)
+            except Exception as e:
+                logger.warning(f"Could not send queue position: {str(e)}")
+
+    def _release(self):
+        # Hand the slot straight to the next waiter so nobody can overtake the queue
+        while self._waiters:
+            waiter, _ = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    async def _acquire(self, notify: Callable[[int], Awaitable[None]]) -> bool:
+        """Take a slot, waiting in the queue if needed; False when the queue is full"""
+        if not self.saturated and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.max_queued:
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = [waiter, notify]
+        self._waiters.append(entry)
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            await notify(len(self._waiters))
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled just after being handed a slot: pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(entry)
+                except ValueError:
+                    # _release already dropped it while skipping cancelled waiters
+                    pass
+            self._positions_changed()
+            raise
+        self.wait_seconds += time.perf_counter() - started
+        self._positions_changed()
+        return True
+
+    async def run(
+        self,
+        work: Coroutine,
+        on_queued: Callable[[int], Awaitable[None]],
+        on_busy: Callable[[], Awaitable[None]]
+    ):
+        """Run work once a slot is free, reporting queue positions, or refuse it when the queue is full"""
+        try:
+            admitted = await self._acquire(on_queued)
+        except BaseException:
+            work.close()
+            raise
+        if not admitted:
+            work.close()
+            self.rejected += 1
+            logger.warning(f"Turn refused: {self.active} active and {len(self._waiters)} queued")
+            await on_busy()
+            return
+        self.admitted += 1
+        try:
+            await work
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "max_active": self.max_active,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "mean_wait_seconds": self.wait_seconds / self.queued if self.queued else 0.0
+        }
+
+def create_admission_controller() -> Optional[AdmissionController]:
+    """Admission controller configured from the environment, or None when ADMISSION_MAX_ACTIVE is 0"""
+    if config.ADMISSION_MAX_ACTIVE <= 0:
+        return None
+    return AdmissionController(config.ADMISSION_MAX_ACTIVE, config.ADMISSION_MAX_QUEUED)
@@ -1,18 +1,29 @@
 from typing import List, Dict, Any
 from langchain.agents import Tool, AgentExecutor, LLMSingleActionAgent
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import MessagesPlaceholder
+from langchain_core.prompts import MessagesPlaceholder
 from langchain.schema import SystemMessage, AIMessage, HumanMessage
-from langchain_community.chat_message_histories import RedisChatMessageHistory
 from langchain.chains import LLMChain
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_groq import ChatGroq
+from llm_clients import get_chat_model
 from instructions import *
+from sessions import SessionRegistry
+from memory import create_memory
+from history import create_history_store, session_history
+from intent_router import IntentRouter, RouteDecision
+from semantic_cache import CacheLookup, create_semantic_cache, grade_bucket
+from rag import Passage, format_passages, get_retriever
+from embeddings import get_embedder
+from turn_graph import TurnGraph
+import config
+import timing
 import os 
 import json
 import logging
 import asyncio
-from typing import AsyncIterator, Optional
+import random
+import re
+import time
+from typing import AsyncIterator, Optional, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,27 +31,120 @@ logger = logging.getLogger(__name__)
 
 os.environ["GROQ_API_KEY"]= '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'
 
+# Define agent descriptions
+AGENT_DESCRIPTIONS = {
+    "motivation": {
+        "name": "Motivation Agent",
+        "description": """
+        1. Specializes in providing emotional support and encouragement
+        2. Helps students maintain focus and overcome learning challenges
+        3. Offers personalized motivation strategies and positive reinforcement
+        """
+    },
+    "maths_science": {
+        "name": "Maths and Science Tutor Agent",
+        "description": """
+        1. Expert in mathematics, physics, chemistry, and biology concepts
+        2. Provides step-by-step problem-solving guidance
+        3. Uses practical examples and visual explanations
+        """
+    },
+    "language_social": {
+        "name": "Language and Social Studies Agent",
+        "description": """
+        1. Specializes in language arts, history, and social sciences
+        2. Helps with writing, grammar, and literary analysis
+        3. Provides cultural context and historical perspectives
+        """
+    }
+}
+
+# Instructions per agent, used to build the sub-agents and the local intent router
+AGENT_INSTRUCTIONS = {
+    "motivation": motivation_agent_instructor,
+    "maths_science": maths_science_tutor_agent_instructor,
+    "language_social": language_social_studies_agent_instructor,
+}
+
+# Local classifier consulted before the LLM agent selector
+intent_router = IntentRouter.from_agents(
+    AGENT_DESCRIPTIONS,
+    AGENT_INSTRUCTIONS,
+    min_score=config.ROUTER_MIN_SCORE,
+    min_margin=config.ROUTER_MIN_MARGIN
+)
+
+# Answers shared between sessions for near-duplicate questions (None unless SEMANTIC_CACHE=1)
+semantic_cache = create_semantic_cache()
+
+# Keeps fire-and-forget tasks alive until they finish
+_background_tasks = set()
+
+_END_OF_STREAM = object()
+
+async def _pump(stream: AsyncIterator[str], queue: asyncio.Queue):
+    """Read a token stream into a queue so it can be consumed later"""
+    try:
+        async for chunk in stream:
+            await queue.put(chunk)
+    except Exception as e:
+        await queue.put(e)
+        return
+    await queue.put(_END_OF_STREAM)
+
+# Simplified and more structured selection prompt
+AGENT_SELECTION_PROMPT = """You are an agent selector. Analyze the user's input and select the most appropriate agent.
+
+            Available agents:
+            1. motivation - For emotional support, encouragement, and motivation
+            2. maths_science - For mathematics, physics, chemistry, and biology
+            3. language_social - For language arts, history, and social sciences
+
+            User Query: {query}
+            Previous Context: {history}
+            Student Profile: {student_context}
+
+            Respond with ONLY a JSON object in this exact format:
+            {{"selected_agent": "motivation"|"maths_science"|"language_social", "reason": "brief reason for selection"}}
+
+            Example response:
+            {{"selected_agent": "maths_science", "reason": "Query is about mathematics concepts"}}"""
+
 class AgentWithMemory:
-    def __init__(self, name: str, instructions: str, student_profile: Dict = None, llm=None):
+    # Whether the default LLM streams tokens
+    streaming = True
+
+    def __init__(self, name: str, instructions: str, student_profile: Dict = None, llm=None, student_context: Optional[str] = None, retrieval_subject: Optional[str] = None):
         logger.info(f"Initializing {name} with student profile")
         self.name = name
-        self.llm = llm if llm is not None else ChatGroq(
+        # Curriculum passages tagged with this subject are retrieved for each question
+        self.retrieval_subject = retrieval_subject
+        self.llm = llm if llm is not None else get_chat_model(
             model_name="llama-3.3-70b-versatile",
             temperature=0.7,
-            streaming=True
+            streaming=self.streaming
         )
         
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        self.memory = create_memory()
         
-        # Include student profile in instructions
-        student_context = self._format_student_context(student_profile) if student_profile else ""
+        # Include student profile in instructions (pre-rendered by the orchestrator when shared)
+        if student_context is None:
+            student_context = self._format_student_context(student_profile) if student_profile else ""
         self.instructions = f"{instructions}\n\nStudent Context:\n{student_context}"
+        
+        # Compile the prompt once; only the history and the user turn change per call.
+        # The system message is not a template, so braces in instructions or history are safe.
+        self.prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=self.instructions),
+            MessagesPlaceholder(variable_name="history"),
+            MessagesPlaceholder(variable_name="context", optional=True),
+            ("human", "{input}")
+        ])
+        self.chain = self.prompt | self.llm
         logger.info(f"Agent {name} initialized with student context")
 
-    def _format_student_context(self, student_profile: Dict) -> str:
+    @staticmethod
+    def _format_student_context(student_profile: Dict) -> str:
         if not student_profile:
             return ""
         
@@ -55,99 +159,118 @@ class AgentWithMemory:
                     context_parts.append(f"- {formatted_key}: {value}")
         return "\n".join(context_parts)
 
-    async def run(self, input_text: str) -> AsyncIterator[str]:
-        """Process the user input and return response as a stream"""
+    async def retrieve(self, input_text: str) -> List[Passage]:
+        """Curriculum passages for the question, or none when retrieval is off for this agent"""
+        retriever = get_retriever()
+        if retriever is None or self.retrieval_subject is None:
+            return []
+        try:
+            with timing.stage("retrieve"):
+                passages = await retriever.retrieve(input_text, subject=self.retrieval_subject)
+        except Exception as e:
+            logger.warning(f"Retrieval failed, answering without passages: {str(e)}")
+            return []
+        logger.info(f"{self.name} retrieved {len(passages)} passages")
+        return passages
+
+    async def _prompt_inputs(self, input_text: str, passages: Optional[List[Passage]] = None) -> Dict[str, Any]:
+        """Variables for the compiled prompt; passages are retrieved here unless given"""
+        if passages is None:
+            passages = await self.retrieve(input_text)
+        context = [SystemMessage(content=(
+            "Curriculum passages that may help with the student's question. "
+            "Use them where relevant and keep to your usual style:\n\n" + format_passages(passages)
+        ))] if passages else []
+        return {
+            "history": self.memory.chat_memory.messages,
+            "context": context,
+            "input": input_text
+        }
+
+    def remember(self, input_text: str, response: str):
+        """Record a finished turn in this agent's memory"""
+        self.memory.chat_memory.add_user_message(input_text)
+        self.memory.chat_memory.add_ai_message(response)
+
+    async def run(self, input_text: str, passages: Optional[List[Passage]] = None, remember: bool = True) -> AsyncIterator[str]:
+        """Process the user input and return response as a stream; remember=False leaves memory to the caller"""
         logger.info(f"{self.name} processing input: {input_text[:50]}...")
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", self.instructions),
-            *[(msg.type, msg.content) for msg in self.memory.chat_memory.messages],
-            ("human", input_text)
-        ])
-        
-        chain = prompt | self.llm
+        inputs = await self._prompt_inputs(input_text, passages)
         
         # Store the complete response for memory
         complete_response = ""
         
         logger.info(f"{self.name} generating response...")
-        async for chunk in chain.astream({"input": input_text}):
-            complete_response += chunk.content
-            yield chunk.content
+        timing.set_agent(self.name)
+        timing.count_llm_call()
+        started = time.perf_counter()
+        first_token = True
+        with timing.stage("generate"):
+            async for chunk in self.chain.astream(inputs):
+                if first_token:
+                    first_token = False
+                    timing.mark("first_token")
+                    timing.record("time_to_first_token", time.perf_counter() - started)
+                complete_response += chunk.content
+                yield chunk.content
         
         # Add messages to memory after complete response
-        self.memory.chat_memory.add_user_message(input_text)
-        self.memory.chat_memory.add_ai_message(complete_response)
+        if remember:
+            self.remember(input_text, complete_response)
         
         logger.info(f"{self.name} completed response generation")
 
 class OrchestratorAgent:
+    # Sub-agent implementation and whether the shared LLM streams tokens
+    agent_class = AgentWithMemory
+    streaming = True
+
     def __init__(self, student_profile: Dict = None):
         logger.info("Initializing OrchestratorAgent")
-        self.llm = ChatGroq(
+        self.llm = get_chat_model(
             model_name="llama-3.3-70b-versatile",
             temperature=0.7,
-            streaming=True
+            streaming=self.streaming
         )
         
         self.student_profile = student_profile or {}
         logger.info(f"Student profile loaded: {json.dumps(self.student_profile, indent=2)}")
         
-        # Define agent descriptions
-        self.agent_descriptions = {
-            "motivation": {
-                "name": "Motivation Agent",
-                "description": """
-                1. Specializes in providing emotional support and encouragement
-                2. Helps students maintain focus and overcome learning challenges
-                3. Offers personalized motivation strategies and positive reinforcement
-                """
-            },
-            "maths_science": {
-                "name": "Maths and Science Tutor Agent",
-                "description": """
-                1. Expert in mathematics, physics, chemistry, and biology concepts
-                2. Provides step-by-step problem-solving guidance
-                3. Uses practical examples and visual explanations
-                """
-            },
-            "language_social": {
-                "name": "Language and Social Studies Agent",
-                "description": """
-                1. Specializes in language arts, history, and social sciences
-                2. Helps with writing, grammar, and literary analysis
-                3. Provides cultural context and historical perspectives
-                """
-            }
-        }
+        self.agent_descriptions = AGENT_DESCRIPTIONS
         
         logger.info("Initializing sub-agents with student profile")
+        # Render the student context once and share it between the sub-agents
+        agent_student_context = self.agent_class._format_student_context(self.student_profile)
+        
         # Initialize sub-agents with student profile
-        self.motivation_agent = AgentWithMemory(
+        self.motivation_agent = self.agent_class(
             name=self.agent_descriptions["motivation"]["name"],
-            instructions=motivation_agent_instructor,
+            instructions=AGENT_INSTRUCTIONS["motivation"],
             student_profile=student_profile,
-            llm=self.llm
+            llm=self.llm,
+            student_context=agent_student_context
         )
         
-        self.maths_science_agent = AgentWithMemory(
+        self.maths_science_agent = self.agent_class(
             name=self.agent_descriptions["maths_science"]["name"],
-            instructions=maths_science_tutor_agent_instructor,
+            instructions=AGENT_INSTRUCTIONS["maths_science"],
             student_profile=student_profile,
-            llm=self.llm
+            llm=self.llm,
+            student_context=agent_student_context,
+            retrieval_subject="maths_science"
         )
         
-        self.language_social_agent = AgentWithMemory(
+        self.language_social_agent = self.agent_class(
             name=self.agent_descriptions["language_social"]["name"],
-            instructions=language_social_studies_agent_instructor,
+            instructions=AGENT_INSTRUCTIONS["language_social"],
             student_profile=student_profile,
-            llm=self.llm
+            llm=self.llm,
+            student_context=agent_student_context,
+            retrieval_subject="language_social"
         )
 
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        # Only the last few selections are read, so no summary is needed
+        self.memory = create_memory(summarize=False)
         
         # Updated selection prompt to include student context
         self.selection_prompt = """You are an agent selector. Your task is to analyze the user's input and select the most appropriate agent to handle their query.
@@ -169,128 +292,380 @@ class OrchestratorAgent:
 
             Consider the student's profile, academic level, and learning style when selecting the most appropriate agent."""
 
+        # Selector prompt with the student profile filled in; only query and history vary per turn
+        selector_student_context = "\n".join([
+            f"{key.replace('_', ' ').title()}: {value}"
+            for key, value in self.student_profile.items()
+            if value
+        ]) if self.student_profile else "No student profile available"
+        self.selection_template = AGENT_SELECTION_PROMPT.replace(
+            "{student_context}",
+            selector_student_context.replace("{", "{{").replace("}", "}}")
+        )
+        
+        self.agents = {
+            "motivation": self.motivation_agent,
+            "maths_science": self.maths_science_agent,
+            "language_social": self.language_social_agent,
+        }
+
         self.current_agent = None
+        self.current_agent_key = None
+        # Synchronizes this session with the shared history store, when there is one
+        self.history = None
+        # Cached answers are only shared between students at a similar level
+        self.cache_bucket = grade_bucket(self.student_profile)
         logger.info("OrchestratorAgent initialization complete")
 
-    async def select_agent(self, user_input: str) -> AgentWithMemory:
-        """Select the appropriate agent based on the user's input using AI"""
+    def _use_agent(self, agent_key: str, user_input: str, reason: str) -> AgentWithMemory:
+        """Make agent_key the current agent and record the selection"""
+        self.current_agent = self.agents[agent_key]
+        self.current_agent_key = agent_key
+        
+        # Add selection to memory
+        self.memory.chat_memory.add_user_message(user_input)
+        self.memory.chat_memory.add_ai_message(f"Selected {self.current_agent.name}: {reason}")
+        
+        return self.current_agent
+
+    def _classify(self, user_input: str) -> RouteDecision:
+        """Run the local intent router for this turn"""
+        with timing.stage("route"):
+            decision = intent_router.classify(user_input)
+        intent_router.record_decision(decision)
+        return decision
+
+    async def select_agent(self, user_input: str, decision: Optional[RouteDecision] = None) -> AgentWithMemory:
+        """Select the appropriate agent, locally when the intent router is confident, otherwise using AI"""
         logger.info("Starting agent selection process")
+        if config.INTENT_ROUTER:
+            decision = decision or self._classify(user_input)
+            if decision.confident:
+                logger.info(
+                    f"Intent router selected {decision.label} "
+                    f"(score {decision.score:.3f}, margin {decision.margin:.3f})"
+                )
+                if random.random() < config.ROUTER_AUDIT_RATE:
+                    task = asyncio.create_task(self._audit_route(user_input, decision.label))
+                    _background_tasks.add(task)
+                    task.add_done_callback(_background_tasks.discard)
+                return self._use_agent(decision.label, user_input, "Matched by local intent router")
+        
         try:
-            agent_desc_text = "\n\n".join([
-                f"{desc['name']}:\n{desc['description']}"
-                for desc in self.agent_descriptions.values()
-            ])
-            
-            # Format student context
-            student_context = "\n".join([
-                f"{key.replace('_', ' ').title()}: {value}"
-                for key, value in self.student_profile.items()
-                if value
-            ]) if self.student_profile else "No student profile available"
-            
-            history = "\n".join([
-                f"{'User' if i%2==0 else 'Assistant'}: {msg.content}"
-                for i, msg in enumerate(self.memory.chat_memory.messages[-4:])
-            ]) if self.memory.chat_memory.messages else "No previous context"
-            
-            # Create a non-streaming version of LLM for agent selection
-            selection_llm = ChatGroq(
-                model_name="llama-3.3-70b-versatile",
-                temperature=0.3,  # Lower temperature for more consistent selection
-                streaming=False
-            )
+            selected_agent, reason = await self._select_with_llm(user_input)
+            if decision is not None:
+                intent_router.record_comparison(decision.label, selected_agent)
+            return self._use_agent(selected_agent, user_input, reason)
             
-            # Simplified and more structured selection prompt
-            selection_prompt = """You are an agent selector. Analyze the user's input and select the most appropriate agent.
+        except Exception as e:
+            logger.error(f"Error in agent selection: {str(e)}")
+            logger.info("Falling back to motivation agent")
+            self.current_agent = self.motivation_agent
+            self.current_agent_key = "motivation"
+            return self.current_agent
 
-                Available agents:
-                1. motivation - For emotional support, encouragement, and motivation
-                2. maths_science - For mathematics, physics, chemistry, and biology
-                3. language_social - For language arts, history, and social sciences
+    async def _route_follow_up(self, user_input: str) -> Tuple[Optional[AgentWithMemory], Optional[RouteDecision]]:
+        """Sticky routing: decide whether a follow-up can stay with the current agent.
 
-                User Query: {query}
-                Previous Context: {history}
-                Student Profile: {student_context}
+        Returns the agent to use when that is settled without an LLM call, or
+        None when the current agent should answer speculatively while the LLM
+        selector double-checks.
+        """
+        decision = self._classify(user_input) if config.INTENT_ROUTER else None
+        if decision is not None and decision.confident:
+            if decision.label != self.current_agent_key:
+                logger.info(f"Topic shift from {self.current_agent_key} to {decision.label}")
+                return await self.select_agent(user_input, decision), decision
+            return self._use_agent(self.current_agent_key, user_input, "Follow-up on the same topic"), decision
+        return None, decision
 
-                Respond with ONLY a JSON object in this exact format:
-                {{"selected_agent": "motivation"|"maths_science"|"language_social", "reason": "brief reason for selection"}}
+    async def _confirm_follow_up(self, user_input: str, selection: asyncio.Task, decision: Optional[RouteDecision], hold: float) -> Optional[AgentWithMemory]:
+        """Wait up to hold seconds for the speculative re-selection; returns the new agent if the sticky guess was wrong"""
+        sticky_key = self.current_agent_key
+        try:
+            selected_agent, reason = await asyncio.wait_for(asyncio.shield(selection), hold)
+        except asyncio.TimeoutError:
+            logger.info("Speculative re-selection too slow, keeping the current agent")
+            self._use_agent(sticky_key, user_input, "Follow-up kept with current agent")
+            return None
+        except Exception as e:
+            logger.warning(f"Speculative re-selection failed: {str(e)}")
+            self._use_agent(sticky_key, user_input, "Follow-up kept with current agent")
+            return None
+        
+        if decision is not None:
+            intent_router.record_comparison(decision.label, selected_agent)
+        if selected_agent == sticky_key:
+            self._use_agent(sticky_key, user_input, reason)
+            return None
+        logger.info(f"Sticky guess {sticky_key} overruled by selector: {selected_agent}")
+        return self._use_agent(selected_agent, user_input, reason)
 
-                Example response:
-                {{"selected_agent": "maths_science", "reason": "Query is about mathematics concepts"}}"""
-            
-            # Format the prompt with all variables
-            formatted_prompt = selection_prompt.format(
-                query=user_input,
-                history=history,
-                student_context=student_context
-            )
-            
-            messages = [
-                {"role": "system", "content": formatted_prompt},
-                {"role": "user", "content": user_input}
-            ]
-            
-            logger.info("Getting agent selection from LLM")
+    def _keep_follow_up(self, user_input: str, selection: asyncio.Task, decision: Optional[RouteDecision]):
+        """The sticky answer started before the selector decided: keep it, and let a late verdict route the next turn"""
+        sticky_key = self.current_agent_key
+        self._use_agent(sticky_key, user_input, "Follow-up kept with current agent")
+        _background_tasks.add(selection)
+        selection.add_done_callback(_background_tasks.discard)
+        selection.add_done_callback(lambda task: self._apply_late_selection(task, decision, sticky_key))
+
+    def _apply_late_selection(self, selection: asyncio.Task, decision: Optional[RouteDecision], sticky_key: str):
+        if selection.cancelled() or selection.exception() is not None:
+            return
+        selected_agent, _ = selection.result()
+        if decision is not None:
+            intent_router.record_comparison(decision.label, selected_agent)
+        if selected_agent != sticky_key and self.current_agent_key == sticky_key:
+            logger.info(f"Selector overruled {sticky_key} after its answer started; {selected_agent} takes the next turn")
+            self.current_agent = self.agents[selected_agent]
+            self.current_agent_key = selected_agent
+
+    async def _audit_route(self, user_input: str, local_label: str):
+        """Ask the LLM selector off the critical path to measure agreement with a local route"""
+        # Not part of the turn's latency or LLM call count
+        timing.current_turn.set(None)
+        try:
+            selected_agent, _ = await self._select_with_llm(user_input)
+            intent_router.record_comparison(local_label, selected_agent)
+        except Exception as e:
+            logger.warning(f"Intent router audit failed: {str(e)}")
+
+    async def _select_with_llm(self, user_input: str) -> Tuple[str, str]:
+        """Ask the LLM which agent should answer; returns the agent key and the reason"""
+        history = "\n".join([
+            f"{'User' if i%2==0 else 'Assistant'}: {msg.content}"
+            for i, msg in enumerate(self.memory.chat_memory.messages[-4:])
+        ]) if self.memory.chat_memory.messages else "No previous context"
+        
+        # Shared non-streaming LLM for agent selection
+        selection_llm = get_chat_model(
+            model_name="llama-3.3-70b-versatile",
+            temperature=0.3,  # Lower temperature for more consistent selection
+            streaming=False
+        )
+        
+        # Fill in the per-turn variables of the pre-rendered prompt
+        formatted_prompt = self.selection_template.format(
+            query=user_input,
+            history=history
+        )
+        
+        messages = [
+            {"role": "system", "content": formatted_prompt},
+            {"role": "user", "content": user_input}
+        ]
+        
+        logger.info("Getting agent selection from LLM")
+        timing.count_llm_call()
+        with timing.stage("select_agent"):
             response = await selection_llm.ainvoke(messages)
+        
+        # Clean and parse response
+        cleaned_response = response.content.strip()
+        logger.info(f"Raw selection response: {cleaned_response}")
+        
+        try:
+            selection = json.loads(cleaned_response)
+            if not isinstance(selection, dict) or 'selected_agent' not in selection:
+                raise ValueError("Invalid response format")
             
-            # Clean and parse response
-            cleaned_response = response.content.strip()
-            logger.info(f"Raw selection response: {cleaned_response}")
+            selected_agent = selection['selected_agent']
+            if selected_agent not in self.agent_descriptions:
+                raise ValueError(f"Invalid agent type: {selected_agent}")
             
-            try:
-                selection = json.loads(cleaned_response)
-                if not isinstance(selection, dict) or 'selected_agent' not in selection:
-                    raise ValueError("Invalid response format")
-                
-                selected_agent = selection['selected_agent']
-                if selected_agent not in self.agent_descriptions:
-                    raise ValueError(f"Invalid agent type: {selected_agent}")
-                
-                logger.info(f"Successfully selected agent: {selected_agent}")
-                logger.info(f"Selection reason: {selection.get('reason', 'No reason provided')}")
-                
-                agent_map = {
-                    "motivation": self.motivation_agent,
-                    "maths_science": self.maths_science_agent,
-                    "language_social": self.language_social_agent,
-                }
-                
-                self.current_agent = agent_map[selected_agent]
-                
-                # Add selection to memory
-                self.memory.chat_memory.add_user_message(user_input)
-                self.memory.chat_memory.add_ai_message(
-                    f"Selected {self.current_agent.name}: {selection.get('reason', 'No reason provided')}"
-                )
-                
-                return self.current_agent
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON response: {str(e)}")
-                raise ValueError("Invalid JSON response from agent selector")
+            logger.info(f"Successfully selected agent: {selected_agent}")
+            logger.info(f"Selection reason: {selection.get('reason', 'No reason provided')}")
             
-        except Exception as e:
-            logger.error(f"Error in agent selection: {str(e)}")
-            logger.info("Falling back to motivation agent")
-            self.current_agent = self.motivation_agent
-            return self.current_agent
+            return selected_agent, selection.get('reason', 'No reason provided')
+            
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse JSON response: {str(e)}")
+            raise ValueError("Invalid JSON response from agent selector")
 
     async def process_query(self, user_input: str) -> AsyncIterator[str]:
         """Process the user query and return response stream"""
         logger.info("Processing user query")
-        selected_agent = await self.select_agent(user_input)
-        logger.info(f"Getting response from {selected_agent.name}")
-        async for chunk in selected_agent.run(user_input):
+        graph = self._start_turn_graph(user_input)
+        try:
+            selected_agent, decision = await graph["select"]
+            if selected_agent is None:
+                async for chunk in self._speculative_follow_up(user_input, decision, graph):
+                    yield chunk
+            else:
+                logger.info(f"Getting response from {selected_agent.name}")
+                async for chunk in self._answer(selected_agent, user_input, graph):
+                    yield chunk
+            logger.info("Query processing complete")
+        finally:
+            graph.cancel()
+
+    def _start_turn_graph(self, user_input: str) -> TurnGraph:
+        """Start every stage of the turn that doesn't depend on which agent answers.
+
+        Agent selection, query embedding and retrieval run concurrently;
+        retrieval fetches passages for every subject in one scan so it need not
+        wait for the selection.
+        """
+        graph = TurnGraph()
+        graph.add("select", self._select_for_turn, user_input)
+        if get_retriever() is not None or semantic_cache is not None:
+            graph.add("embed_query", self._embed_query, user_input)
+            if get_retriever() is not None:
+                graph.add("retrieve", self._retrieve_for_subjects, after=["embed_query"])
+        return graph
+
+    async def _select_for_turn(self, user_input: str) -> Tuple[Optional[AgentWithMemory], Optional[RouteDecision]]:
+        """The agent for this turn, or None when a follow-up should be answered speculatively"""
+        if config.STICKY_ROUTING and self.current_agent is not None:
+            return await self._route_follow_up(user_input)
+        return await self.select_agent(user_input), None
+
+    async def _embed_query(self, user_input: str):
+        with timing.stage("embed_query"):
+            return (await get_embedder().embed([user_input]))[0]
+
+    async def _retrieve_for_subjects(self, query_vector) -> Dict[str, List[Passage]]:
+        subjects = [agent.retrieval_subject for agent in self.agents.values() if agent.retrieval_subject]
+        with timing.stage("retrieve"):
+            return await get_retriever().search_subjects(query_vector, subjects)
+
+    async def _passages_for(self, agent: AgentWithMemory, graph: Optional[TurnGraph]) -> Optional[List[Passage]]:
+        """The selected agent's share of the turn's retrieval (None lets the agent retrieve itself)"""
+        if graph is None:
+            return None
+        if agent.retrieval_subject is None or "retrieve" not in graph.tasks:
+            return []
+        try:
+            passages = (await graph["retrieve"]).get(agent.retrieval_subject, [])
+        except Exception as e:
+            logger.warning(f"Retrieval failed, answering without passages: {str(e)}")
+            return []
+        logger.info(f"{agent.name} retrieved {len(passages)} passages")
+        return passages
+
+    async def _run_agent(self, agent: AgentWithMemory, user_input: str, graph: Optional[TurnGraph], remember: bool = True) -> AsyncIterator[str]:
+        """Start generating as soon as the agent's inputs are ready"""
+        passages = await self._passages_for(agent, graph)
+        if graph is not None:
+            graph.record_critical_path("select", "retrieve", then=["generate"])
+        async for chunk in agent.run(user_input, passages, remember=remember):
             yield chunk
-        logger.info("Query processing complete")
 
-async def process_user_query(user_input: str) -> AsyncIterator[str]:
+    async def _cache_lookup(self, user_input: str, graph: Optional[TurnGraph] = None) -> Optional[CacheLookup]:
+        """Look the question up in the current agent's semantic cache namespace, when caching applies"""
+        if semantic_cache is None or len(user_input.strip()) < config.SEMANTIC_CACHE_MIN_CHARS:
+            return None
+        vector = await graph["embed_query"] if graph is not None and "embed_query" in graph.tasks else None
+        with timing.stage("semantic_cache"):
+            lookup = await semantic_cache.lookup(f"{self.current_agent_key}:{self.cache_bucket}", user_input, vector)
+        if lookup.answer is not None:
+            logger.info(f"Semantic cache hit in {lookup.namespace} (similarity {lookup.similarity:.3f})")
+            timing.mark("semantic_cache_hit")
+        return lookup
+
+    def _remember_cached(self, agent: AgentWithMemory, user_input: str, answer: str):
+        timing.set_agent(agent.name)
+        # The agent did not generate the answer, but follow-ups should still see it
+        agent.remember(user_input, answer)
+
+    def _cache_answer(self, lookup: Optional[CacheLookup], answer: str):
+        """Store a freshly generated answer unless it is personal to this student"""
+        if lookup is None or not answer.strip():
+            return
+        name = str(self.student_profile.get("name") or "").strip()
+        if name and name.lower() in answer.lower():
+            return
+        semantic_cache.store(lookup, answer)
+
+    async def _answer(self, agent: AgentWithMemory, user_input: str, graph: Optional[TurnGraph] = None) -> AsyncIterator[str]:
+        """Stream the agent's answer, from the semantic cache when a near-duplicate was answered before"""
+        lookup = await self._cache_lookup(user_input, graph)
+        if lookup is not None and lookup.answer is not None:
+            self._remember_cached(agent, user_input, lookup.answer)
+            for piece in re.findall(r"\S+\s*", lookup.answer):
+                yield piece
+            return
+        
+        parts = []
+        async for chunk in self._run_agent(agent, user_input, graph):
+            parts.append(chunk)
+            yield chunk
+        self._cache_answer(lookup, "".join(parts))
+
+    async def _speculative_follow_up(self, user_input: str, decision: Optional[RouteDecision], graph: Optional[TurnGraph] = None) -> AsyncIterator[str]:
+        """Stream the current agent's answer while the LLM selector re-checks the route.
+
+        With STICKY_HOLD_SECONDS set, tokens are held back until the selector
+        agrees (or the hold runs out), so an overruled answer never reaches the
+        client. Otherwise tokens stream as soon as they arrive: a selector that
+        disagrees before the first token replaces the answer, one that disagrees
+        later only moves the next turn. The sticky answer is written to memory
+        only once it is the turn's answer.
+        """
+        sticky_agent = self.current_agent
+        logger.info(f"Answering follow-up speculatively with {sticky_agent.name}")
+        selection = asyncio.create_task(self._select_with_llm(user_input))
+        stream = self._run_agent(sticky_agent, user_input, graph, remember=False)
+        queue: asyncio.Queue = asyncio.Queue()
+        pump = asyncio.create_task(_pump(stream, queue))
+        head = []
+        try:
+            if config.STICKY_HOLD_SECONDS > 0:
+                replacement = await self._confirm_follow_up(user_input, selection, decision, config.STICKY_HOLD_SECONDS)
+            else:
+                first = asyncio.ensure_future(queue.get())
+                await asyncio.wait({selection, first}, return_when=asyncio.FIRST_COMPLETED)
+                if first.done():
+                    head.append(first.result())
+                else:
+                    first.cancel()
+                if selection.done():
+                    # Nothing has been sent yet, so the selector can still switch agents
+                    replacement = await self._confirm_follow_up(user_input, selection, decision, 0)
+                else:
+                    replacement = None
+                    self._keep_follow_up(user_input, selection, decision)
+            if replacement is not None:
+                pump.cancel()
+                await asyncio.gather(pump, return_exceptions=True)
+                async for chunk in self._run_agent(replacement, user_input, graph):
+                    yield chunk
+                return
+            
+            parts = []
+            while True:
+                item = head.pop() if head else await queue.get()
+                if item is _END_OF_STREAM:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                parts.append(item)
+                yield item
+            sticky_agent.remember(user_input, "".join(parts))
+        finally:
+            if selection not in _background_tasks:
+                selection.cancel()
+            pump.cancel()
+
+# One orchestrator per session so agents and their memory survive between turns
+sessions = SessionRegistry(OrchestratorAgent, config.SESSION_MAX, config.SESSION_TTL)
+
+# Conversation state shared between workers; the registry above then acts as a local cache
+history_store = create_history_store()
+
+async def process_user_query(user_input: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
     """Main function to process user queries"""
-    orchestrator = OrchestratorAgent()
+    orchestrator = sessions.get(session_id) if session_id else OrchestratorAgent()
+    history = session_history(history_store, orchestrator, session_id)
+    if history is not None:
+        await history.refresh()
     async for chunk in orchestrator.process_query(user_input):
         yield chunk
+    if history is not None:
+        await history.save()
 
 async def main():
+    session_id = "cli"
     while True:
         try:
             user_query = input("\nEnter your query (or 'exit' to quit): ")
@@ -299,7 +674,7 @@ async def main():
                 break
                 
             print("\nProcessing...")
-            async for chunk in process_user_query(user_query):
+            async for chunk in process_user_query(user_query, session_id):
                 print(chunk, end="", flush=True)
             print("\n")
             
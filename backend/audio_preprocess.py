@@ -0,0 +1,213 @@
+import asyncio
+import io
+import logging
+import shutil
+import wave
+from typing import Dict, NamedTuple, Optional, Tuple
+import numpy as np
+import config
+
+logger = logging.getLogger(__name__)
+
+# Rate the VAD analyses at, and the rate uploads are resampled to when STT_RESAMPLE is on
+ANALYSIS_SAMPLE_RATE = 16000
+
+FFMPEG = shutil.which("ffmpeg")
+
+class PreparedAudio(NamedTuple):
+    """A clip ready for transcription, with what preprocessing saved"""
+    audio: bytes
+    filename: str
+    has_speech: bool
+    original_bytes: int
+    original_seconds: float
+    sent_bytes: int
+    sent_seconds: float
+
+    def as_file(self) -> io.BytesIO:
+        audio_file = io.BytesIO(self.audio)
+        audio_file.name = self.filename
+        return audio_file
+
+    def savings(self) -> Dict[str, float]:
+        return {
+            "bytes_saved": self.original_bytes - self.sent_bytes,
+            "seconds_saved": round(self.original_seconds - self.sent_seconds, 3)
+        }
+
+class PreprocessStats:
+    """Totals over every clip that went through preprocessing"""
+
+    def __init__(self):
+        self.clips = 0
+        self.dropped = 0
+        self.passed_through = 0
+        self.bytes_saved = 0
+        self.seconds_saved = 0.0
+
+    def record(self, prepared: PreparedAudio):
+        self.clips += 1
+        if not prepared.has_speech:
+            self.dropped += 1
+        self.bytes_saved += prepared.original_bytes - prepared.sent_bytes
+        self.seconds_saved += prepared.original_seconds - prepared.sent_seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "clips": self.clips,
+            "dropped_no_speech": self.dropped,
+            "passed_through": self.passed_through,
+            "bytes_saved": self.bytes_saved,
+            "seconds_saved": round(self.seconds_saved, 1)
+        }
+
+preprocess_stats = PreprocessStats()
+
+def _resample(pcm: np.ndarray, rate: int, target: int) -> np.ndarray:
+    """Linear-interpolation resample (plenty for speech recognition)"""
+    if rate == target or len(pcm) == 0:
+        return pcm
+    positions = np.arange(int(len(pcm) * target / rate)) * (rate / target)
+    return np.interp(positions, np.arange(len(pcm)), pcm).astype(np.float32)
+
+def _read_wav(data: bytes) -> Optional[Tuple[np.ndarray, int]]:
+    """Decode 16-bit PCM WAV to (samples x channels int16, sample rate)"""
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            if wav.getsampwidth() != 2:
+                return None
+            frames = wav.readframes(wav.getnframes())
+            samples = np.frombuffer(frames, dtype="<i2").reshape(-1, wav.getnchannels())
+            return samples, wav.getframerate()
+    except (wave.Error, EOFError):
+        return None
+
+def _write_wav(samples: np.ndarray, rate: int) -> bytes:
+    """Encode int16 samples (samples, or samples x channels) as WAV"""
+    output = io.BytesIO()
+    with wave.open(output, "wb") as wav:
+        wav.setnchannels(1 if samples.ndim == 1 else samples.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+    return output.getvalue()
+
+async def _ffmpeg(args, data: bytes) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", *args, "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        output, errors = await process.communicate(data)
+    except asyncio.CancelledError:
+        # The turn was interrupted; don't leave ffmpeg running
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {errors.decode(errors='replace').strip()}")
+    return output
+
+def speech_frames(pcm: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Per-frame speech flags from short-time energy and zero-crossing rate.
+
+    Frames well above the clip's noise floor count as speech when they also
+    have a low zero-crossing rate (voiced sounds). Very loud frames count
+    regardless, so fricatives such as "s" and "f" are kept. The noise floor is
+    capped at VAD_NOISE_FLOOR_DB, so a clip that is speech almost throughout
+    (trimmed by the client) doesn't count its own speech as noise, and a clip
+    with little energy contrast is all speech if it is above VAD_MIN_ENERGY_DB.
+    """
+    frame = int(sample_rate * config.VAD_FRAME_MS / 1000)
+    count = len(pcm) // frame
+    if count == 0:
+        return np.zeros(0, dtype=bool)
+    frames = pcm[:count * frame].reshape(count, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame
+    quiet, loud = np.percentile(energy_db, [10, 90])
+    if loud - quiet < config.VAD_ENERGY_MARGIN_DB:
+        # No pauses to tell noise from speech; when unsure, keep the audio
+        return energy_db > config.VAD_MIN_ENERGY_DB
+    noise_floor = min(quiet, config.VAD_NOISE_FLOOR_DB)
+    threshold = max(noise_floor + config.VAD_ENERGY_MARGIN_DB, config.VAD_MIN_ENERGY_DB)
+    return (energy_db > threshold) & ((zcr < config.VAD_MAX_ZCR) | (energy_db > threshold + 6))
+
+def speech_bounds(pcm: np.ndarray, sample_rate: int) -> Optional[Tuple[int, int]]:
+    """Sample range from the first to the last speech frame plus padding, or None without speech"""
+    flags = speech_frames(pcm, sample_rate)
+    frame = int(sample_rate * config.VAD_FRAME_MS / 1000)
+    if np.count_nonzero(flags) * config.VAD_FRAME_MS < config.VAD_MIN_SPEECH_MS:
+        return None
+    speech = np.flatnonzero(flags)
+    padding = int(sample_rate * config.VAD_PADDING_MS / 1000)
+    start = max(speech[0] * frame - padding, 0)
+    end = min((speech[-1] + 1) * frame + padding, len(pcm))
+    return int(start), int(end)
+
+async def prepare_for_transcription(data: bytes, filename: str = "audio.webm") -> PreparedAudio:
+    """Trim silence from a clip and flag clips without speech.
+
+    WAV is decoded directly; other containers need ffmpeg on the PATH. Clips
+    that cannot be decoded are passed through untouched. With STT_RESAMPLE the
+    trimmed audio is also downmixed and resampled to 16 kHz mono.
+    """
+    prepared = await _prepare(data, filename)
+    preprocess_stats.record(prepared)
+    return prepared
+
+async def _prepare(data: bytes, filename: str) -> PreparedAudio:
+    original = len(data)
+    wav = _read_wav(data) if filename.endswith(".wav") or data[:4] == b"RIFF" else None
+
+    def unchanged(seconds: float = 0.0) -> PreparedAudio:
+        preprocess_stats.passed_through += 1
+        return PreparedAudio(data, filename, True, original, seconds, original, seconds)
+
+    if wav is not None:
+        samples, rate = wav
+        pcm = _resample(samples.mean(axis=1) / 32768.0, rate, ANALYSIS_SAMPLE_RATE)
+    elif FFMPEG is not None:
+        try:
+            raw = await _ffmpeg(["-ac", "1", "-ar", str(ANALYSIS_SAMPLE_RATE), "-f", "s16le"], data)
+        except RuntimeError as e:
+            logger.warning(f"Could not decode {filename} for VAD: {str(e)}")
+            return unchanged()
+        pcm = np.frombuffer(raw, dtype="<i2") / 32768.0
+    else:
+        return unchanged()
+
+    seconds = len(pcm) / ANALYSIS_SAMPLE_RATE
+    bounds = speech_bounds(pcm, ANALYSIS_SAMPLE_RATE)
+    if bounds is None:
+        return PreparedAudio(b"", filename, False, original, seconds, 0, 0.0)
+
+    start, end = bounds
+    sent_seconds = (end - start) / ANALYSIS_SAMPLE_RATE
+    # Re-encoding is only worth it when it removes more than the padding it keeps
+    trimmed = seconds - sent_seconds >= config.VAD_PADDING_MS / 1000
+    if wav is not None:
+        samples, rate = wav
+        if config.STT_RESAMPLE and (rate != ANALYSIS_SAMPLE_RATE or samples.shape[1] > 1):
+            audio = _write_wav(np.round(pcm[start:end] * 32767), ANALYSIS_SAMPLE_RATE)
+        elif trimmed:
+            scale = rate / ANALYSIS_SAMPLE_RATE
+            audio = _write_wav(samples[int(start * scale):int(end * scale)], rate)
+        else:
+            return unchanged(seconds)
+        return PreparedAudio(audio, "audio.wav", True, original, seconds, len(audio), sent_seconds)
+
+    if not trimmed:
+        return unchanged(seconds)
+    args = ["-ss", f"{start / ANALYSIS_SAMPLE_RATE:.3f}", "-to", f"{end / ANALYSIS_SAMPLE_RATE:.3f}"]
+    if config.STT_RESAMPLE:
+        args += ["-ac", "1", "-ar", str(ANALYSIS_SAMPLE_RATE)]
+    try:
+        audio = await _ffmpeg(args + ["-c:a", "libopus", "-b:a", "24k", "-f", "ogg"], data)
+    except RuntimeError as e:
+        logger.warning(f"Could not re-encode trimmed {filename}: {str(e)}")
+        return unchanged(seconds)
+    return PreparedAudio(audio, "audio.ogg", True, original, seconds, len(audio), sent_seconds)
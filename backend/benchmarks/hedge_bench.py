@@ -0,0 +1,204 @@
+"""Hedged LLM calls and circuit breakers against mock providers with injected latency.
+
+Two in-process mock chat models stand in for the providers: a fast one with
+occasional latency spikes (preferred) and a slightly slower, steady one
+(alternate). Each scenario drives many calls through HedgedChatModel and
+checks what callers see:
+
+  tail      time to first token with and without hedging (streamed and not)
+  outage    the preferred provider errors: calls fail over, its breaker opens
+  slowdown  its first token takes longer than LLM_BREAKER_SLOW_SECONDS: breaker opens
+  recovery  after the cooldown a trial call closes the breaker again
+
+    python benchmarks/hedge_bench.py --calls 400 --concurrency 16
+    python benchmarks/hedge_bench.py --spike-rate 0.1 --spike-latency 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+import config
+from llm_routing import HedgedChatModel, ProviderHealth, ProviderRoute
+
+ANSWER = "A fraction is a part of a whole, like three quarters of a pizza."
+
+class MockProvider(BaseChatModel):
+    """Chat model that answers after an injected delay, sometimes much longer, sometimes failing"""
+
+    latency: float
+    jitter: float = 0.1
+    spike_rate: float = 0.0
+    spike_latency: float = 0.0
+    error_rate: float = 0.0
+    token_delay: float = 0.002
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    async def _wait_for_first_token(self):
+        if random.random() < self.error_rate:
+            await asyncio.sleep(self.latency / 4)
+            raise RuntimeError("503 Service Unavailable")
+        spike = random.random() < self.spike_rate
+        await asyncio.sleep(self.spike_latency if spike else self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        yield ChatGenerationChunk(message=AIMessageChunk(content=""))
+        await self._wait_for_first_token()
+        for word in ANSWER.split(" "):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            await asyncio.sleep(self.token_delay)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await self._wait_for_first_token()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=ANSWER))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+def hedged(preferred: MockProvider, alternate: MockProvider, hedging: bool = True, streaming: bool = True) -> HedgedChatModel:
+    # Fresh health per scenario, so breakers and counters don't carry over
+    routes = [
+        ProviderRoute("preferred", preferred, ProviderHealth("preferred")),
+        ProviderRoute("alternate", alternate, ProviderHealth("alternate"))
+    ]
+    return HedgedChatModel(routes=routes, streaming=streaming, hedging=hedging)
+
+async def call(model: HedgedChatModel, streaming: bool) -> float:
+    """Seconds to the first token (or the whole answer without streaming)"""
+    messages = [HumanMessage(content="What is a fraction?")]
+    started = time.perf_counter()
+    if not streaming:
+        answer = (await model.ainvoke(messages)).content
+        assert answer == ANSWER
+        return time.perf_counter() - started
+    first, text = None, ""
+    async for chunk in model.astream(messages):
+        if chunk.content and first is None:
+            first = time.perf_counter() - started
+        text += chunk.content
+    assert text.strip() == ANSWER, f"garbled answer {text!r}"
+    return first
+
+async def drive(model: HedgedChatModel, calls: int, concurrency: int, streaming: bool = True) -> List[Optional[float]]:
+    """Latency of every call, None for calls that raised"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            try:
+                return await call(model, streaming)
+            except Exception:
+                return None
+
+    return await asyncio.gather(*[one() for _ in range(calls)])
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def summary(samples) -> str:
+    return (f"p50 {statistics.median(samples):.3f}s p95 {percentile(samples, 0.95):.3f}s "
+            f"p99 {percentile(samples, 0.99):.3f}s max {max(samples):.3f}s")
+
+def health(model: HedgedChatModel) -> str:
+    return ", ".join(f"{route.name} {route.health.as_dict()}" for route in model.routes)
+
+async def tail(args):
+    print("\n== tail: preferred spikes, alternate steady")
+    for streaming in (True, False):
+        results = {}
+        for hedging in (False, True):
+            model = hedged(
+                MockProvider(latency=args.latency, spike_rate=args.spike_rate, spike_latency=args.spike_latency),
+                MockProvider(latency=args.latency * 1.3),
+                hedging=hedging,
+                streaming=streaming
+            )
+            latencies = await drive(model, args.calls, args.concurrency, streaming)
+            assert None not in latencies, "a call failed"
+            preferred = model.routes[0].health
+            extra = model.routes[1].health.requests / preferred.requests
+            results[hedging] = latencies
+            label = f"{'streamed' if streaming else 'invoke'}, {'hedged' if hedging else 'unhedged'}"
+            print(f"  {label:<19} {summary(latencies)}  extra requests {extra:.1%}, "
+                  f"hedge wins {model.routes[1].health.hedge_wins}, deadline {model.routes[0].hedge_delay():.3f}s")
+        assert percentile(results[True], 0.99) < percentile(results[False], 0.99), "hedging did not cut the p99"
+
+async def outage(args):
+    print("\n== outage: preferred fails every call")
+    model = hedged(MockProvider(latency=args.latency, error_rate=1.0), MockProvider(latency=args.latency * 1.3))
+    latencies = await drive(model, args.calls // 4, args.concurrency)
+    preferred = model.routes[0].health
+    print(f"  {summary([l for l in latencies if l is not None])}, failed calls {latencies.count(None)}")
+    print(f"  {health(model)}")
+    assert None not in latencies, "failover should hide the provider's errors"
+    assert preferred.breaker.trips >= 1 and preferred.breaker.state == "open"
+    # Only the calls in flight before the breaker opened reached the failing provider
+    assert preferred.requests <= config.LLM_BREAKER_MIN_CALLS + args.concurrency
+
+async def slowdown(args):
+    print("\n== slowdown: preferred's first token slower than LLM_BREAKER_SLOW_SECONDS")
+    model = hedged(
+        MockProvider(latency=config.LLM_BREAKER_SLOW_SECONDS * 1.5, jitter=0),
+        MockProvider(latency=args.latency * 1.3)
+    )
+    latencies = await drive(model, args.calls // 4, args.concurrency)
+    preferred = model.routes[0].health
+    print(f"  {summary(latencies)}")
+    print(f"  {health(model)}")
+    assert preferred.breaker.state == "open", "latency spike should open the breaker"
+    assert percentile(latencies, 0.5) < config.LLM_BREAKER_SLOW_SECONDS
+
+async def recovery(args):
+    print("\n== recovery: preferred fails, then heals; breaker closes after the cooldown")
+    preferred = MockProvider(latency=args.latency, error_rate=1.0)
+    model = hedged(preferred, MockProvider(latency=args.latency * 1.3))
+    await drive(model, args.calls // 8, args.concurrency)
+    breaker = model.routes[0].health.breaker
+    assert breaker.state == "open"
+    preferred.error_rate = 0.0
+    await asyncio.sleep(config.LLM_BREAKER_COOLDOWN)
+    await drive(model, 1, 1)
+    print(f"  after cooldown and one trial call: {breaker.state}")
+    assert breaker.state == "closed"
+    latencies = await drive(model, args.calls // 8, args.concurrency)
+    print(f"  {summary(latencies)}; {health(model)}")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.2, help="preferred provider's usual first-token latency")
+    parser.add_argument("--spike-rate", type=float, default=0.04)
+    parser.add_argument("--spike-latency", type=float, default=2.0)
+    parser.add_argument("--scenarios", default="tail,outage,slowdown,recovery")
+    args = parser.parse_args()
+
+    # Failovers are expected here; keep their warnings out of the report
+    logging.getLogger("llm_routing").setLevel(logging.ERROR)
+    # Scaled down so the scenarios finish in seconds
+    config.LLM_BREAKER_SLOW_SECONDS = 1.0
+    config.LLM_BREAKER_COOLDOWN = 1.0
+    config.LLM_HEDGE_INITIAL_DELAY = 1.0
+    config.LLM_HEDGE_MIN_SAMPLES = 20
+    random.seed(7)
+    scenarios = {"tail": tail, "outage": outage, "slowdown": slowdown, "recovery": recovery}
+    for name in args.scenarios.split(","):
+        await scenarios[name](args)
+    print("\nall checks passed")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""Shared conversation history: cross-worker consistency and per-turn overhead.
+
+Two stand-in orchestrators play two workers serving the same session through
+one history store, alternating turns, and every turn checks that the worker
+sees all earlier messages. Then the per-turn cost of refresh (local copy
+current, or reload after another worker's save) and save is measured.
+
+Runs against the in-process stand-in by default, or a Redis server:
+
+    python benchmarks/history_bench.py --turns 200
+    python benchmarks/history_bench.py --redis-url redis://localhost:6379/15
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import InProcessHistoryStore, RedisHistoryStore, SessionHistory, stored_messages
+from memory import BoundedConversationMemory
+
+AGENT_KEYS = ["motivation", "maths_science", "language_social"]
+
+def worker():
+    """Just the parts of an OrchestratorAgent that SessionHistory touches"""
+    def memory():
+        return BoundedConversationMemory(token_budget=100_000, max_messages=40)
+    return SimpleNamespace(
+        memory=memory(),
+        agents={key: SimpleNamespace(memory=memory()) for key in AGENT_KEYS},
+        current_agent=None,
+        current_agent_key=None,
+        history=None
+    )
+
+def run_turn(orchestrator, turn: int):
+    key = AGENT_KEYS[turn % 2 + 1]
+    orchestrator.current_agent_key, orchestrator.current_agent = key, orchestrator.agents[key]
+    orchestrator.memory.add_user_message(f"question {turn}")
+    orchestrator.memory.add_ai_message(f"Selected {key}")
+    orchestrator.agents[key].memory.add_user_message(f"question {turn}")
+    orchestrator.agents[key].memory.add_ai_message(f"answer {turn} " + "words " * 60)
+
+def ms(samples) -> str:
+    return f"p50 {statistics.median(samples) * 1000:.3f} ms, max {max(samples) * 1000:.3f} ms"
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--max-messages", type=int, default=40)
+    parser.add_argument("--redis-url", help="use this Redis server instead of the in-process store")
+    args = parser.parse_args()
+
+    if args.redis_url:
+        import redis.asyncio as redis
+        store = RedisHistoryStore(redis.from_url(args.redis_url, decode_responses=True), args.max_messages, 300)
+    else:
+        store = InProcessHistoryStore(args.max_messages, 300)
+    session_id = f"bench:{uuid.uuid4().hex}"
+    workers = [worker(), worker()]
+    histories = [SessionHistory(store, session_id, w) for w in workers]
+
+    # Alternate workers every turn: each refresh has to reload what the other saved
+    reloads, saves = [], []
+    for turn in range(args.turns):
+        orchestrator, history = workers[turn % 2], histories[turn % 2]
+        started = time.perf_counter()
+        await history.refresh()
+        reloads.append(time.perf_counter() - started)
+        seen = [m.content for m in stored_messages(orchestrator.memory) if m.type == "human"]
+        expected = [f"question {t}" for t in range(turn)][-(args.max_messages // 2):]
+        assert seen == expected, f"worker {turn % 2} missed history at turn {turn}"
+        run_turn(orchestrator, turn)
+        started = time.perf_counter()
+        await history.save()
+        saves.append(time.perf_counter() - started)
+
+    # Same worker every turn: the local copy stays current
+    hits = []
+    for turn in range(args.turns, 2 * args.turns):
+        started = time.perf_counter()
+        await histories[0].refresh()
+        hits.append(time.perf_counter() - started)
+        run_turn(workers[0], turn)
+        await histories[0].save()
+    await store.delete(session_id)
+
+    print(f"store: {'redis ' + args.redis_url if args.redis_url else 'in-process'}, {args.turns} turns per phase")
+    print("consistency: every turn saw the other worker's messages")
+    print(f"refresh, local copy current:  {ms(hits)}")
+    print(f"refresh, reload from store:   {ms(reloads)}")
+    print(f"save (one pipelined write):   {ms(saves)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""Local stand-in for the OpenAI and Groq endpoints used by the backend.
+
+Every endpoint sleeps for MOCK_LATENCY seconds before answering, so the load
+test can tell whether requests from different websockets overlap; the
+transcription, chat and speech endpoints can be given their own latency with
+MOCK_STT_LATENCY, MOCK_CHAT_LATENCY and MOCK_TTS_LATENCY. Streamed chat
+completions then emit one word every MOCK_TOKEN_DELAY seconds.
+
+Groq's chat completions are served under /openai/v1, so pointing both
+OPENAI_BASE_URL=http://host:port/v1 and GROQ_API_BASE=http://host:port at it
+covers the agent selector and the agents.
+
+    MOCK_LATENCY=0.5 uvicorn mock_openai:app --port 9100
+"""
+import asyncio
+import json
+import os
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+
+LATENCY = float(os.environ.get("MOCK_LATENCY", "0.5"))
+STT_LATENCY = float(os.environ.get("MOCK_STT_LATENCY", LATENCY))
+CHAT_LATENCY = float(os.environ.get("MOCK_CHAT_LATENCY", LATENCY))
+TTS_LATENCY = float(os.environ.get("MOCK_TTS_LATENCY", LATENCY))
+TOKEN_DELAY = float(os.environ.get("MOCK_TOKEN_DELAY", "0.02"))
+
+ANSWER = (
+    "Sure! A fraction is a part of a whole. "
+    "The number on top is the numerator and the one below is the denominator. "
+    "Want to try one together?"
+)
+
+# Short silent MP3 frame, enough for clients that sniff the payload
+FAKE_MP3 = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+app = FastAPI()
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    await request.body()
+    await asyncio.sleep(STT_LATENCY)
+    return PlainTextResponse("Can you help me with fractions?")
+
+async def stream_answer(model: str):
+    words = ANSWER.split(" ")
+    for i, word in enumerate(words):
+        chunk = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "delta": {"content": word if i == 0 else " " + word},
+                "finish_reason": None
+            }]
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(TOKEN_DELAY)
+    yield "data: [DONE]\n\n"
+
+SELECTION = json.dumps({"selected_agent": "maths_science", "reason": "Query is about mathematics concepts"})
+
+@app.post("/v1/chat/completions")
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(CHAT_LATENCY)
+    if body.get("stream"):
+        return StreamingResponse(stream_answer(body.get("model", "mock")), media_type="text/event-stream")
+    system = " ".join(m.get("content") or "" for m in body.get("messages", []) if m.get("role") == "system")
+    content = SELECTION if "agent selector" in system else ANSWER
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    }
+
+@app.post("/v1/audio/speech")
+async def speech(request: Request):
+    body = await request.json()
+    await asyncio.sleep(TTS_LATENCY)
+    if body.get("response_format") == "pcm":
+        # Silence as long as the sentence would take to say (~15 characters a second, 24 kHz)
+        return Response(content=bytes(2 * 24000 * len(body.get("input", "")) // 15), media_type="audio/pcm")
+    return Response(content=FAKE_MP3, media_type="audio/mpeg")
@@ -0,0 +1,85 @@
+"""Per-turn prompt construction cost, before and after precompiling prompts.
+
+"before" rebuilds the agent prompt with ChatPromptTemplate.from_messages and
+re-renders the selector prompt with the student profile on every turn, as the
+agents used to. "after" uses the templates an OrchestratorAgent compiles once
+per session. No LLM is called.
+
+    python benchmarks/prompt_bench.py --history 20
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.prompts import ChatPromptTemplate
+from agents import AGENT_DESCRIPTIONS, AGENT_INSTRUCTIONS, AGENT_SELECTION_PROMPT, OrchestratorAgent
+
+STUDENT_PROFILE = {
+    "name": "Asha",
+    "grade": "8",
+    "curriculum": "CBSE",
+    "learning_style": "visual",
+    "favourite_subjects": ["science", "history"],
+}
+
+def before(agent, orchestrator, history, user_input: str):
+    # Agent prompt, rebuilt from scratch (student context re-formatted per agent)
+    student_context = agent._format_student_context(STUDENT_PROFILE)
+    instructions = f"{AGENT_INSTRUCTIONS['maths_science']}\n\nStudent Context:\n{student_context}"
+    ChatPromptTemplate.from_messages([
+        ("system", instructions),
+        *[(msg.type, msg.content) for msg in history],
+        ("human", user_input)
+    ]).invoke({"input": user_input})
+
+    # Selector prompt
+    "\n\n".join([f"{desc['name']}:\n{desc['description']}" for desc in AGENT_DESCRIPTIONS.values()])
+    selector_context = "\n".join([
+        f"{key.replace('_', ' ').title()}: {value}" for key, value in STUDENT_PROFILE.items() if value
+    ])
+    history_text = "\n".join([
+        f"{'User' if i % 2 == 0 else 'Assistant'}: {msg.content}" for i, msg in enumerate(history[-4:])
+    ])
+    AGENT_SELECTION_PROMPT.format(query=user_input, history=history_text, student_context=selector_context)
+
+def after(agent, orchestrator, history, user_input: str):
+    agent.prompt.invoke({"history": history, "input": user_input})
+    history_text = "\n".join([
+        f"{'User' if i % 2 == 0 else 'Assistant'}: {msg.content}" for i, msg in enumerate(history[-4:])
+    ])
+    orchestrator.selection_template.format(query=user_input, history=history_text)
+
+def measure(fn, agent, orchestrator, history, rounds: int) -> float:
+    user_input = "Can you explain how refraction works in a prism?"
+    for _ in range(10):
+        fn(agent, orchestrator, history, user_input)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(agent, orchestrator, history, user_input)
+    return (time.perf_counter() - start) / rounds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, default=20, help="messages already in memory")
+    parser.add_argument("--rounds", type=int, default=500)
+    args = parser.parse_args()
+
+    orchestrator = OrchestratorAgent(STUDENT_PROFILE)
+    agent = orchestrator.maths_science_agent
+    for i in range(args.history // 2):
+        agent.memory.chat_memory.add_user_message(f"Question {i} about light and lenses?")
+        agent.memory.chat_memory.add_ai_message(f"Answer {i}: light bends when it changes medium. " * 5)
+    history = agent.memory.chat_memory.messages
+
+    old = measure(before, agent, orchestrator, history, args.rounds)
+    new = measure(after, agent, orchestrator, history, args.rounds)
+    print(f"history messages: {len(history)}")
+    print(f"before:           {old * 1e6:.1f} us per turn")
+    print(f"after:            {new * 1e6:.1f} us per turn")
+    print(f"speedup:          {old / new:.1f}x")
+
+if __name__ == "__main__":
+    main()
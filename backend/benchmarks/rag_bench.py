@@ -0,0 +1,107 @@
+"""Retrieval latency against corpus size for the memory-mapped passage index.
+
+Indexes of each size are built in a temporary directory from random unit
+vectors (so building 100k passages takes seconds), then queried through the
+same search path the agents use. Query embedding with the local hashing
+embedder and batched ingestion throughput are measured separately.
+
+    python benchmarks/rag_bench.py --sizes 1000,10000,100000 --queries 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from embeddings import HashingEmbedder
+from rag import PassageIndex, build_index
+
+QUERY = "why does light bend when it goes from air into water"
+
+class RandomEmbedder:
+    """Random unit vectors: stands in for a real embedder when only search cost matters"""
+
+    def __init__(self, dim: int, seed: int = 0):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+
+    async def embed(self, texts):
+        vectors = self.rng.standard_normal((len(texts), self.dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def passages(count: int):
+    subjects = ["maths_science", "language_social", None]
+    return [
+        {"text": f"Passage {i} about topic {i % 97} with some curriculum text.", "source": f"doc{i // 50}.md", "subject": subjects[i % 3]}
+        for i in range(count)
+    ]
+
+async def bench_search(size: int, dim: int, queries: int, k: int, directory: str):
+    started = time.perf_counter()
+    await build_index(directory, passages(size), RandomEmbedder(dim), batch_size=4096)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = PassageIndex(directory)
+    open_ms = (time.perf_counter() - started) * 1000
+    query_vectors = await RandomEmbedder(dim, seed=1).embed(["q"] * queries)
+    # Fault the pages in once so every size is measured warm
+    index.search(query_vectors[0], k)
+
+    results = {}
+    for label, subject in (("all", None), ("subject", "maths_science")):
+        samples = []
+        for vector in query_vectors:
+            started = time.perf_counter()
+            index.search(vector, k, subject=subject)
+            samples.append((time.perf_counter() - started) * 1000)
+        results[label] = samples
+    index.close()
+
+    print(
+        f"{size:>9} {build_seconds:>8.2f}s {open_ms:>8.2f} "
+        f"{statistics.median(results['all']):>9.3f} {percentile(results['all'], 0.95):>9.3f} "
+        f"{statistics.median(results['subject']):>9.3f} {percentile(results['subject'], 0.95):>9.3f}"
+    )
+
+async def bench_embedding(dim: int):
+    embedder = HashingEmbedder(dim)
+    rounds = 500
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await embedder.embed([QUERY])
+    query_ms = (time.perf_counter() - started) / rounds * 1000
+
+    texts = [p["text"] * 10 for p in passages(2000)]
+    started = time.perf_counter()
+    for start in range(0, len(texts), 64):
+        await embedder.embed(texts[start:start + 64])
+    rate = len(texts) / (time.perf_counter() - started)
+    print(f"hashing embedder: {query_ms:.3f} ms per query, {rate:.0f} passages/s at ingestion")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    await bench_embedding(args.dim)
+    print(f"\nsearch latency in ms, top-{args.k}, dim {args.dim}")
+    print(f"{'passages':>9} {'build':>9} {'open':>8} {'p50':>9} {'p95':>9} {'p50 subj':>9} {'p95 subj':>9}")
+    with tempfile.TemporaryDirectory() as root:
+        for size in (int(s) for s in args.sizes.split(",")):
+            await bench_search(size, args.dim, args.queries, args.k, os.path.join(root, f"index-{size}"))
+
+if __name__ == "__main__":
+    asyncio.run(main())
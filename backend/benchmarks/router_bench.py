@@ -0,0 +1,56 @@
+"""Latency and coverage of the local intent router on sample student queries.
+
+    python benchmarks/router_bench.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents import intent_router
+
+# (query, agent the LLM selector is expected to pick)
+SAMPLES = [
+    ("I don't understand refraction", "maths_science"),
+    ("help me with fractions", "maths_science"),
+    ("Can you explain Newton's third law?", "maths_science"),
+    ("I need help solving this trigonometry question.", "maths_science"),
+    ("how do plants make food", "maths_science"),
+    ("What is the formula for the area of a circle?", "maths_science"),
+    ("Why did the Mughal Empire decline?", "language_social"),
+    ("Why did World War II happen?", "language_social"),
+    ("What does this paragraph mean?", "language_social"),
+    ("What is a metaphor in this poem?", "language_social"),
+    ("can you check my essay", "language_social"),
+    ("I feel like giving up. I study hard but still fail.", "motivation"),
+    ("I'm not good at anything.", "motivation"),
+    ("I'm so tired and can't focus", "motivation"),
+    ("I hate maths, I'm stupid", "motivation"),
+    ("ok, next step?", None),
+    ("hello", None),
+]
+
+def main():
+    rounds = 2000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for query, _ in SAMPLES:
+            intent_router.classify(query)
+    per_call = (time.perf_counter() - start) / (rounds * len(SAMPLES))
+
+    handled = agreed = 0
+    for query, expected in SAMPLES:
+        decision = intent_router.classify(query)
+        verdict = "local" if decision.confident else "llm"
+        print(f"{verdict:5s} {str(decision.label):16s} score={decision.score:.3f} margin={decision.margin:.3f}  {query}")
+        if decision.confident:
+            handled += 1
+            agreed += decision.label == expected
+
+    print(f"\nper query:        {per_call * 1e6:.1f} us")
+    print(f"handled locally:  {handled}/{len(SAMPLES)}")
+    print(f"agreement:        {agreed}/{handled} of locally handled queries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Speech-to-text latency and real-time factor, remote (OpenAI whisper-1) against local.
+
+Transcribes each sample clip a few times with every backend, one clip at a
+time and then --concurrency clips at once, and reports latency percentiles
+and the real-time factor (latency divided by the clip's duration; below 1 is
+faster than real time). Clips go through the same preprocessing as live
+turns unless --raw is given. The local backend's model is loaded and warmed
+up before timing starts, as it is at server startup.
+
+    python benchmarks/stt_bench.py samples/*.wav --backends openai,local --rounds 5
+    STT_LOCAL_MODEL=small.en STT_LOCAL_WORKERS=4 python benchmarks/stt_bench.py clip.webm --concurrency 4
+
+Point OPENAI_BASE_URL at benchmarks/mock_openai.py to time the remote path
+offline (its latency is then MOCK_STT_LATENCY, not Whisper's).
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_preprocess import prepare_for_transcription
+from stt import create_stt_backend
+
+def clip_seconds(path: str, data: bytes):
+    """Duration of a clip: read from the WAV header, or with ffprobe for other containers"""
+    if data[:4] == b"RIFF":
+        with wave.open(io.BytesIO(data)) as clip:
+            return clip.getnframes() / clip.getframerate()
+    if shutil.which("ffprobe"):
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", path],
+            capture_output=True, text=True
+        )
+        try:
+            return float(json.loads(result.stdout)["format"]["duration"])
+        except (KeyError, ValueError):
+            pass
+    return None
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+async def load_clips(paths, raw: bool):
+    clips = []
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        name = os.path.basename(path)
+        seconds = clip_seconds(path, data)
+        if not raw:
+            prepared = await prepare_for_transcription(data, name)
+            if not prepared.has_speech:
+                print(f"skipping {name}: no speech detected")
+                continue
+            # Time against the audio actually sent, after silence trimming
+            data, name, seconds = prepared.audio, prepared.filename, prepared.sent_seconds or seconds
+        clips.append((os.path.basename(path), data, name, seconds))
+    return clips
+
+async def transcribe(backend, data: bytes, name: str):
+    audio_file = io.BytesIO(data)
+    audio_file.name = name
+    started = time.perf_counter()
+    text = await backend.transcribe(audio_file)
+    return time.perf_counter() - started, text
+
+async def bench_backend(label: str, clips, rounds: int, concurrency: int):
+    backend = create_stt_backend(label)
+    started = time.perf_counter()
+    await backend.start()
+    print(f"\n{label}: ready in {time.perf_counter() - started:.2f}s")
+    try:
+        latencies, factors = [], []
+        for clip, data, name, seconds in clips:
+            samples = []
+            for _ in range(rounds):
+                latency, text = await transcribe(backend, data, name)
+                samples.append(latency)
+            latencies.extend(samples)
+            rtf = statistics.median(samples) / seconds if seconds else None
+            if rtf is not None:
+                factors.append(rtf)
+            rtf_text = f"RTF {rtf:.3f}" if rtf is not None else "RTF n/a"
+            print(f"  {clip:<24} {seconds or 0:>6.2f}s audio  p50 {statistics.median(samples):.3f}s  {rtf_text}  {text[:50]!r}")
+        print(f"  latency p50 {statistics.median(latencies):.3f}s p95 {percentile(latencies, 0.95):.3f}s"
+              + (f", median RTF {statistics.median(factors):.3f}" if factors else ""))
+
+        if concurrency > 1:
+            jobs = [clips[i % len(clips)] for i in range(concurrency * rounds)]
+            total_audio = sum(seconds or 0 for _, _, _, seconds in jobs)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def limited(data, name):
+                async with semaphore:
+                    return await transcribe(backend, data, name)
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*[limited(data, name) for _, data, name, _ in jobs])
+            wall = time.perf_counter() - started
+            parallel = [latency for latency, _ in results]
+            print(f"  {concurrency} at once: {len(jobs) / wall:.2f} clips/s, latency p50 {statistics.median(parallel):.3f}s "
+                  f"p95 {percentile(parallel, 0.95):.3f}s" + (f", {total_audio / wall:.1f}s of audio per second" if total_audio else ""))
+    finally:
+        backend.close()
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips", nargs="+", help="recorded sample clips (wav, webm, mp3, ...)")
+    parser.add_argument("--backends", default="openai,local", help="comma-separated: openai, local")
+    parser.add_argument("--rounds", type=int, default=3, help="transcriptions per clip and backend")
+    parser.add_argument("--concurrency", type=int, default=1, help="also time this many clips at once")
+    parser.add_argument("--raw", action="store_true", help="skip silence trimming and resampling")
+    args = parser.parse_args()
+
+    clips = await load_clips(args.clips, args.raw)
+    if not clips:
+        parser.error("none of the clips contain speech")
+    for label in args.backends.split(","):
+        await bench_backend(label, clips, args.rounds, args.concurrency)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""ai_text_delta frames per answer for different coalescing settings.
+
+Replays a synthetic answer as a token stream at a fixed rate through
+TextDeltaCoalescer and counts the frames it would send, against one frame per
+token and the old path (the whole text only in ai_response). Time to first
+text is measured from the first token; the old path's is the generation time.
+
+    python benchmarks/text_delta_bench.py --tokens 120 --token-rate 80
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_deltas import TextDeltaCoalescer
+
+WORDS = ("Sure, a fraction is a part of a whole and the number on top is the numerator while "
+         "the one below is the denominator so three quarters means three of four equal parts ").split()
+
+async def token_stream(count: int, rate: float):
+    for i in range(count):
+        yield WORDS[i % len(WORDS)] + " "
+        await asyncio.sleep(1 / rate)
+
+async def replay(count: int, rate: float, interval: float, max_chars: int):
+    frames = []
+    started = time.perf_counter()
+
+    async def send(text: str):
+        frames.append((time.perf_counter() - started, len(text)))
+
+    coalescer = TextDeltaCoalescer(send, interval=interval, max_chars=max_chars)
+    async for _ in coalescer.tap(token_stream(count, rate)):
+        pass
+    return frames, time.perf_counter() - started
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=120)
+    parser.add_argument("--token-rate", type=float, default=80, help="tokens per second")
+    parser.add_argument("--intervals", default="0,15,30,60,120", help="comma-separated intervals in ms (0 sends every token)")
+    parser.add_argument("--max-chars", default="24,48,96", help="comma-separated size limits")
+    args = parser.parse_args()
+
+    print(f"{args.tokens} tokens at {args.token_rate:g} tokens/s")
+    print(f"{'interval':>9} {'max chars':>9} {'frames':>7} {'chars/frame':>11} {'first text':>11} {'last text':>10}")
+    generation = None
+    for interval_ms in (float(i) for i in args.intervals.split(",")):
+        limits = [1] if interval_ms == 0 else [int(c) for c in args.max_chars.split(",")]
+        for max_chars in limits:
+            frames, generation = await replay(args.tokens, args.token_rate, interval_ms / 1000, max_chars)
+            label = "per token" if interval_ms == 0 else f"{interval_ms:g} ms"
+            print(
+                f"{label:>9} {max_chars if interval_ms else '-':>9} {len(frames):>7} "
+                f"{sum(size for _, size in frames) / len(frames):>11.1f} "
+                f"{frames[0][0] * 1000:>9.1f}ms {frames[-1][0] * 1000:>8.1f}ms"
+            )
+    print(f"{'ai_response only':>19} {1:>7} {'-':>11} {generation * 1000:>9.1f}ms {generation * 1000:>8.1f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""Time to first audio and answer synthesis time for a TTS backend under load.
+
+Replays a multi-sentence answer as a token stream through the speech pipeline,
+as a turn does (without the TTS cache), --concurrency answers at a time, and
+checks that every answer's audio comes back in sentence order. For raw PCM
+the real-time factor (synthesis wall time per second of speech) is reported.
+
+    python benchmarks/tts_bench.py --backend local --format pcm --concurrency 4
+    TTS_LOCAL_WORKERS=4 python benchmarks/tts_bench.py --backend local --max-pending 4
+
+Point OPENAI_BASE_URL at benchmarks/mock_openai.py to time the remote path
+offline (its latency is then MOCK_TTS_LATENCY).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tts import create_tts_backend
+from tts_pipeline import SpeechPipeline
+
+ANSWER = ("Great question! A fraction shows part of a whole. The top number is the numerator, "
+          "and it counts the parts you have. The bottom number is the denominator. "
+          "It tells you how many equal parts make the whole. So three quarters means three of four equal parts. "
+          "Would you like to try one together?")
+
+async def token_stream(rate: float):
+    for word in ANSWER.split(" "):
+        yield word + " "
+        await asyncio.sleep(1 / rate)
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+async def answer(backend, rate: float, max_pending: int):
+    pipeline = SpeechPipeline(backend.synthesize, max_pending=max_pending)
+    started = time.perf_counter()
+    first_audio = None
+    sizes = []
+    async for seq, _, audio in pipeline.run(token_stream(rate)):
+        assert seq == len(sizes), f"sentence {seq} arrived out of order"
+        first_audio = first_audio or time.perf_counter() - started
+        sizes.append(len(audio))
+    return first_audio, time.perf_counter() - started, sizes
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="local", help="openai or local")
+    parser.add_argument("--format", default="", help="mp3, pcm or opus (default: the backend's)")
+    parser.add_argument("--answers", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=2, help="answers synthesized at once")
+    parser.add_argument("--token-rate", type=float, default=80, help="tokens per second")
+    parser.add_argument("--max-pending", type=int, default=3, help="sentences in flight per answer")
+    args = parser.parse_args()
+
+    backend = create_tts_backend(args.backend, args.format or None)
+    started = time.perf_counter()
+    await backend.start()
+    print(f"{backend.name} ({backend.audio_format}): ready in {time.perf_counter() - started:.2f}s")
+    try:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited():
+            async with semaphore:
+                return await answer(backend, args.token_rate, args.max_pending)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*[limited() for _ in range(args.answers)])
+        wall = time.perf_counter() - started
+    finally:
+        backend.close()
+
+    first = [first_audio for first_audio, _, _ in results]
+    total = [elapsed for _, elapsed, _ in results]
+    sentences = len(results[0][2])
+    print(f"{args.answers} answers of {sentences} sentences, {args.concurrency} at a time, "
+          f"{args.max_pending} sentences in flight each: {wall:.2f}s")
+    print(f"  first audio p50 {statistics.median(first):.3f}s p95 {percentile(first, 0.95):.3f}s")
+    print(f"  whole answer p50 {statistics.median(total):.3f}s p95 {percentile(total, 0.95):.3f}s")
+    if backend.audio_format == "pcm":
+        speech = sum(sum(sizes) for _, _, sizes in results) / 2 / backend.sample_rate
+        print(f"  {speech:.1f}s of speech, {speech / wall:.1f}s per second of wall time")
+    print(f"  stats: {backend.stats()}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
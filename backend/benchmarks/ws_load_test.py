@@ -0,0 +1,273 @@
+"""Concurrent /ws load test against a local mock OpenAI/Groq server.
+
+Starts benchmarks/mock_openai.py and the FastAPI app from main.py as
+subprocesses, then opens N websockets that each run a few turns and wait for
+every ai_response. Clients cycle through the message kinds given by --kinds:
+
+    audio   one WAV clip uploaded as a single binary frame
+    stream  the same clip streamed in chunks between audio_start and audio_end
+    text    a text_message
+
+The clip is a synthetic voiced tone padded with silence, so server-side VAD
+trims it like real speech. The mock's latency per call and token rate are
+configurable, and the TTS cache is off unless --tts-cache is given so every
+sentence reaches the mock. Reports throughput, time to first audio and first
+text percentiles, websocket frames per turn and the server's CPU time and RSS
+(read from /proc on Linux). --no-text-deltas turns off ai_text_delta
+streaming, so the first text is the final ai_response.
+
+If the handlers block the event loop, the turns are served one after another
+and the wall time grows with N; with the async client the wall time stays
+close to a single client's.
+
+    python benchmarks/ws_load_test.py --clients 20 --turns 3 --latency 0.2 --token-rate 50
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+import wave
+from typing import List, NamedTuple, Optional
+import numpy as np
+import websockets
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+TEXT_QUESTIONS = ["Can you help me with fractions?", "What is the numerator?", "Why is the denominator below the line?"]
+
+def start_server(module: str, port: int, cwd: str, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--port", str(port), "--log-level", "warning"],
+        cwd=cwd,
+        env=env,
+    )
+
+def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except Exception:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start")
+
+def speech_like_clip(seconds: float = 2.0, rate: int = 16000, silence: float = 0.5) -> bytes:
+    """16-bit mono WAV: a modulated 150 Hz voice-like tone with silence on both sides"""
+    t = np.arange(int(seconds * rate)) / rate
+    voice = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 6))
+    voice *= 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2
+    pad = np.zeros(int(silence * rate))
+    samples = np.concatenate([pad, voice / np.abs(voice).max() * 0.5, pad])
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(rate)
+        clip.writeframes((samples * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+class ProcessSampler:
+    """CPU time and resident memory of a server process, sampled from /proc"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.available = os.path.exists(f"/proc/{pid}/stat")
+        self.peak_rss = 0
+        self.started_cpu = self.started_at = None
+
+    def cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as stat:
+            # Fields after the command name; utime and stime are the 14th and 15th
+            fields = stat.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_bytes(self) -> int:
+        with open(f"/proc/{self.pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def start(self):
+        if self.available:
+            self.started_cpu, self.started_at = self.cpu_seconds(), time.perf_counter()
+            self.peak_rss = self.rss_bytes()
+
+    def sample(self):
+        if self.available:
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+
+    async def run(self, interval: float = 0.1):
+        while True:
+            self.sample()
+            await asyncio.sleep(interval)
+
+    def report(self) -> dict:
+        if not self.available:
+            return {}
+        cpu = self.cpu_seconds() - self.started_cpu
+        wall = time.perf_counter() - self.started_at
+        return {"cpu_seconds": cpu, "cpu_percent": 100 * cpu / wall, "rss_mb": self.rss_bytes() / 2**20, "peak_rss_mb": self.peak_rss / 2**20}
+
+async def send_turn(ws, kind: str, clip: bytes, question: str, chunk_bytes: int):
+    if kind == "text":
+        await ws.send(json.dumps({"type": "text_message", "text": question}))
+    elif kind == "stream":
+        await ws.send(json.dumps({"type": "audio_start", "format": "wav"}))
+        for start in range(0, len(clip), chunk_bytes):
+            await ws.send(clip[start:start + chunk_bytes])
+        await ws.send(json.dumps({"type": "audio_end"}))
+    else:
+        await ws.send(clip)
+
+class TurnResult(NamedTuple):
+    kind: str
+    first_audio: Optional[float]
+    first_text: Optional[float]
+    total: float
+    received: int
+    frames: int
+    text_frames: int
+    error: Optional[str]
+
+async def run_client(url: str, kind: str, turns: int, clip: bytes, chunk_bytes: int) -> List[TurnResult]:
+    results = []
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.recv()  # session info
+        for turn in range(turns):
+            start = time.perf_counter()
+            first_audio = first_text = None
+            received = frames = text_frames = 0
+            await send_turn(ws, kind, clip, TEXT_QUESTIONS[turn % len(TEXT_QUESTIONS)], chunk_bytes)
+            while True:
+                frame = await ws.recv()
+                received += len(frame)
+                frames += 1
+                if isinstance(frame, bytes):
+                    if first_audio is None:
+                        first_audio = time.perf_counter() - start
+                    continue
+                message = json.loads(frame)
+                if message["type"] in ("error", "no_speech"):
+                    error = message.get("message", message["type"])
+                    results.append(TurnResult(kind, None, None, time.perf_counter() - start, received, frames, text_frames, error))
+                    break
+                if message["type"] == "ai_text_delta":
+                    text_frames += 1
+                if message["type"] in ("ai_text_delta", "ai_response") and first_text is None:
+                    first_text = time.perf_counter() - start
+                if message["type"] == "ai_audio_chunk" and "audio" in message and first_audio is None:
+                    first_audio = time.perf_counter() - start
+                if message["type"] == "ai_response":
+                    results.append(TurnResult(kind, first_audio, first_text, time.perf_counter() - start, received, frames, text_frames, None))
+                    break
+    return results
+
+async def run_load(url: str, clients: int, kinds: list, turns: int, chunk_bytes: int, sampler: ProcessSampler) -> tuple:
+    clip = speech_like_clip()
+    sampler.start()
+    sampling = asyncio.create_task(sampler.run())
+    start = time.perf_counter()
+    try:
+        results = await asyncio.gather(*[
+            run_client(url, kinds[i % len(kinds)], turns, clip, chunk_bytes) for i in range(clients)
+        ])
+    finally:
+        sampling.cancel()
+    return time.perf_counter() - start, [turn for client in results for turn in client], sampler.report()
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def describe(samples) -> str:
+    if not samples:
+        return "n/a"
+    return " ".join(f"p{int(q * 100)} {percentile(samples, q):.3f}s" for q in (0.5, 0.95, 0.99))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=1, help="turns per client, sent one after another")
+    parser.add_argument("--kinds", default="audio", help="comma-separated message kinds: audio, stream, text")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock latency per OpenAI/Groq call, seconds")
+    parser.add_argument("--stt-latency", type=float, help="override --latency for transcription")
+    parser.add_argument("--chat-latency", type=float, help="override --latency for chat completions")
+    parser.add_argument("--tts-latency", type=float, help="override --latency for speech")
+    parser.add_argument("--token-rate", type=float, default=50, help="streamed tokens per second from the mock")
+    parser.add_argument("--chunk-bytes", type=int, default=8000, help="chunk size for stream turns")
+    parser.add_argument("--tts-cache", action="store_true", help="keep the TTS cache on")
+    parser.add_argument("--no-text-deltas", action="store_true", help="only send the answer text in ai_response")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=9101)
+    parser.add_argument("--audio-transport", choices=["json", "binary"], default="json")
+    args = parser.parse_args()
+    kinds = args.kinds.split(",")
+    unknown = set(kinds) - {"audio", "stream", "text"}
+    if unknown:
+        parser.error(f"unknown message kinds: {', '.join(sorted(unknown))}")
+
+    mock_env = dict(os.environ, MOCK_LATENCY=str(args.latency), MOCK_TOKEN_DELAY=str(1 / args.token_rate))
+    for name, value in (("MOCK_STT_LATENCY", args.stt_latency), ("MOCK_CHAT_LATENCY", args.chat_latency), ("MOCK_TTS_LATENCY", args.tts_latency)):
+        if value is not None:
+            mock_env[name] = str(value)
+    app_env = dict(
+        os.environ,
+        OPENAI_API_KEY="mock-key",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.mock_port}/v1",
+        GROQ_API_BASE=f"http://127.0.0.1:{args.mock_port}",
+        OPENAI_MAX_CONCURRENCY=str(max(16, args.clients * 3)),
+        TTS_CACHE="1" if args.tts_cache else "0",
+        TEXT_DELTAS="0" if args.no_text_deltas else "1",
+    )
+    mock = start_server("mock_openai:app", args.mock_port, BENCH_DIR, mock_env)
+    app = start_server("main:app", args.app_port, BACKEND_DIR, app_env)
+    try:
+        wait_until_up(f"http://127.0.0.1:{args.mock_port}/docs")
+        wait_until_up(f"http://127.0.0.1:{args.app_port}/health")
+        wall, results, server = asyncio.run(run_load(
+            f"ws://127.0.0.1:{args.app_port}/ws?audio_transport={args.audio_transport}",
+            args.clients, kinds, args.turns, args.chunk_bytes, ProcessSampler(app.pid)
+        ))
+        stats = json.load(urllib.request.urlopen(f"http://127.0.0.1:{args.app_port}/stats"))
+    finally:
+        app.terminate()
+        mock.terminate()
+        app.wait()
+        mock.wait()
+
+    completed = [r for r in results if r.error is None]
+    failed = [r for r in results if r.error is not None]
+    latencies = [r.total for r in completed]
+    serial = sum(latencies)
+    print(f"clients:            {args.clients} x {args.turns} turns ({args.kinds}, {args.audio_transport} audio)")
+    print(f"mock latency/call:  {args.latency:.3f}s, {args.token_rate:g} tokens/s")
+    print(f"wall time:          {wall:.3f}s")
+    print(f"throughput:         {len(completed) / wall:.2f} turns/s ({len(failed)} failed)")
+    print(f"first audio:        {describe([r.first_audio for r in completed if r.first_audio is not None])}")
+    for kind in kinds:
+        print(f"  {kind:<17} {describe([r.first_audio for r in completed if r.kind == kind and r.first_audio is not None])}")
+    print(f"first text:         {describe([r.first_text for r in completed if r.first_text is not None])}")
+    print(f"turn latency:       {describe(latencies)}")
+    if latencies:
+        print(f"served one by one:  {serial:.3f}s")
+        print(f"overlap factor:     {serial / wall:.1f}x")
+        print(f"bytes per turn:     {sum(r.received for r in completed) // len(completed)}")
+        print(f"frames per turn:    {sum(r.frames for r in completed) / len(completed):.1f} "
+              f"({sum(r.text_frames for r in completed) / len(completed):.1f} ai_text_delta)")
+    if server:
+        print(f"server CPU:         {server['cpu_seconds']:.2f}s ({server['cpu_percent']:.0f}% of one core)")
+        print(f"server RSS:         {server['rss_mb']:.1f} MB (peak {server['peak_rss_mb']:.1f} MB)")
+    else:
+        print("server CPU/RSS:     unavailable (needs /proc)")
+    for result in failed[:5]:
+        print(f"failed {result.kind} turn:  {result.error}")
+    print(f"server stats:       {json.dumps(stats)}")
+
+if __name__ == "__main__":
+    main()
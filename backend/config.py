@@ -0,0 +1,187 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# OpenAI (speech-to-text, chat, text-to-speech)
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+
+# Maximum number of OpenAI requests in flight per process
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", "16"))
+
+# Admission control: turns answered at once across all connections (0 disables the
+# limit) and turns allowed to wait for a slot before new ones are refused as busy. Each
+# connection has at most one turn running or queued: a new turn cancels the previous one.
+ADMISSION_MAX_ACTIVE = int(os.environ.get("ADMISSION_MAX_ACTIVE", "32"))
+ADMISSION_MAX_QUEUED = int(os.environ.get("ADMISSION_MAX_QUEUED", "64"))
+# Largest utterance accepted from a client, whether uploaded whole or streamed in chunks
+MAX_AUDIO_BYTES = int(os.environ.get("MAX_AUDIO_BYTES", str(5 * 1024 * 1024)))
+
+# Per-stage request timeouts, in seconds
+STT_TIMEOUT = float(os.environ.get("STT_TIMEOUT", "30"))
+TTS_TIMEOUT = float(os.environ.get("TTS_TIMEOUT", "30"))
+EMBEDDING_TIMEOUT = float(os.environ.get("EMBEDDING_TIMEOUT", "10"))
+
+# Text embeddings: "hashing" (local feature hashing, no network) or "openai"
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "hashing")
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", "1536" if EMBEDDING_BACKEND == "openai" else "512"))
+
+# Speech-to-text backend: "openai" (whisper-1 over the API) or "local" (faster-whisper on
+# the CPU in a pool of worker processes; needs `pip install faster-whisper`)
+STT_BACKEND = os.environ.get("STT_BACKEND", "openai")
+# Model size (tiny.en, base.en, small.en, ...) or path of a converted model directory
+STT_LOCAL_MODEL = os.environ.get("STT_LOCAL_MODEL", "base.en")
+STT_LOCAL_COMPUTE_TYPE = os.environ.get("STT_LOCAL_COMPUTE_TYPE", "int8")
+# Worker processes (clips transcribed in parallel) and CPU threads each one uses
+STT_LOCAL_WORKERS = int(os.environ.get("STT_LOCAL_WORKERS", "2"))
+STT_LOCAL_THREADS = int(os.environ.get("STT_LOCAL_THREADS", "2"))
+STT_LOCAL_BEAM_SIZE = int(os.environ.get("STT_LOCAL_BEAM_SIZE", "1"))
+# Spoken language, e.g. "en"; empty lets the model detect it (multilingual models only)
+STT_LANGUAGE = os.environ.get("STT_LANGUAGE", "")
+
+# Streaming speech-to-text: while an utterance is streamed in chunks, re-transcribe the
+# growing window once at least this many new bytes arrived and this many seconds passed
+STT_PARTIAL_MIN_BYTES = int(os.environ.get("STT_PARTIAL_MIN_BYTES", "16000"))
+STT_PARTIAL_INTERVAL = float(os.environ.get("STT_PARTIAL_INTERVAL", "1.0"))
+
+# Server-side voice activity detection before transcription: trim silence and
+# drop clips without speech
+AUDIO_PREPROCESS = os.environ.get("AUDIO_PREPROCESS", "1") == "1"
+# Downmix and resample trimmed audio to 16 kHz mono before uploading it
+STT_RESAMPLE = os.environ.get("STT_RESAMPLE", "1") == "1"
+VAD_FRAME_MS = int(os.environ.get("VAD_FRAME_MS", "30"))
+# A frame is loud when it is this many dB above the clip's noise floor and above VAD_MIN_ENERGY_DB (dBFS)
+VAD_ENERGY_MARGIN_DB = float(os.environ.get("VAD_ENERGY_MARGIN_DB", "12"))
+VAD_MIN_ENERGY_DB = float(os.environ.get("VAD_MIN_ENERGY_DB", "-50"))
+# The noise floor is never taken to be louder than this (dBFS), even when a clip has no pauses
+VAD_NOISE_FLOOR_DB = float(os.environ.get("VAD_NOISE_FLOOR_DB", "-40"))
+# Zero crossings per sample below which a loud frame is voiced speech rather than noise
+VAD_MAX_ZCR = float(os.environ.get("VAD_MAX_ZCR", "0.25"))
+# Clips with less speech than this are dropped
+VAD_MIN_SPEECH_MS = int(os.environ.get("VAD_MIN_SPEECH_MS", "150"))
+# Silence kept around the detected speech
+VAD_PADDING_MS = int(os.environ.get("VAD_PADDING_MS", "200"))
+
+# Agent backend answering each turn: "stream" (agents.py) or "non_stream" (non_stream_agent.py)
+AGENT_BACKEND = os.environ.get("AGENT_BACKEND", "stream")
+
+# Local intent router that picks an agent without an LLM call when it is confident
+INTENT_ROUTER = os.environ.get("INTENT_ROUTER", "1") == "1"
+ROUTER_MIN_SCORE = float(os.environ.get("ROUTER_MIN_SCORE", "0.075"))
+ROUTER_MIN_MARGIN = float(os.environ.get("ROUTER_MIN_MARGIN", "0.03"))
+# Fraction of locally routed turns also sent to the LLM selector to measure agreement
+ROUTER_AUDIT_RATE = float(os.environ.get("ROUTER_AUDIT_RATE", "0"))
+
+# Conversation memory: "bounded" keeps recent turns within a token budget and folds
+# older ones into a running summary, "buffer" keeps every message
+MEMORY_MODE = os.environ.get("MEMORY_MODE", "bounded")
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", "1500"))
+# Part of the budget reserved for the running summary
+MEMORY_SUMMARY_TOKENS = int(os.environ.get("MEMORY_SUMMARY_TOKENS", "300"))
+MEMORY_MAX_MESSAGES = int(os.environ.get("MEMORY_MAX_MESSAGES", "40"))
+
+# Sticky routing: follow-ups stay with the current agent unless the topic shifts
+STICKY_ROUTING = os.environ.get("STICKY_ROUTING", "1") == "1"
+# Opt-in: hold a speculative follow-up answer back up to this many seconds until the selector
+# confirms it. At 0 it streams at once and a selector that disagrees later moves the next turn.
+STICKY_HOLD_SECONDS = float(os.environ.get("STICKY_HOLD_SECONDS", "0"))
+
+# Text-to-speech backend: "openai" (tts-1 over the API) or "local" (Piper voices on the
+# CPU in a pool of worker processes; needs `pip install piper-tts`)
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "openai")
+# Audio sent to clients: mp3 (openai only), pcm (16-bit mono, raw) or opus (Ogg, needs
+# ffmpeg with the local backend); empty picks mp3 for openai and pcm for local
+TTS_FORMAT = os.environ.get("TTS_FORMAT", "")
+# Path of a Piper voice (.onnx, with its .onnx.json next to it)
+TTS_LOCAL_MODEL = os.environ.get("TTS_LOCAL_MODEL", "voices/en_US-lessac-medium.onnx")
+# Speaker of multi-speaker voices; empty uses the voice's default
+TTS_LOCAL_SPEAKER = os.environ.get("TTS_LOCAL_SPEAKER", "")
+# Worker processes, i.e. sentences synthesized in parallel across all connections
+TTS_LOCAL_WORKERS = int(os.environ.get("TTS_LOCAL_WORKERS", "2"))
+TTS_OPUS_BITRATE = os.environ.get("TTS_OPUS_BITRATE", "32k")
+
+# Sentence-level TTS streaming
+# Sentences shorter than this are merged with the next one before synthesis
+TTS_MIN_SENTENCE_CHARS = int(os.environ.get("TTS_MIN_SENTENCE_CHARS", "12"))
+# How many sentences may be synthesizing ahead of the one being sent
+TTS_MAX_PENDING = int(os.environ.get("TTS_MAX_PENDING", "3"))
+
+# Answer text is streamed to the client as ai_text_delta frames while it is generated;
+# tokens are batched into one frame per interval or per this many characters
+TEXT_DELTAS = os.environ.get("TEXT_DELTAS", "1") == "1"
+TEXT_DELTA_INTERVAL_MS = float(os.environ.get("TEXT_DELTA_INTERVAL_MS", "30"))
+TEXT_DELTA_MAX_CHARS = int(os.environ.get("TEXT_DELTA_MAX_CHARS", "48"))
+
+# Content-addressed cache of synthesized sentences: an in-memory LRU and, when
+# TTS_CACHE_DIR is set, a size-capped on-disk tier
+TTS_CACHE = os.environ.get("TTS_CACHE", "1") == "1"
+TTS_CACHE_MEMORY_MB = int(os.environ.get("TTS_CACHE_MEMORY_MB", "64"))
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", ".cache/tts")
+TTS_CACHE_DISK_MB = int(os.environ.get("TTS_CACHE_DISK_MB", "512"))
+
+# Opt-in semantic cache of answers, namespaced by agent and grade bucket
+SEMANTIC_CACHE = os.environ.get("SEMANTIC_CACHE", "0") == "1"
+# Cosine similarity a cached question needs to be served as the answer
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", "86400"))
+# Entries per namespace; the oldest are replaced first
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+# Shorter inputs ("yes", "next step") depend on the conversation and are never cached
+SEMANTIC_CACHE_MIN_CHARS = int(os.environ.get("SEMANTIC_CACHE_MIN_CHARS", "15"))
+
+# Retrieval of curriculum passages from the local index built with `python rag.py ingest`
+RAG = os.environ.get("RAG", "1") == "1"
+RAG_INDEX_DIR = os.environ.get("RAG_INDEX_DIR", "rag_index")
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "3"))
+# Passages less similar to the question than this are left out of the prompt
+RAG_MIN_SCORE = float(os.environ.get("RAG_MIN_SCORE", "0.2"))
+# Ingestion: passage size in characters and passages per embedding request
+RAG_CHUNK_CHARS = int(os.environ.get("RAG_CHUNK_CHARS", "800"))
+RAG_BATCH_SIZE = int(os.environ.get("RAG_BATCH_SIZE", "64"))
+
+# Per-session orchestrator registry
+SESSION_MAX = int(os.environ.get("SESSION_MAX", "1000"))
+# Sessions idle for longer than this many seconds are dropped
+SESSION_TTL = float(os.environ.get("SESSION_TTL", "1800"))
+
+# Conversation state shared between workers: "none" keeps it in this process only,
+# "redis" stores it at REDIS_URL, "inprocess" uses a local stand-in for Redis
+HISTORY_BACKEND = os.environ.get("HISTORY_BACKEND", "none")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+# Messages kept per memory in the shared store (sessions expire after SESSION_TTL)
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", os.environ.get("MEMORY_MAX_MESSAGES", "40")))
+# Uvicorn worker processes when main.py is run directly; more than one needs a shared history backend
+WORKERS = int(os.environ.get("WORKERS", "1"))
+
+# Shared HTTP connection pool for LLM clients
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", "20"))
+# Seconds an idle keep-alive connection stays in the pool
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "60"))
+
+# LLM providers in order of preference, from groq (the agents' llama-3.3-70b-versatile) and
+# openai (OPENAI_CHAT_MODEL at OPENAI_BASE_URL, with OPENAI_API_KEY).
+# With more than one, calls are hedged and fail over between them.
+LLM_PROVIDERS = [name.strip() for name in os.environ.get("LLM_PROVIDERS", "groq").split(",") if name.strip()]
+OPENAI_CHAT_MODEL = os.environ.get("OPENAI_CHAT_MODEL", "gpt-4o-mini")
+# Hedging: when the first token (or a non-streamed answer) takes longer than this percentile
+# of the provider's recent latencies, the call is also sent to the next provider
+LLM_HEDGING = os.environ.get("LLM_HEDGING", "1") == "1"
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_WINDOW = int(os.environ.get("LLM_HEDGE_WINDOW", "200"))
+# Until this many latencies are known the deadline is LLM_HEDGE_INITIAL_DELAY seconds
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_INITIAL_DELAY = float(os.environ.get("LLM_HEDGE_INITIAL_DELAY", "2.0"))
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", "0.2"))
+# Circuit breakers: a provider is skipped for LLM_BREAKER_COOLDOWN seconds once this share of
+# its last LLM_BREAKER_WINDOW calls (at least LLM_BREAKER_MIN_CALLS) errored or took longer
+# than LLM_BREAKER_SLOW_SECONDS to answer
+LLM_BREAKER_WINDOW = int(os.environ.get("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS = int(os.environ.get("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_FAILURE_RATIO = float(os.environ.get("LLM_BREAKER_FAILURE_RATIO", "0.5"))
+LLM_BREAKER_SLOW_SECONDS = float(os.environ.get("LLM_BREAKER_SLOW_SECONDS", "5.0"))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30"))
@@ -0,0 +1,106 @@
+import logging
+import math
+import re
+import zlib
+from collections import Counter
+from typing import List, Sequence
+import numpy as np
+import config
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Only words that never change what is being asked; negations, question words and
+# "again"/"more"/"next" are kept
+STOPWORDS = set("""
+    a an the is are am be was were it its this that these those i me my you your we our
+    to of in on at for with and or so please just um uh ok okay
+""".split())
+
+NEGATIONS = set("not no never dont doesnt didnt isnt arent wasnt cant cannot wont".split())
+
+# Words that flip or redirect a question while leaving most of it unchanged
+INTENT_WORDS = NEGATIONS | set("how why what when where which who again more next".split())
+
+class HashingEmbedder:
+    """Local embedding by feature hashing of words, word pairs and character trigrams.
+
+    No model and no network call, so it is cheap enough to run on every turn.
+    It captures lexical overlap, typos and word order changes rather than
+    meaning, which suits spotting near-duplicate questions. Vectors are
+    L2-normalized, so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> Counter:
+        # "don't" and "dont" should be the same word
+        words = [word for word in WORD_PATTERN.findall(text.lower().replace("'", "")) if word not in STOPWORDS]
+        # Words after a negation are told apart from the same words without it
+        terms, negated = [], False
+        for word in words:
+            terms.append("~" + word if negated else word)
+            negated = negated or word in NEGATIONS
+        features = Counter(terms)
+        features.update(f"{a} {b}" for a, b in zip(terms, terms[1:]))
+        for word in words:
+            padded = f"#{word}#"
+            features.update(f"#3{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        # Pair each intent word with every other word, so "how" vs "why" moves
+        # the vector as much as a content word would
+        for intent in (word for word in words if word in INTENT_WORDS):
+            features.update(f"{intent}>{word}" for word in words if word != intent)
+        return features
+
+    def embed_one(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in self._features(text).items():
+            digest = zlib.crc32(feature.encode("utf-8"))
+            # The top bit picks the sign so colliding features tend to cancel out
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dim] += sign * (1 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.stack([self.embed_one(text) for text in texts]) if texts else np.zeros((0, self.dim), dtype=np.float32)
+
+class OpenAIEmbedder:
+    """Embeddings from the OpenAI API, requested in batches"""
+
+    def __init__(self, model: str = "text-embedding-3-small", dim: int = 1536, batch_size: int = 256):
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        # Imported here so the hashing embedder works without OpenAI credentials
+        from openai_client import embed_texts
+        batches: List[np.ndarray] = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors = await embed_texts(list(texts[start:start + self.batch_size]), model=self.model, dimensions=self.dim)
+            batches.append(np.asarray(vectors, dtype=np.float32))
+        if not batches:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        matrix = np.concatenate(batches)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+def create_embedder():
+    """Embedder configured by EMBEDDING_BACKEND ("hashing" or "openai")"""
+    if config.EMBEDDING_BACKEND == "openai":
+        return OpenAIEmbedder(config.EMBEDDING_MODEL, config.EMBEDDING_DIM)
+    if config.EMBEDDING_BACKEND == "hashing":
+        return HashingEmbedder(config.EMBEDDING_DIM)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {config.EMBEDDING_BACKEND!r}, expected 'hashing' or 'openai'")
+
+_embedder = None
+
+def get_embedder():
+    """Process-wide embedder, so a query embedded once serves both retrieval and the answer cache"""
+    global _embedder
+    if _embedder is None:
+        _embedder = create_embedder()
+    return _embedder
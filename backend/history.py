@@ -0,0 +1,298 @@
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+import config
+import timing
+from memory import BoundedConversationMemory
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+def encode_message(message: BaseMessage) -> str:
+    return json.dumps({"type": message.type, "content": message.content})
+
+def decode_message(data: str) -> BaseMessage:
+    item = json.loads(data)
+    return MESSAGE_TYPES.get(item["type"], HumanMessage)(content=item["content"])
+
+class HistorySnapshot(NamedTuple):
+    version: int
+    lists: Dict[str, List[BaseMessage]]
+    fields: Dict[str, str]
+
+class HistoryStore(ABC):
+    """Shared storage for conversation state, so any worker can continue a session.
+
+    A session has a few named, bounded message lists (one per memory), a hash
+    of small string fields and a version number that every save increments,
+    which lets a worker check cheaply whether its local copy is still current.
+    """
+
+    @abstractmethod
+    async def version(self, session_id: str) -> int:
+        ...
+
+    @abstractmethod
+    async def load(self, session_id: str, names: Iterable[str]) -> HistorySnapshot:
+        ...
+
+    @abstractmethod
+    async def save(self, session_id: str, appended: Dict[str, List[BaseMessage]], fields: Dict[str, str]) -> int:
+        """Append messages and set fields in one step; returns the new version"""
+
+    @abstractmethod
+    async def delete(self, session_id: str):
+        ...
+
+class RedisHistoryStore(HistoryStore):
+    """Session state in Redis: one list per memory trimmed to max_messages, a fields hash and a version.
+
+    Keys share a {session} hash tag so a session stays in one Redis Cluster
+    slot. Loads and saves are each one pipelined MULTI/EXEC round trip, and
+    every key expires ttl_seconds after the session was last saved.
+    """
+
+    def __init__(self, client, max_messages: int, ttl_seconds: float, prefix: str = "history"):
+        self.client = client
+        self.max_messages = max_messages
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self.prefix = prefix
+
+    def _key(self, session_id: str, *parts: str) -> str:
+        return ":".join([self.prefix, "{" + session_id + "}", *parts])
+
+    async def version(self, session_id: str) -> int:
+        return int(await self.client.get(self._key(session_id, "version")) or 0)
+
+    async def load(self, session_id: str, names: Iterable[str]) -> HistorySnapshot:
+        names = list(names)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.get(self._key(session_id, "version"))
+        pipe.hgetall(self._key(session_id, "fields"))
+        for name in names:
+            pipe.lrange(self._key(session_id, "list", name), 0, -1)
+        version, fields, *lists = await pipe.execute()
+        return HistorySnapshot(
+            int(version or 0),
+            {name: [decode_message(item) for item in items] for name, items in zip(names, lists)},
+            dict(fields)
+        )
+
+    async def save(self, session_id: str, appended: Dict[str, List[BaseMessage]], fields: Dict[str, str]) -> int:
+        pipe = self.client.pipeline(transaction=True)
+        for name, messages in appended.items():
+            key = self._key(session_id, "list", name)
+            pipe.rpush(key, *[encode_message(message) for message in messages])
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, self.ttl_seconds)
+        if fields:
+            pipe.hset(self._key(session_id, "fields"), mapping=fields)
+            pipe.expire(self._key(session_id, "fields"), self.ttl_seconds)
+        pipe.incr(self._key(session_id, "version"))
+        pipe.expire(self._key(session_id, "version"), self.ttl_seconds)
+        results = await pipe.execute()
+        return int(results[-2])
+
+    async def delete(self, session_id: str):
+        keys = [key async for key in self.client.scan_iter(match=self._key(session_id, "*"))]
+        if keys:
+            await self.client.delete(*keys)
+
+class InProcessHistoryStore(HistoryStore):
+    """Stand-in for RedisHistoryStore with the same trimming, versioning and expiry.
+
+    State only lives in this process, so it is for development and for
+    checking the shared-history code paths without a Redis server.
+    """
+
+    def __init__(self, max_messages: int, ttl_seconds: float):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        # session id -> [version, lists of encoded messages, fields, expiry time]
+        self._sessions: Dict[str, list] = {}
+
+    def _get(self, session_id: str) -> Optional[list]:
+        entry = self._sessions.get(session_id)
+        if entry is not None and entry[3] <= time.monotonic():
+            del self._sessions[session_id]
+            return None
+        return entry
+
+    async def version(self, session_id: str) -> int:
+        entry = self._get(session_id)
+        return entry[0] if entry is not None else 0
+
+    async def load(self, session_id: str, names: Iterable[str]) -> HistorySnapshot:
+        entry = self._get(session_id) or [0, {}, {}, 0.0]
+        return HistorySnapshot(
+            entry[0],
+            {name: [decode_message(item) for item in entry[1].get(name, [])] for name in names},
+            dict(entry[2])
+        )
+
+    async def save(self, session_id: str, appended: Dict[str, List[BaseMessage]], fields: Dict[str, str]) -> int:
+        entry = self._get(session_id)
+        if entry is None:
+            entry = self._sessions[session_id] = [0, {}, {}, 0.0]
+        for name, messages in appended.items():
+            stored = entry[1].setdefault(name, [])
+            stored.extend(encode_message(message) for message in messages)
+            del stored[:-self.max_messages]
+        entry[2].update(fields)
+        entry[0] += 1
+        entry[3] = time.monotonic() + self.ttl_seconds
+        return entry[0]
+
+    async def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+def stored_messages(memory) -> List[BaseMessage]:
+    """The messages of a memory that are persisted (the running summary is stored separately)"""
+    if isinstance(memory, BoundedConversationMemory):
+        return list(memory.recent)
+    return list(memory.chat_memory.messages)
+
+def restore_memory(memory, messages: List[BaseMessage], summary: str = ""):
+    if isinstance(memory, BoundedConversationMemory):
+        memory.restore(messages, summary)
+    else:
+        memory.chat_memory.clear()
+        memory.chat_memory.add_messages(messages)
+
+def _added_since(messages: List[BaseMessage], last_synced: Optional[BaseMessage]) -> List[BaseMessage]:
+    if last_synced is None:
+        return messages
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i] is last_synced:
+            return messages[i + 1:]
+    # The last stored message has been evicted since, so everything left is newer
+    return messages
+
+class HistoryStats:
+    def __init__(self):
+        self.refreshes = 0
+        self.reloads = 0
+        self.saves = 0
+        self.failures = 0
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "refreshes": self.refreshes,
+            "reloads": self.reloads,
+            "local_hit_rate": 1 - self.reloads / self.refreshes if self.refreshes else 0.0,
+            "saves": self.saves,
+            "failures": self.failures
+        }
+
+history_stats = HistoryStats()
+
+class SessionHistory:
+    """Keeps one orchestrator's conversation state in sync with a HistoryStore.
+
+    The orchestrator's own memories are the local write-through cache:
+    ``refresh`` reloads them only when another worker saved the session since
+    this one last saw it (a single GET otherwise), and ``save`` pushes the
+    messages added during the turn, the running summaries and the current
+    agent in one round trip. Store failures are logged and the turn carries
+    on with the local state.
+    """
+
+    def __init__(self, store: HistoryStore, session_id: str, orchestrator):
+        self.store = store
+        self.session_id = session_id
+        self.orchestrator = orchestrator
+        self.version = 0
+        # Newest message of each memory known to be in the store
+        self._synced: Dict[str, Optional[BaseMessage]] = {}
+        self._saved_fields: Dict[str, str] = {}
+
+    def _memories(self) -> Dict[str, object]:
+        memories = {"orchestrator": self.orchestrator.memory}
+        for key, agent in self.orchestrator.agents.items():
+            memories[key] = agent.memory
+        return memories
+
+    def _fields(self) -> Dict[str, str]:
+        fields = {"current_agent": self.orchestrator.current_agent_key or ""}
+        for name, memory in self._memories().items():
+            if isinstance(memory, BoundedConversationMemory):
+                fields[f"summary:{name}"] = memory.summary
+        return fields
+
+    async def refresh(self):
+        """Bring the local memories up to date before a turn"""
+        history_stats.refreshes += 1
+        try:
+            with timing.stage("history_load"):
+                if await self.store.version(self.session_id) == self.version:
+                    return
+                snapshot = await self.store.load(self.session_id, self._memories())
+        except Exception as e:
+            history_stats.failures += 1
+            logger.warning(f"Could not load shared history for {self.session_id}: {str(e)}")
+            return
+
+        history_stats.reloads += 1
+        for name, memory in self._memories().items():
+            restore_memory(memory, snapshot.lists.get(name, []), snapshot.fields.get(f"summary:{name}", ""))
+            messages = stored_messages(memory)
+            self._synced[name] = messages[-1] if messages else None
+        agent_key = snapshot.fields.get("current_agent")
+        if agent_key in self.orchestrator.agents:
+            self.orchestrator.current_agent_key = agent_key
+            self.orchestrator.current_agent = self.orchestrator.agents[agent_key]
+        self._saved_fields = dict(snapshot.fields)
+        self.version = snapshot.version
+        logger.info(f"Reloaded shared history for {self.session_id} at version {self.version}")
+
+    async def save(self):
+        """Write what changed during the turn to the store"""
+        appended = {}
+        newest = {}
+        for name, memory in self._memories().items():
+            messages = stored_messages(memory)
+            added = _added_since(messages, self._synced.get(name))
+            if added:
+                appended[name] = added
+                newest[name] = messages[-1]
+        fields = {name: value for name, value in self._fields().items() if self._saved_fields.get(name) != value}
+        if not appended and not fields:
+            return
+        try:
+            with timing.stage("history_save"):
+                version = await self.store.save(self.session_id, appended, fields)
+        except Exception as e:
+            history_stats.failures += 1
+            logger.warning(f"Could not save shared history for {self.session_id}: {str(e)}")
+            return
+
+        history_stats.saves += 1
+        self._synced.update(newest)
+        self._saved_fields.update(fields)
+        # Another worker saved in between: our copy lacks its messages, so reload next turn
+        self.version = version if version == self.version + 1 else -1
+
+def create_history_store() -> Optional[HistoryStore]:
+    """History store configured from the environment, or None when HISTORY_BACKEND is none"""
+    if config.HISTORY_BACKEND == "none":
+        return None
+    if config.HISTORY_BACKEND == "inprocess":
+        return InProcessHistoryStore(config.HISTORY_MAX_MESSAGES, config.SESSION_TTL)
+    if config.HISTORY_BACKEND == "redis":
+        # Only needed with the Redis backend
+        import redis.asyncio as redis
+        client = redis.from_url(config.REDIS_URL, decode_responses=True)
+        return RedisHistoryStore(client, config.HISTORY_MAX_MESSAGES, config.SESSION_TTL)
+    raise ValueError(f"Unknown HISTORY_BACKEND {config.HISTORY_BACKEND!r}, expected 'none', 'inprocess' or 'redis'")
+
+def session_history(store: Optional[HistoryStore], orchestrator, session_id: Optional[str]) -> Optional[SessionHistory]:
+    """The orchestrator's SessionHistory, created on first use; None without a store or a session"""
+    if store is None or session_id is None:
+        return None
+    if orchestrator.history is None:
+        orchestrator.history = SessionHistory(store, session_id, orchestrator)
+    return orchestrator.history
@@ -0,0 +1,143 @@
+import logging
+import math
+import re
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Extra vocabulary per route, on top of the agent descriptions and instructions
+ROUTE_KEYWORDS = {
+    "motivation": """
+        motivation motivated unmotivated demotivated encourage encouragement confidence confident
+        stressed stress anxious anxiety nervous worried scared afraid overwhelmed tired exhausted
+        bored boring lazy procrastinate procrastinating distracted focus concentrate give up quit
+        fail failed failing failure hopeless sad upset depressed lonely frustrated hate stupid dumb
+        smart enough believe myself feel feeling pressure panic cry crying mood burnout exam nerves
+    """,
+    "maths_science": """
+        math maths mathematics algebra geometry trigonometry calculus arithmetic equation equations
+        formula fraction fractions decimal decimals percentage ratio number numbers multiply multiplication
+        divide division add subtract sum integer integers graph slope angle triangle circle area volume
+        perimeter probability statistics derivative integral solve solving theorem pythagoras square root
+        science physics chemistry biology force gravity motion velocity acceleration energy newton law
+        light refraction reflection electricity circuit magnet atom atoms molecule element periodic
+        reaction acid base cell cells photosynthesis plant plants dna gene evolution ecosystem experiment
+    """,
+    "language_social": """
+        language english grammar noun verb adjective adverb tense sentence sentences paragraph essay
+        writing write poem poetry story novel author character plot theme metaphor simile vocabulary
+        spelling punctuation comprehension reading read literature shakespeare summary summarize
+        history historical empire war revolution king queen independence constitution government
+        democracy civics politics election geography map continent country countries culture society
+        economics trade ancient medieval mughal colonial freedom movement world religion civilization
+    """,
+}
+
+# Very common words and follow-up chatter that carry no routing signal
+STOPWORDS = set("""
+    a an and are as at be but by can could did do does for from had has have he her him his how i if in
+    into is it its just me my no not of on or our please she so than that the their them then there these
+    they this to too up us was we what when where which who why will with would you your im ive dont
+    ok okay yes yeah sure thanks thank next step steps again more
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed and common suffixes stripped"""
+    tokens = []
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        for suffix in ("ing", "ed", "es", "s"):
+            if len(word) > len(suffix) + 3 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        tokens.append(word)
+    return tokens
+
+class RouteDecision(NamedTuple):
+    label: Optional[str]
+    score: float
+    margin: float
+    confident: bool
+
+class IntentRouter:
+    """Nearest-centroid TF-IDF classifier for picking an agent without an LLM call.
+
+    Each route is one document built from its description, instructions and
+    keyword list. A query is routed locally only when its best cosine score and
+    its lead over the runner-up both clear the thresholds; otherwise the caller
+    should ask the LLM selector and report back through ``record_comparison``.
+    """
+
+    def __init__(self, documents: Dict[str, str], min_score: float = 0.075, min_margin: float = 0.03):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        counts = {label: Counter(tokenize(text)) for label, text in documents.items()}
+        document_frequency = Counter(term for terms in counts.values() for term in terms)
+        total = len(counts)
+        # Terms shared by every route get zero weight
+        self.idf = {term: math.log(total / df) for term, df in document_frequency.items()}
+        self.centroids: Dict[str, Dict[str, float]] = {}
+        for label, terms in counts.items():
+            vector = {term: (1 + math.log(tf)) * self.idf[term] for term, tf in terms.items() if self.idf[term] > 0}
+            norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+            self.centroids[label] = {term: w / norm for term, w in vector.items()}
+
+        self.handled = 0
+        self.fallbacks = 0
+        self.compared = 0
+        self.agreed = 0
+
+    @classmethod
+    def from_agents(cls, agent_descriptions: Dict[str, Dict[str, str]], instructions: Dict[str, str], **kwargs) -> "IntentRouter":
+        documents = {
+            label: " ".join([desc["name"], desc["description"], instructions.get(label, ""), ROUTE_KEYWORDS.get(label, "")])
+            for label, desc in agent_descriptions.items()
+        }
+        return cls(documents, **kwargs)
+
+    def scores(self, text: str) -> Dict[str, float]:
+        terms = Counter(term for term in tokenize(text) if self.idf.get(term, 0) > 0)
+        if not terms:
+            return {label: 0.0 for label in self.centroids}
+        vector = {term: (1 + math.log(tf)) * self.idf[term] for term, tf in terms.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        return {
+            label: sum(w * centroid.get(term, 0.0) for term, w in vector.items()) / norm
+            for label, centroid in self.centroids.items()
+        }
+
+    def classify(self, text: str) -> RouteDecision:
+        ranked = sorted(self.scores(text).items(), key=lambda item: item[1], reverse=True)
+        (label, best), (_, runner_up) = ranked[0], ranked[1]
+        margin = best - runner_up
+        confident = best >= self.min_score and margin >= self.min_margin
+        return RouteDecision(label if best > 0 else None, best, margin, confident)
+
+    def record_decision(self, decision: RouteDecision):
+        if decision.confident:
+            self.handled += 1
+        else:
+            self.fallbacks += 1
+
+    def record_comparison(self, local_label: Optional[str], llm_label: str):
+        """Count whether the local guess matched the LLM selector's choice"""
+        if local_label is None:
+            return
+        self.compared += 1
+        if local_label == llm_label:
+            self.agreed += 1
+
+    def stats(self) -> Dict[str, float]:
+        turns = self.handled + self.fallbacks
+        return {
+            "turns": turns,
+            "handled": self.handled,
+            "fallbacks": self.fallbacks,
+            "handled_fraction": self.handled / turns if turns else 0.0,
+            "compared": self.compared,
+            "agreement_rate": self.agreed / self.compared if self.compared else 0.0
+        }
@@ -0,0 +1,132 @@
+import logging
+from typing import Dict, Optional, Tuple
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_groq import ChatGroq
+import config
+import llm_routing
+from llm_routing import HedgedChatModel, ProviderRoute
+
+logger = logging.getLogger(__name__)
+
+class ConnectionStats:
+    """Counts requests and new connections through the shared HTTP pools.
+
+    New TCP connections and TLS handshakes are observed through httpcore's
+    ``trace`` request extension, so every request that doesn't open one reused a
+    keep-alive connection.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def _record(self, event_name: str):
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    def on_request(self, request: httpx.Request):
+        self.requests += 1
+        request.extensions["trace"] = lambda event_name, info: self._record(event_name)
+
+    async def on_async_request(self, request: httpx.Request):
+        self.requests += 1
+
+        async def trace(event_name, info):
+            self._record(event_name)
+
+        request.extensions["trace"] = trace
+
+    def as_dict(self) -> Dict[str, float]:
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "reused_requests": reused,
+            "reuse_rate": reused / self.requests if self.requests else 0.0
+        }
+
+connection_stats = ConnectionStats()
+
+_models: Dict[Tuple[str, float, bool], BaseChatModel] = {}
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=config.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=config.LLM_MAX_KEEPALIVE,
+        keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY
+    )
+
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Process-wide keep-alive HTTP clients shared by every LLM client"""
+    global _http_client, _http_async_client
+    if _http_async_client is None:
+        timeout = httpx.Timeout(config.LLM_TIMEOUT)
+        _http_client = httpx.Client(
+            limits=_limits(),
+            timeout=timeout,
+            event_hooks={"request": [connection_stats.on_request]}
+        )
+        _http_async_client = httpx.AsyncClient(
+            limits=_limits(),
+            timeout=timeout,
+            event_hooks={"request": [connection_stats.on_async_request]}
+        )
+    return _http_client, _http_async_client
+
+def _provider_model(provider: str, model_name: str, temperature: float, streaming: bool, max_retries: int = 2) -> BaseChatModel:
+    http_client, http_async_client = get_http_clients()
+    if provider == "groq":
+        return ChatGroq(
+            model_name=model_name,
+            temperature=temperature,
+            streaming=streaming,
+            max_retries=max_retries,
+            http_client=http_client,
+            http_async_client=http_async_client
+        )
+    if provider == "openai":
+        # Imported here so a groq-only setup doesn't load it
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model=config.OPENAI_CHAT_MODEL,
+            temperature=temperature,
+            streaming=streaming,
+            max_retries=max_retries,
+            api_key=config.OPENAI_API_KEY,
+            base_url=config.OPENAI_BASE_URL,
+            http_client=http_client,
+            http_async_client=http_async_client
+        )
+    raise ValueError(f"Unknown LLM provider {provider!r} in LLM_PROVIDERS, expected 'groq' or 'openai'")
+
+def get_chat_model(model_name: str = "llama-3.3-70b-versatile", temperature: float = 0.7, streaming: bool = True) -> BaseChatModel:
+    """Return the shared chat model for (model_name, temperature, streaming), creating it on first use.
+
+    model_name is the Groq model; with several LLM_PROVIDERS the model hedges
+    and fails over across them in order.
+    """
+    key = (model_name, temperature, streaming)
+    model = _models.get(key)
+    if model is None:
+        logger.info(f"Creating shared LLM client for {key} with providers {config.LLM_PROVIDERS}")
+        if len(config.LLM_PROVIDERS) == 1:
+            model = _provider_model(config.LLM_PROVIDERS[0], model_name, temperature, streaming)
+        else:
+            # No client-side retries: failing over to the next provider is quicker
+            routes = [
+                ProviderRoute(provider, _provider_model(provider, model_name, temperature, streaming, max_retries=0))
+                for provider in config.LLM_PROVIDERS
+            ]
+            model = HedgedChatModel(routes=routes, streaming=streaming, hedging=config.LLM_HEDGING)
+        _models[key] = model
+    return model
+
+def stats() -> Dict[str, object]:
+    return {"models": len(_models), **connection_stats.as_dict(), "providers": llm_routing.stats()}
@@ -0,0 +1,337 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict
+import config
+
+logger = logging.getLogger(__name__)
+
+class LatencyTracker:
+    """Rolling window of recent latencies of one kind (first token or whole response)"""
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+class CircuitBreaker:
+    """Per-provider breaker over a window of recent outcomes.
+
+    A call fails when it errors or takes longer than ``slow_seconds`` (to its
+    first token when streaming). Once at least ``min_calls`` outcomes are in
+    the window and ``failure_ratio`` of them failed, the breaker opens and the
+    provider is skipped for ``cooldown`` seconds. Then a single trial call is
+    let through: success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, window: int, min_calls: int, failure_ratio: float, cooldown: float, slow_seconds: float):
+        self.outcomes = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.slow_seconds = slow_seconds
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.trips = 0
+
+    def available(self) -> bool:
+        """Whether a call may go to this provider now"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            self.trial_running = False
+        if self.state == "half_open":
+            return not self.trial_running
+        return self.state == "closed"
+
+    def begin(self):
+        """Note a call going out; when half open it is the trial call"""
+        if self.state == "half_open":
+            self.trial_running = True
+
+    def record(self, ok: bool):
+        if self.state == "half_open":
+            self.trial_running = False
+            if ok:
+                self.state = "closed"
+                self.outcomes.clear()
+            else:
+                self._open()
+            return
+        self.outcomes.append(ok)
+        failures = self.outcomes.count(False)
+        if self.state == "closed" and len(self.outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self.outcomes):
+            self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        self.outcomes.clear()
+
+class ProviderHealth:
+    """Breaker and counters shared by every model of one provider"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            window=config.LLM_BREAKER_WINDOW,
+            min_calls=config.LLM_BREAKER_MIN_CALLS,
+            failure_ratio=config.LLM_BREAKER_FAILURE_RATIO,
+            cooldown=config.LLM_BREAKER_COOLDOWN,
+            slow_seconds=config.LLM_BREAKER_SLOW_SECONDS
+        )
+        self.requests = 0
+        self.errors = 0
+        self.slow = 0
+        # Calls sent here because a preferred provider was slow or failed, and how many this one answered
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def succeeded(self, seconds: float):
+        slow = seconds > self.breaker.slow_seconds
+        self.slow += slow
+        self.breaker.record(not slow)
+
+    def failed(self):
+        self.errors += 1
+        self.breaker.record(False)
+
+    def abandoned(self, seconds: float):
+        """A call cancelled because another provider answered first"""
+        if seconds > self.breaker.slow_seconds:
+            self.slow += 1
+            self.breaker.record(False)
+        elif self.breaker.state == "half_open":
+            # The trial call never finished; let the next call try again
+            self.breaker.trial_running = False
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "state": self.breaker.state,
+            "trips": self.breaker.trips,
+            "requests": self.requests,
+            "errors": self.errors,
+            "slow": self.slow,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+_health: Dict[str, ProviderHealth] = {}
+
+def provider_health(name: str) -> ProviderHealth:
+    """Process-wide health of a provider, created on first use"""
+    health = _health.get(name)
+    if health is None:
+        health = _health[name] = ProviderHealth(name)
+    return health
+
+class ProviderRoute:
+    """One provider's chat model, with latency history for this model and mode"""
+
+    def __init__(self, name: str, model: BaseChatModel, health: Optional[ProviderHealth] = None):
+        self.name = name
+        self.model = model
+        self.health = health or provider_health(name)
+        self.latency = LatencyTracker(config.LLM_HEDGE_WINDOW)
+
+    def hedge_delay(self) -> float:
+        """How long to wait for this route before also asking the next provider"""
+        if len(self.latency.samples) < config.LLM_HEDGE_MIN_SAMPLES:
+            return config.LLM_HEDGE_INITIAL_DELAY
+        return max(self.latency.percentile(config.LLM_HEDGE_PERCENTILE), config.LLM_HEDGE_MIN_DELAY)
+
+# Keeps the tasks closing abandoned streams alive until they finish
+_closing = set()
+
+def _close_unused(task: asyncio.Task):
+    """Close the stream of an attempt whose answer is not used"""
+    if task.cancelled() or task.exception() is not None:
+        return
+    result = task.result()
+    if isinstance(result, tuple) and hasattr(result[0], "aclose"):
+        closing = asyncio.ensure_future(result[0].aclose())
+        _closing.add(closing)
+        closing.add_done_callback(_closing.discard)
+
+async def _chain(head: List[Any], stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    for chunk in head:
+        yield chunk
+    async for chunk in stream:
+        yield chunk
+
+class HedgedChatModel(BaseChatModel):
+    """Chat model that spreads calls over several providers, in order of preference.
+
+    Each call goes to the first provider whose circuit breaker is closed. If it
+    hasn't produced its first token (or, without streaming, its response) by
+    that provider's recent p95 latency, the same call is also sent to the next
+    provider, and whichever answers first is used; the other call is
+    cancelled. A provider that fails before answering is replaced by the next
+    one right away. Once tokens have been streamed the call stays with its
+    provider, so an error mid-answer is raised as before.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    routes: List[ProviderRoute]
+    streaming: bool = True
+    hedging: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "hedged"
+
+    def _candidates(self) -> List[ProviderRoute]:
+        candidates = [route for route in self.routes if route.health.breaker.available()]
+        if not candidates:
+            # Better to try the preferred provider than to fail the turn outright
+            logger.warning("Every LLM provider's circuit is open, trying the preferred one anyway")
+            candidates = self.routes[:1]
+        return candidates
+
+    async def _race(self, attempt: Callable[[ProviderRoute], Awaitable[Any]]) -> Tuple[ProviderRoute, Any, float]:
+        """Run attempt on the preferred provider, hedging and failing over to the others.
+
+        Returns the winning route, its result and how long it took. The
+        winner's outcome is left to the caller, which may still see it fail.
+        """
+        routes = self._candidates()
+        pending: Dict[asyncio.Task, Tuple[ProviderRoute, float]] = {}
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            route = routes[launched]
+            if launched > 0:
+                route.health.hedges += 1
+            launched += 1
+            route.health.requests += 1
+            route.health.breaker.begin()
+            pending[asyncio.create_task(attempt(route))] = (route, time.perf_counter())
+
+        launch()
+        error: Optional[BaseException] = None
+        answered = False
+        try:
+            while pending:
+                timeout = None
+                if self.hedging and launched < len(routes):
+                    last, started = list(pending.values())[-1]
+                    timeout = max(last.hedge_delay() - (time.perf_counter() - started), 0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"No answer from {routes[launched - 1].name} within its p95, hedging to {routes[launched].name}")
+                    launch()
+                    continue
+                winner = None
+                for task in done:
+                    route, started = pending.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        route.health.failed()
+                        logger.warning(f"LLM provider {route.name} failed: {str(error)}")
+                        continue
+                    if winner is None:
+                        elapsed = time.perf_counter() - started
+                        route.latency.record(elapsed)
+                        winner = route, task.result(), elapsed
+                        if route is not routes[0]:
+                            route.health.hedge_wins += 1
+                    else:
+                        # Answered in the same instant as the winner
+                        _close_unused(task)
+                if winner is not None:
+                    answered = True
+                    return winner
+                if not pending and launched < len(routes):
+                    launch()
+            raise error
+        finally:
+            for task, (route, started) in pending.items():
+                task.cancel()
+                # It may have answered already, with a stream that still needs closing
+                task.add_done_callback(_close_unused)
+                elapsed = time.perf_counter() - started
+                if answered:
+                    # Lost the race, so it would have taken at least this long; keeping it
+                    # stops hedging from hiding the slow tail the deadline is based on
+                    route.latency.record(elapsed)
+                route.health.abandoned(elapsed)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        async def attempt(route: ProviderRoute):
+            return await route.model.ainvoke(messages, stop=stop, **kwargs)
+
+        route, message, elapsed = await self._race(attempt)
+        route.health.succeeded(elapsed)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async def attempt(route: ProviderRoute):
+            # Wait for actual text: some providers open with an empty, role-only chunk
+            stream = route.model.astream(messages, stop=stop, **kwargs)
+            head = []
+            async for chunk in stream:
+                head.append(chunk)
+                if chunk.content:
+                    break
+            return stream, head
+
+        route, (stream, head), elapsed = await self._race(attempt)
+        failed = False
+        try:
+            async for chunk in _chain(head, stream):
+                generation = ChatGenerationChunk(message=chunk)
+                if run_manager is not None:
+                    await run_manager.on_llm_new_token(chunk.content, chunk=generation)
+                yield generation
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # One outcome per call: judged by its first token unless the answer broke off
+            if failed:
+                route.health.failed()
+            else:
+                route.health.succeeded(elapsed)
+            await stream.aclose()
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        # Synchronous calls are not hedged; they go to the preferred provider
+        message = self._candidates()[0].model.invoke(messages, stop=stop, **kwargs)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+def stats() -> Dict[str, object]:
+    return {name: health.as_dict() for name, health in _health.items()}
@@ -1,16 +1,47 @@
 import io
-import os
 import json
-import base64
-from dotenv import load_dotenv
+import logging
+from typing import AsyncIterator, Coroutine, Optional
 from fastapi import FastAPI, WebSocket
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
-from agents import process_user_query
-# Load environment variables from .env file
-load_dotenv()
+import config
+import timing
+import metrics
+import llm_clients
+from stt import create_stt_backend
+from tts import create_tts_backend
+from tts_pipeline import SpeechPipeline
+from text_deltas import TextDeltaCoalescer
+from tts_cache import create_tts_cache
+from protocol import ClientConnection
+from stt_stream import StreamingTranscription
+from audio_preprocess import prepare_for_transcription, preprocess_stats
+from admission import create_admission_controller
+from history import history_stats
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# Select the agent backend that answers every turn
+if config.AGENT_BACKEND == "non_stream":
+    import non_stream_agent as agent_backend
+elif config.AGENT_BACKEND == "stream":
+    import agents as agent_backend
+else:
+    raise ValueError(f"Unknown AGENT_BACKEND {config.AGENT_BACKEND!r}, expected 'stream' or 'non_stream'")
+
+logger = logging.getLogger(__name__)
+
+# Speech-to-text engine; a local one loads its model in worker processes at startup
+stt = create_stt_backend()
+
+# Text-to-speech engine; a local one loads its voice in worker processes at startup
+tts = create_tts_backend()
+
+# Repeated sentences are served from the cache instead of calling TTS again
+tts_cache = create_tts_cache(tts)
+synthesize = tts_cache.synthesize if tts_cache is not None else tts.synthesize
+
+# Bounds the turns answered at once; extra turns queue, then are refused as busy
+admission = create_admission_controller()
 
 app = FastAPI()
 
@@ -23,71 +54,150 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-async def process_audio_message(audio_data: bytes, websocket: WebSocket):
+@app.on_event("startup")
+async def start_speech_backends():
+    await stt.start()
+    await tts.start()
+
+@app.on_event("shutdown")
+def stop_speech_backends():
+    stt.close()
+    tts.close()
+
+def admitted(work: Coroutine, conn: ClientConnection) -> Coroutine:
+    """Wrap a turn so it only runs once the admission controller gives it a slot"""
+    if admission is None:
+        return work
+    return admission.run(work, conn.send_queued, conn.send_busy)
+
+async def reject_audio(conn: ClientConnection, size: int):
+    logger.warning(f"Rejected {size} bytes of audio from {conn.session_id} (limit {config.MAX_AUDIO_BYTES})")
+    await conn.send_json({
+        "type": "error",
+        "message": f"Recording too long: at most {config.MAX_AUDIO_BYTES} bytes of audio are accepted"
+    })
+
+async def generate_response(text: str, session_id: str) -> AsyncIterator[str]:
+    """Yield the orchestrator's answer, token by token when the backend streams"""
+    if config.AGENT_BACKEND == "non_stream":
+        yield await agent_backend.process_user_query(text, session_id)
+    else:
+        async for chunk in agent_backend.process_user_query(text, session_id):
+            yield chunk
+
+async def transcribe_speech(audio_file: io.BytesIO) -> str:
+    """Transcribe a clip after trimming its silence; clips without speech give an empty transcript"""
+    if not config.AUDIO_PREPROCESS:
+        return await stt.transcribe(audio_file)
+    with timing.stage("preprocess"):
+        prepared = await prepare_for_transcription(audio_file.getvalue(), audio_file.name)
+    logger.info(
+        f"Audio preprocessing: {prepared.original_bytes} -> {prepared.sent_bytes} bytes, "
+        f"{prepared.original_seconds:.2f} -> {prepared.sent_seconds:.2f} s ({json.dumps(prepared.savings())})"
+    )
+    if not prepared.has_speech:
+        return ""
+    return await stt.transcribe(prepared.as_file())
+
+async def process_audio_message(audio_data: bytes, conn: ClientConnection):
+    turn = timing.start_turn("audio")
     try:
-        # Convert bytes to file-like object
-        audio_file = io.BytesIO(audio_data)
-        audio_file.name = "audio.webm"
-        
-        # 1. Transcribe audio using Whisper
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            response_format="text"
-        )
-        
-        print(f"Transcription: {transcript}")
+        with metrics.track_turn(turn):
+            # Convert bytes to file-like object
+            audio_file = io.BytesIO(audio_data)
+            audio_file.name = "audio.webm"
+            
+            # 1. Transcribe audio using Whisper
+            transcript = await transcribe_speech(audio_file)
+            
+            await respond_to_transcript(transcript, conn, turn)
         
-        # Send transcription back immediately
-        await websocket.send_json({
+    except Exception as e:
+        print(f"Error processing audio: {str(e)}")
+        await conn.send_json({
+            "type": "error",
+            "message": str(e)
+        })
+
+async def respond_to_transcript(transcript: str, conn: ClientConnection, turn: timing.TurnTimer):
+    if not transcript.strip():
+        # Nothing was said; don't run the agents on an empty turn
+        turn.outcome = "no_speech"
+        await conn.send_json({"type": "no_speech"})
+        return
+
+    print(f"Transcription: {transcript}")
+    
+    # Send transcription back immediately
+    await conn.send_json({
+        "type": "transcription",
+        "text": transcript
+    })
+    
+    await process_text_message(transcript, conn, turn)
+
+def start_audio_stream(message: dict, conn: ClientConnection):
+    """Begin a chunked utterance; binary frames until audio_end belong to it"""
+    if conn.audio_stream is not None:
+        conn.audio_stream.cancel()
+    conn.discarding_audio = False
+
+    async def send_partial(text: str):
+        await conn.send_json({
             "type": "transcription",
-            "text": transcript
+            "text": text,
+            "partial": True
         })
-        
-        await process_text_message(transcript, websocket)
-        
+
+    conn.audio_stream = StreamingTranscription(
+        transcribe_speech,
+        send_partial,
+        message.get("format", "webm"),
+        partials_allowed=lambda: admission is None or not admission.saturated
+    )
+
+async def finish_audio_stream(stream: StreamingTranscription, conn: ClientConnection):
+    turn = timing.start_turn("audio")
+    try:
+        with metrics.track_turn(turn):
+            logger.info(f"Audio stream ended after {stream.buffer.chunks} chunks ({len(stream.buffer)} bytes)")
+            transcript = await stream.finish()
+            await respond_to_transcript(transcript, conn, turn)
     except Exception as e:
         print(f"Error processing audio: {str(e)}")
-        await websocket.send_json({
+        await conn.send_json({
             "type": "error",
             "message": str(e)
         })
 
-async def process_text_message(text: str, websocket: WebSocket):
+async def process_text_message(text: str, conn: ClientConnection, turn: Optional[timing.TurnTimer] = None):
+    turn = turn or timing.start_turn("text")
     try:
-        # Get chat response
-        chat_response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": text}]
-        )
-        
-        ai_text = chat_response.choices[0].message.content
-        #print(f"AI response: {ai_text}")
-        from non_stream_agent import process_user_query
-        print(process_user_query)
-        ai_text  = process_user_query(ai_text)
-        ai_text = chat_response.choices[0].message.content
-
-        # Generate speech from AI response
-        tts_response = client.audio.speech.create(
-            model="tts-1",
-            voice="alloy",
-            input=ai_text
-        )
-        
-        # Convert audio to base64
-        audio_base64 = base64.b64encode(tts_response.content).decode('utf-8')
-        
-        # Send AI response and audio back
-        await websocket.send_json({
-            "type": "ai_response",
-            "text": ai_text,
-            "audio": audio_base64
-        })
+        with metrics.track_turn(turn):
+            # Stream the agent response and speak it sentence by sentence
+            tokens = generate_response(text, conn.session_id)
+            if config.TEXT_DELTAS:
+                # Show the text as it is generated, ahead of its audio
+                tokens = TextDeltaCoalescer(conn.send_text_delta).tap(tokens)
+            pipeline = SpeechPipeline(synthesize)
+            
+            async for seq, sentence, audio in pipeline.run(tokens):
+                # Send each audio chunk as soon as it is ready
+                turn.mark("first_audio")
+                await conn.send_audio_chunk(seq, sentence, audio)
+            
+            # Send the complete AI response text once generation is done
+            timings = turn.summary()
+            logger.info(f"Turn latency breakdown: {json.dumps(timings)}")
+            await conn.send_json({
+                "type": "ai_response",
+                "text": pipeline.text,
+                "timings": timings
+            })
         
     except Exception as e:
         print(f"Error processing text: {str(e)}")
-        await websocket.send_json({
+        await conn.send_json({
             "type": "error",
             "message": str(e)
         })
@@ -95,27 +205,93 @@ async def process_text_message(text: str, websocket: WebSocket):
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    conn = ClientConnection.from_websocket(websocket)
     try:
+        await conn.send_session_info(tts.format_info())
+
         while True:
-            # Receive data from client
+            # Receive data from client; turns run in their own task so this loop
+            # stays free to notice interruptions
             data = await websocket.receive()
+            if data["type"] == "websocket.disconnect":
+                break
             
             if "bytes" in data:
-                # Handle audio data
-                await process_audio_message(data["bytes"], websocket)
+                if conn.discarding_audio:
+                    # Rest of an utterance already rejected as too long
+                    continue
+                if conn.audio_stream is not None:
+                    # Chunk of an utterance being streamed
+                    size = len(conn.audio_stream.buffer) + len(data["bytes"])
+                    if size > config.MAX_AUDIO_BYTES:
+                        conn.audio_stream.cancel()
+                        conn.audio_stream = None
+                        conn.discarding_audio = True
+                        await reject_audio(conn, size)
+                    else:
+                        conn.audio_stream.add_chunk(data["bytes"])
+                elif len(data["bytes"]) > config.MAX_AUDIO_BYTES:
+                    await reject_audio(conn, len(data["bytes"]))
+                else:
+                    # Whole utterance uploaded at once
+                    await conn.start_turn(admitted(process_audio_message(data["bytes"], conn), conn))
             elif "text" in data:
                 # Handle text message
                 message = json.loads(data["text"])
                 if message["type"] == "text_message":
-                    await process_text_message(message["text"], websocket)
+                    await conn.start_turn(admitted(process_text_message(message["text"], conn), conn))
+                elif message["type"] == "audio_start":
+                    # The student started speaking again: stop the answer right away
+                    await conn.cancel_turn()
+                    start_audio_stream(message, conn)
+                elif message["type"] == "audio_pause" and conn.audio_stream is not None:
+                    conn.audio_stream.pause()
+                elif message["type"] == "audio_end" and conn.discarding_audio:
+                    conn.discarding_audio = False
+                elif message["type"] == "audio_end" and conn.audio_stream is not None:
+                    stream, conn.audio_stream = conn.audio_stream, None
+                    await conn.start_turn(admitted(finish_audio_stream(stream, conn), conn))
+                elif message["type"] == "cancel":
+                    await conn.cancel_turn(acknowledge_idle=True)
                 
     except Exception as e:
         print(f"WebSocket error: {str(e)}")
+    finally:
+        if conn.turn_task is not None:
+            conn.turn_task.cancel()
+        if conn.audio_stream is not None:
+            conn.audio_stream.cancel()
+        # Anonymous sessions cannot be resumed, so free them with the connection
+        if conn.user_id is None:
+            agent_backend.sessions.discard(conn.session_id)
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Per-turn latency histograms in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def stats():
+    return {
+        "sessions": agent_backend.sessions.stats(),
+        "intent_router": agent_backend.intent_router.stats(),
+        "llm_clients": llm_clients.stats(),
+        "history": history_stats.as_dict() if agent_backend.history_store is not None else None,
+        "admission": admission.stats() if admission is not None else None,
+        "stt": stt.stats(),
+        "tts": tts.stats(),
+        "audio_preprocess": preprocess_stats.as_dict(),
+        "tts_cache": tts_cache.stats() if tts_cache is not None else None,
+        "semantic_cache": agent_backend.semantic_cache.stats() if agent_backend.semantic_cache is not None else None
+    }
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if config.WORKERS > 1 and config.HISTORY_BACKEND != "redis":
+        logger.warning("Running several workers without HISTORY_BACKEND=redis: sessions are not shared between them")
+    # Workers are separate processes, so uvicorn needs the app's import string
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=config.WORKERS)
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+from langchain.memory import ConversationBufferMemory
+from langchain.schema import AIMessage, BaseMessage, HumanMessage, SystemMessage
+import config
+import timing
+
+logger = logging.getLogger(__name__)
+
+Summarizer = Callable[[str, List[BaseMessage]], Awaitable[str]]
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token for English text)"""
+    return len(text) // 4 + 1
+
+SUMMARY_PROMPT = """You maintain a running summary of a tutoring conversation with a student.
+Update the summary with the new messages below. Keep facts about the student, the topics covered,
+open questions and agreed goals. Answer with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+async def summarize_with_llm(summary: str, messages: List[BaseMessage]) -> str:
+    """Fold messages into the running summary using the shared non-streaming LLM"""
+    # Imported here to keep this module free of provider setup at import time
+    from llm_clients import get_chat_model
+    llm = get_chat_model(temperature=0.3, streaming=False)
+    transcript = "\n".join(
+        f"{'Student' if msg.type == 'human' else 'Tutor'}: {msg.content}" for msg in messages
+    )
+    prompt = SUMMARY_PROMPT.format(
+        max_words=config.MEMORY_SUMMARY_TOKENS * 3 // 4,
+        summary=summary or "(empty)",
+        messages=transcript
+    )
+    response = await llm.ainvoke([{"role": "user", "content": prompt}])
+    return response.content.strip()
+
+class BoundedConversationMemory:
+    """Conversation memory whose prompt size stays flat however long the session runs.
+
+    The most recent messages are kept verbatim in a ring buffer within
+    ``token_budget``. Older messages are folded into a running summary by a
+    background task, so summarization never delays a turn; until it finishes,
+    the evicted messages are simply absent from the prompt.
+
+    Exposes the parts of ``ConversationBufferMemory`` the agents use
+    (``chat_memory.messages``, ``add_user_message``, ``add_ai_message``).
+    """
+
+    def __init__(self, token_budget: int, max_messages: int, summarizer: Optional[Summarizer] = None, summary_tokens: int = 0):
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens if summarizer else 0
+        self.summarizer = summarizer
+        self.recent: deque = deque(maxlen=max_messages)
+        self.recent_tokens = 0
+        self.summary = ""
+        self._evicted: List[BaseMessage] = []
+        self._summary_task: Optional[asyncio.Task] = None
+
+    @property
+    def chat_memory(self) -> "BoundedConversationMemory":
+        return self
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        messages = list(self.recent)
+        if self.summary:
+            messages.insert(0, SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}"))
+        return messages
+
+    def add_user_message(self, content: str):
+        self._add(HumanMessage(content=content))
+
+    def add_ai_message(self, content: str):
+        self._add(AIMessage(content=content))
+
+    def clear(self):
+        self.recent.clear()
+        self.recent_tokens = 0
+        self.summary = ""
+        self._evicted = []
+
+    def restore(self, messages: List[BaseMessage], summary: str = ""):
+        """Replace the contents with stored messages and summary, without summarizing anything"""
+        self.clear()
+        self.summary = summary
+        for message in messages[-self.recent.maxlen:]:
+            self.recent.append(message)
+            self.recent_tokens += estimate_tokens(message.content)
+        while self.recent_tokens > self.token_budget - self.summary_tokens and len(self.recent) > 2:
+            self.recent_tokens -= estimate_tokens(self.recent.popleft().content)
+
+    def _add(self, message: BaseMessage):
+        if len(self.recent) == self.recent.maxlen:
+            self._evict()
+        self.recent.append(message)
+        self.recent_tokens += estimate_tokens(message.content)
+        # Always keep the latest exchange, even if it alone exceeds the budget
+        while self.recent_tokens > self.token_budget - self.summary_tokens and len(self.recent) > 2:
+            self._evict()
+        if self._evicted:
+            self._schedule_summary()
+
+    def _evict(self):
+        message = self.recent.popleft()
+        self.recent_tokens -= estimate_tokens(message.content)
+        if self.summarizer:
+            self._evicted.append(message)
+
+    def _schedule_summary(self):
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+        try:
+            self._summary_task = asyncio.get_running_loop().create_task(self._fold_evicted())
+        except RuntimeError:
+            logger.warning("No running event loop, dropping evicted messages without summarizing")
+            self._evicted = []
+
+    async def _fold_evicted(self):
+        # Runs outside the turn that triggered it
+        timing.current_turn.set(None)
+        while self._evicted:
+            batch, self._evicted = self._evicted, []
+            try:
+                summary = await self.summarizer(self.summary, batch)
+            except Exception as e:
+                logger.error(f"Failed to update conversation summary: {str(e)}")
+                continue
+            # Hard cap in case the summarizer ignores the requested length
+            self.summary = summary[:self.summary_tokens * 4]
+            logger.info(f"Folded {len(batch)} messages into the conversation summary")
+
+def create_memory(summarize: bool = True):
+    """Conversation memory for an agent, according to MEMORY_MODE"""
+    if config.MEMORY_MODE == "buffer":
+        return ConversationBufferMemory(
+            memory_key="chat_history",
+            return_messages=True
+        )
+    return BoundedConversationMemory(
+        token_budget=config.MEMORY_TOKEN_BUDGET,
+        max_messages=config.MEMORY_MAX_MESSAGES,
+        summarizer=summarize_with_llm if summarize else None,
+        summary_tokens=config.MEMORY_SUMMARY_TOKENS
+    )
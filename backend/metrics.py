@@ -0,0 +1,110 @@
+import asyncio
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+from timing import TurnTimer
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """Latency distribution per combination of label values.
+
+    Observing is a bisect and two additions; cumulative bucket counts are only
+    computed when the histogram is rendered.
+    """
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, seconds: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, seconds)] += 1
+        series[1] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labels, values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.series: Dict[Tuple[str, ...], int] = {}
+
+    def inc(self, *label_values: str):
+        self.series[label_values] = self.series.get(label_values, 0) + 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for values, count in sorted(self.series.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {count}")
+        return lines
+
+turns = Counter("voice_turns_total", "Conversation turns by kind and outcome", ["kind", "outcome"])
+turn_duration = Histogram("voice_turn_duration_seconds", "Wall time of a whole turn", ["kind", "agent"])
+turn_stage = Histogram("voice_turn_stage_seconds", "Time spent in a stage during one turn", ["stage", "agent"])
+turn_milestone = Histogram("voice_turn_milestone_seconds", "Time from the start of a turn until a milestone", ["milestone", "agent"])
+
+_registry = [turns, turn_duration, turn_stage, turn_milestone]
+
+def observe_turn(turn: TurnTimer):
+    """Fold a finished turn's stages and marks into the histograms, once per turn"""
+    if turn.observed:
+        return
+    turn.observed = True
+    agent = turn.agent or "none"
+    turns.inc(turn.kind, turn.outcome)
+    if turn.outcome == "ok":
+        turn_duration.observe(turn.elapsed(), turn.kind, agent)
+    for name, seconds in turn.stages.items():
+        turn_stage.observe(seconds, name, agent)
+    for name, seconds in turn.marks.items():
+        turn_milestone.observe(seconds, name, agent)
+
+@contextmanager
+def track_turn(turn: TurnTimer):
+    """Record turn in the metrics when the block exits, noting whether it failed or was cancelled"""
+    try:
+        yield turn
+    except asyncio.CancelledError:
+        turn.outcome = "cancelled"
+        raise
+    except Exception:
+        turn.outcome = "error"
+        raise
+    finally:
+        observe_turn(turn)
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, TypeVar
+from openai import AsyncOpenAI
+import config
+import timing
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# One async client per process so every websocket shares the same connection pool
+client = AsyncOpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL)
+
+# Caps the number of concurrent OpenAI requests across all connections
+_limiter = asyncio.Semaphore(config.OPENAI_MAX_CONCURRENCY)
+
+async def call_openai(stage: str, request: Callable[[], Awaitable[T]], timeout: float) -> T:
+    """Run an OpenAI request under the process-wide concurrency limit and a stage timeout"""
+    async with _limiter:
+        try:
+            with timing.stage(stage):
+                return await asyncio.wait_for(request(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"OpenAI {stage} request timed out after {timeout}s")
+            raise TimeoutError(f"{stage} timed out after {timeout}s")
+
+async def transcribe(audio_file) -> str:
+    """Transcribe an audio file-like object with Whisper"""
+    return await call_openai(
+        "transcription",
+        lambda: client.audio.transcriptions.create(
+            model="whisper-1",
+            file=audio_file,
+            response_format="text"
+        ),
+        config.STT_TIMEOUT
+    )
+
+async def embed_texts(texts: List[str], model: str = "text-embedding-3-small", dimensions: Optional[int] = None) -> List[List[float]]:
+    """Embed a batch of texts in one request"""
+    extra = {"dimensions": dimensions} if dimensions else {}
+    response = await call_openai(
+        "embedding",
+        lambda: client.embeddings.create(model=model, input=texts, **extra),
+        config.EMBEDDING_TIMEOUT
+    )
+    return [item.embedding for item in response.data]
+
+async def synthesize_speech(text: str, model: str = "tts-1", voice: str = "alloy", response_format: str = "mp3") -> bytes:
+    """Generate speech for text and return the audio bytes (mp3, Ogg Opus or 24 kHz 16-bit PCM)"""
+    response = await call_openai(
+        "tts",
+        lambda: client.audio.speech.create(model=model, voice=voice, input=text, response_format=response_format),
+        config.TTS_TIMEOUT
+    )
+    return response.content
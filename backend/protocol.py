@@ -0,0 +1,114 @@
+import asyncio
+import base64
+import logging
+import struct
+import uuid
+from typing import Any, Coroutine, Dict, Optional
+from fastapi import WebSocket
+import timing
+
+logger = logging.getLogger(__name__)
+
+# How audio responses are delivered to a client:
+#   json   - base64 audio inside the ai_audio_chunk JSON message (original protocol)
+#   binary - small JSON metadata message followed by a raw binary frame
+AUDIO_TRANSPORTS = ("json", "binary")
+
+# Binary audio frames start with the big-endian sequence id of their metadata message
+AUDIO_FRAME_HEADER = struct.Struct(">I")
+
+class ClientConnection:
+    """A /ws client together with the protocol options negotiated on connect"""
+
+    def __init__(self, websocket: WebSocket, audio_transport: str = "json", user_id: Optional[str] = None):
+        self.websocket = websocket
+        self.audio_transport = audio_transport
+        self.user_id = user_id
+        # Agent sessions follow the user when known, otherwise this connection
+        self.session_id = f"user:{user_id}" if user_id else f"conn:{uuid.uuid4().hex}"
+        # Utterance being streamed between audio_start and audio_end, if any
+        self.audio_stream = None
+        # Set when a streamed utterance grew too large; its remaining chunks are dropped
+        self.discarding_audio = False
+        # The turn being answered; the receive loop never waits for it
+        self.turn_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_websocket(cls, websocket: WebSocket) -> "ClientConnection":
+        """Negotiate protocol options from the ?audio_transport= and ?user_id= query parameters"""
+        requested = websocket.query_params.get("audio_transport", "json")
+        if requested not in AUDIO_TRANSPORTS:
+            logger.warning(f"Unknown audio transport {requested!r}, using json")
+            requested = "json"
+        return cls(websocket, audio_transport=requested, user_id=websocket.query_params.get("user_id") or None)
+
+    async def send_session_info(self, audio_format: Dict[str, Any]):
+        """Tell the client which protocol options are in effect and how response audio is encoded"""
+        await self.send_json({
+            "type": "session",
+            "session_id": self.session_id,
+            "audio_transport": self.audio_transport,
+            "audio_format": audio_format
+        })
+
+    async def cancel_turn(self, acknowledge_idle: bool = False) -> bool:
+        """Abort the turn in progress (generation and TTS) and tell the client; False if idle.
+
+        With acknowledge_idle (a cancel the client asked for) the client is
+        answered even when no turn was running, so it never waits for a
+        "cancelled" that isn't coming.
+        """
+        task = self.turn_task
+        if task is None or task.done():
+            if acknowledge_idle:
+                await self.send_json({"type": "cancelled", "idle": True})
+            return False
+        task.cancel()
+        # Cancellation unwinds the LLM stream and synthesis tasks; wait for that to finish
+        await asyncio.gather(task, return_exceptions=True)
+        logger.info(f"Cancelled the turn in progress for {self.session_id}")
+        await self.send_json({"type": "cancelled"})
+        return True
+
+    async def start_turn(self, work: Coroutine):
+        """Run work as the connection's turn, interrupting the previous one if it is still running"""
+        await self.cancel_turn()
+        self.turn_task = asyncio.create_task(work)
+
+    async def send_text_delta(self, text: str):
+        """Send the next piece of the answer text while it is being generated"""
+        await self.send_json({"type": "ai_text_delta", "text": text})
+
+    async def send_queued(self, position: int):
+        """Tell the client its turn is waiting for a free slot"""
+        await self.send_json({"type": "queued", "position": position})
+
+    async def send_busy(self):
+        """Tell the client its turn was refused because the server is saturated"""
+        await self.send_json({"type": "busy"})
+
+    async def send_json(self, message: Dict[str, Any]):
+        with timing.stage("ws_send"):
+            await self.websocket.send_json(message)
+
+    async def send_audio_chunk(self, seq: int, text: str, audio: bytes):
+        """Send one chunk of response audio using the negotiated transport"""
+        with timing.stage("ws_send"):
+            await self._send_audio_chunk(seq, text, audio)
+
+    async def _send_audio_chunk(self, seq: int, text: str, audio: bytes):
+        if self.audio_transport == "binary":
+            await self.websocket.send_json({
+                "type": "ai_audio_chunk",
+                "seq": seq,
+                "text": text,
+                "bytes": len(audio)
+            })
+            await self.websocket.send_bytes(AUDIO_FRAME_HEADER.pack(seq) + audio)
+        else:
+            await self.websocket.send_json({
+                "type": "ai_audio_chunk",
+                "seq": seq,
+                "text": text,
+                "audio": base64.b64encode(audio).decode('utf-8')
+            })
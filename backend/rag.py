@@ -1,17 +1,287 @@
-from qdrant_client import QdrantClient
+"""Retrieval of curriculum passages from a local, memory-mapped vector index.
 
-# Replace with your Qdrant server details and credentials
-url = "yhttps://c6fd972a-3f78-4874-9a48-125d4b2aa249.us-east4-0.gcp.cloud.qdrant.iol"
-port = 6333  # Default Qdrant port
-#api_key = "your_api_key"
+An index is a directory holding:
+    vectors.npy     float32 matrix of unit-length passage embeddings
+    subjects.npy    per-passage subject id (the agent a passage belongs to)
+    offsets.npy     byte offset of each passage in passages.jsonl
+    passages.jsonl  one {"text", "source", "subject"} object per line
+    meta.json       embedder backend and dimension, subject names, passage count
 
-# Initialize the Qdrant client with API key authentication
-client = QdrantClient(url=url, port=port)#, api_key=api_key)
+Both the matrix and the passage file are memory-mapped, so opening an index is
+instant and several worker processes share the same pages.
 
-# Get the list of collections
-collections = client.get_collections().collections
+    python rag.py ingest docs/maths --subject maths_science
+    python rag.py ingest docs/history docs/english --subject language_social --append
+    python rag.py search "why does light bend in water" -k 3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+import numpy as np
+import config
+from embeddings import create_embedder, get_embedder
 
-# Print the collection names
-print("List of Qdrant collections:")
-for collection in collections:
-    print(f"- {collection.name}")
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = (".txt", ".md")
+
+class Passage(NamedTuple):
+    text: str
+    source: str
+    subject: Optional[str]
+    score: float
+
+def chunk_text(text: str, max_chars: int) -> List[str]:
+    """Split text into passages of whole paragraphs, each at most about max_chars long"""
+    chunks: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        # Paragraphs longer than a passage are split at sentence boundaries
+        pieces = [paragraph] if len(paragraph) <= max_chars else re.split(r"(?<=[.!?])\s+", paragraph)
+        for piece in pieces:
+            # Markdown headings start a new passage
+            if current and (piece.startswith("#") or len(current) + len(piece) + 1 > max_chars):
+                chunks.append(current)
+                current = ""
+            current = f"{current} {piece}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+def iter_documents(paths: Sequence[str]) -> Iterator[str]:
+    """Text and Markdown files under the given files and directories"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(TEXT_EXTENSIONS):
+                        yield os.path.join(root, name)
+        elif path.endswith(TEXT_EXTENSIONS):
+            yield path
+
+class PassageIndex:
+    """Read-only view of an index directory with exact top-k cosine search"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        self.subject_ids = np.load(os.path.join(directory, "subjects.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        self.subjects: List[str] = self.meta["subjects"]
+        self._file = open(os.path.join(directory, "passages.jsonl"), "rb")
+        self._passages = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if len(self) else b""
+
+    def __len__(self) -> int:
+        return int(self.meta["count"])
+
+    def close(self):
+        if isinstance(self._passages, mmap.mmap):
+            self._passages.close()
+        self._file.close()
+
+    def _passage(self, row: int, score: float) -> Passage:
+        start = int(self.offsets[row])
+        end = self._passages.find(b"\n", start)
+        record = json.loads(self._passages[start:end if end >= 0 else len(self._passages)])
+        return Passage(record["text"], record["source"], record.get("subject"), score)
+
+    def _top(self, scores: np.ndarray, k: int, min_score: float) -> List[Passage]:
+        k = min(k, len(scores))
+        # Partial sort: only the k best rows are ordered
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self._passage(int(row), float(scores[row])) for row in top if scores[row] >= min_score]
+
+    def _subject_mask(self, subject: str) -> np.ndarray:
+        allowed = [self.subjects.index(name) for name in (subject, "") if name in self.subjects]
+        return np.isin(self.subject_ids, allowed)
+
+    def search(self, query_vector: np.ndarray, k: int, subject: Optional[str] = None, min_score: float = 0.0) -> List[Passage]:
+        """The k passages most similar to query_vector, restricted to subject and untagged passages"""
+        if len(self) == 0:
+            return []
+        scores = np.asarray(self.vectors @ query_vector.astype(np.float32))
+        if subject is not None:
+            scores[~self._subject_mask(subject)] = -np.inf
+        return self._top(scores, k, min_score)
+
+    def search_subjects(self, query_vector: np.ndarray, k: int, subjects: Sequence[str], min_score: float = 0.0) -> Dict[str, List[Passage]]:
+        """Top k passages for each subject, scanning the matrix only once"""
+        if len(self) == 0:
+            return {subject: [] for subject in subjects}
+        scores = np.asarray(self.vectors @ query_vector.astype(np.float32))
+        return {
+            subject: self._top(np.where(self._subject_mask(subject), scores, -np.inf), k, min_score)
+            for subject in subjects
+        }
+
+async def build_index(
+    directory: str,
+    passages: Sequence[Dict[str, str]],
+    embedder,
+    batch_size: int = 64,
+    embedded: Optional[np.ndarray] = None
+) -> int:
+    """Embed passages in batches and write them as the index in directory; returns the passage count.
+
+    Each passage is a dict with "text", "source" and optionally "subject".
+    ``embedded`` holds vectors for the first passages when they are already
+    known (appending to an index). The index is written next to the old one
+    and swapped in, so running readers keep their mapped files.
+    """
+    building = f"{directory.rstrip(os.sep)}.building"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    count = len(passages)
+    vectors = np.lib.format.open_memmap(
+        os.path.join(building, "vectors.npy"), mode="w+", dtype=np.float32, shape=(count, embedder.dim)
+    )
+    done = 0
+    if embedded is not None:
+        done = len(embedded)
+        vectors[:done] = embedded
+    for start in range(done, count, batch_size):
+        batch = passages[start:start + batch_size]
+        vectors[start:start + len(batch)] = await embedder.embed([passage["text"] for passage in batch])
+        logger.info(f"Embedded {start + len(batch)}/{count} passages")
+    vectors.flush()
+    del vectors
+
+    subjects = [""] + sorted({passage.get("subject") or "" for passage in passages} - {""})
+    np.save(os.path.join(building, "subjects.npy"), np.array(
+        [subjects.index(passage.get("subject") or "") for passage in passages], dtype=np.int16
+    ))
+    offsets = np.zeros(count, dtype=np.int64)
+    with open(os.path.join(building, "passages.jsonl"), "wb") as f:
+        for row, passage in enumerate(passages):
+            offsets[row] = f.tell()
+            record = {"text": passage["text"], "source": passage["source"], "subject": passage.get("subject") or None}
+            f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+    np.save(os.path.join(building, "offsets.npy"), offsets)
+    with open(os.path.join(building, "meta.json"), "w") as f:
+        json.dump({
+            "embedding_backend": config.EMBEDDING_BACKEND,
+            "embedding_model": config.EMBEDDING_MODEL,
+            "dim": embedder.dim,
+            "subjects": subjects,
+            "count": count
+        }, f, indent=2)
+
+    previous = f"{directory.rstrip(os.sep)}.previous"
+    if os.path.exists(directory):
+        shutil.rmtree(previous, ignore_errors=True)
+        os.rename(directory, previous)
+    os.rename(building, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+    return count
+
+class Retriever:
+    """Embeds a query and searches the index for curriculum passages"""
+
+    def __init__(self, index: PassageIndex, embedder, k: int, min_score: float):
+        self.index = index
+        self.embedder = embedder
+        self.k = k
+        self.min_score = min_score
+
+    async def retrieve(self, query: str, subject: Optional[str] = None, k: Optional[int] = None) -> List[Passage]:
+        query_vector = (await self.embedder.embed([query]))[0]
+        # Large indexes take milliseconds to scan; keep the event loop free meanwhile
+        return await asyncio.to_thread(self.index.search, query_vector, k or self.k, subject, self.min_score)
+
+    async def search_subjects(self, query_vector: np.ndarray, subjects: Sequence[str]) -> Dict[str, List[Passage]]:
+        """Passages for every subject at once, for when the answering agent is not known yet"""
+        return await asyncio.to_thread(self.index.search_subjects, query_vector, self.k, subjects, self.min_score)
+
+_retriever: Optional[Retriever] = None
+_retriever_loaded = False
+
+def get_retriever() -> Optional[Retriever]:
+    """The shared retriever over RAG_INDEX_DIR, or None when RAG is off or no index was built"""
+    global _retriever, _retriever_loaded
+    if _retriever_loaded:
+        return _retriever
+    _retriever_loaded = True
+    if not config.RAG or not os.path.exists(os.path.join(config.RAG_INDEX_DIR, "meta.json")):
+        return None
+    index = PassageIndex(config.RAG_INDEX_DIR)
+    if index.meta["embedding_backend"] != config.EMBEDDING_BACKEND or index.meta["dim"] != config.EMBEDDING_DIM:
+        logger.error(
+            f"RAG index at {config.RAG_INDEX_DIR} was built with {index.meta['embedding_backend']} "
+            f"({index.meta['dim']} dimensions); rebuild it or change EMBEDDING_BACKEND. Retrieval disabled."
+        )
+        index.close()
+        return None
+    logger.info(f"Loaded RAG index with {len(index)} passages from {config.RAG_INDEX_DIR}")
+    _retriever = Retriever(index, get_embedder(), config.RAG_TOP_K, config.RAG_MIN_SCORE)
+    return _retriever
+
+def format_passages(passages: Sequence[Passage]) -> str:
+    """Passages as prompt text, numbered and labelled with their source"""
+    return "\n\n".join(f"[{i}] ({passage.source})\n{passage.text}" for i, passage in enumerate(passages, 1))
+
+async def ingest(args):
+    passages = []
+    for path in iter_documents(args.paths):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        for chunk in chunk_text(text, args.chunk_chars):
+            passages.append({"text": chunk, "source": os.path.relpath(path), "subject": args.subject})
+    embedded = None
+    if args.append and os.path.exists(os.path.join(args.index, "meta.json")):
+        # Keep the existing passages and their vectors; only new text is embedded
+        index = PassageIndex(args.index)
+        existing = [index._passage(row, 0.0) for row in range(len(index))]
+        embedded = np.array(index.vectors)
+        index.close()
+        passages = [{"text": p.text, "source": p.source, "subject": p.subject} for p in existing] + passages
+
+    started = time.perf_counter()
+    count = await build_index(args.index, passages, create_embedder(), args.batch_size, embedded)
+    print(f"Indexed {count} passages into {args.index} in {time.perf_counter() - started:.1f}s")
+
+async def search(args):
+    index = PassageIndex(args.index)
+    retriever = Retriever(index, create_embedder(), args.k, min_score=0.0)
+    started = time.perf_counter()
+    passages = await retriever.retrieve(args.query, subject=args.subject)
+    print(f"{len(passages)} passages in {(time.perf_counter() - started) * 1000:.1f} ms")
+    for passage in passages:
+        print(f"\n{passage.score:.3f} {passage.source} [{passage.subject or '-'}]\n{passage.text}")
+    index.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=config.RAG_INDEX_DIR, help="index directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="chunk, embed and index .txt/.md files")
+    ingest_parser.add_argument("paths", nargs="+")
+    ingest_parser.add_argument("--subject", help="agent the passages belong to (e.g. maths_science); untagged passages serve every agent")
+    ingest_parser.add_argument("--append", action="store_true", help="keep the passages already in the index")
+    ingest_parser.add_argument("--chunk-chars", type=int, default=config.RAG_CHUNK_CHARS)
+    ingest_parser.add_argument("--batch-size", type=int, default=config.RAG_BATCH_SIZE)
+
+    search_parser = commands.add_parser("search", help="show the top passages for a query")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-k", type=int, default=config.RAG_TOP_K)
+    search_parser.add_argument("--subject")
+
+    args = parser.parse_args()
+    asyncio.run(ingest(args) if args.command == "ingest" else search(args))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,148 @@
+import logging
+import re
+import time
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+import config
+from embeddings import get_embedder
+
+logger = logging.getLogger(__name__)
+
+class VectorIndex:
+    """Matrix of unit vectors searched with one matrix-vector product.
+
+    The matrix doubles as entries are added, up to ``capacity`` rows; after
+    that rows are overwritten round-robin, so the oldest entry is replaced.
+    Expired rows stay in place and are masked out of searches.
+    """
+
+    def __init__(self, dim: int, capacity: int, initial_rows: int = 64):
+        rows = min(initial_rows, capacity)
+        self.capacity = capacity
+        self.vectors = np.zeros((rows, dim), dtype=np.float32)
+        self.expires = np.zeros(rows, dtype=np.float64)
+        self.answers: List[Optional[str]] = [None] * rows
+        self._next = 0
+
+    def _grow(self):
+        rows = min(len(self.answers) * 2, self.capacity)
+        self.vectors = np.concatenate([self.vectors, np.zeros((rows - len(self.answers), self.vectors.shape[1]), dtype=np.float32)])
+        self.expires = np.concatenate([self.expires, np.zeros(rows - len(self.answers))])
+        self.answers.extend([None] * (rows - len(self.answers)))
+
+    def add(self, vector: np.ndarray, answer: str, expires_at: float):
+        if self._next == len(self.answers):
+            if len(self.answers) < self.capacity:
+                self._grow()
+            else:
+                self._next = 0
+        slot = self._next
+        self.vectors[slot] = vector
+        self.expires[slot] = expires_at
+        self.answers[slot] = answer
+        self._next = slot + 1
+
+    def search(self, vector: np.ndarray, now: float):
+        """Best live (similarity, answer), or None when the index has no live entries"""
+        scores = self.vectors @ vector
+        scores[self.expires <= now] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            return None
+        return float(scores[best]), self.answers[best]
+
+    def live(self, now: float) -> int:
+        return int(np.count_nonzero(self.expires > now))
+
+class CacheLookup(NamedTuple):
+    namespace: str
+    vector: np.ndarray
+    answer: Optional[str]
+    similarity: float
+
+class NamespaceStats:
+    def __init__(self):
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+
+class SemanticCache:
+    """Answers to earlier questions, served again for near-duplicate questions.
+
+    Entries live in separate namespaces (one per agent and grade bucket), so a
+    question only matches answers written by the same agent for students of a
+    similar level.
+    """
+
+    def __init__(self, embedder, threshold: float, ttl_seconds: float, max_entries: int):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.indexes: Dict[str, VectorIndex] = {}
+        self.namespace_stats: Dict[str, NamespaceStats] = {}
+
+    async def lookup(self, namespace: str, query: str, vector: Optional[np.ndarray] = None) -> CacheLookup:
+        """Find a cached answer for query; pass its embedding when it was already computed"""
+        if vector is None:
+            vector = (await self.embedder.embed([query]))[0]
+        stats = self.namespace_stats.setdefault(namespace, NamespaceStats())
+        stats.lookups += 1
+        index = self.indexes.get(namespace)
+        match = index.search(vector, time.time()) if index is not None else None
+        if match is not None and match[0] >= self.threshold:
+            stats.hits += 1
+            return CacheLookup(namespace, vector, match[1], match[0])
+        return CacheLookup(namespace, vector, None, match[0] if match else 0.0)
+
+    def store(self, lookup: CacheLookup, answer: str):
+        index = self.indexes.get(lookup.namespace)
+        if index is None:
+            index = self.indexes[lookup.namespace] = VectorIndex(len(lookup.vector), self.max_entries)
+        index.add(lookup.vector, answer, time.time() + self.ttl_seconds)
+        self.namespace_stats.setdefault(lookup.namespace, NamespaceStats()).stores += 1
+
+    def stats(self) -> Dict[str, object]:
+        now = time.time()
+        lookups = sum(stats.lookups for stats in self.namespace_stats.values())
+        hits = sum(stats.hits for stats in self.namespace_stats.values())
+        return {
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "namespaces": {
+                namespace: {
+                    "lookups": stats.lookups,
+                    "hits": stats.hits,
+                    "hit_rate": stats.hits / stats.lookups if stats.lookups else 0.0,
+                    "stores": stats.stores,
+                    "entries": self.indexes[namespace].live(now) if namespace in self.indexes else 0
+                }
+                for namespace, stats in self.namespace_stats.items()
+            }
+        }
+
+def grade_bucket(student_profile: Dict) -> str:
+    """Coarse school stage from the profile's grade, so answers are shared between similar levels"""
+    match = re.search(r"\d+", str(student_profile.get("grade", "")))
+    if match is None:
+        return "any"
+    grade = int(match.group())
+    if grade <= 5:
+        return "primary"
+    if grade <= 8:
+        return "middle"
+    if grade <= 10:
+        return "secondary"
+    return "senior"
+
+def create_semantic_cache() -> Optional[SemanticCache]:
+    """Semantic answer cache configured from the environment, or None when SEMANTIC_CACHE is off"""
+    if not config.SEMANTIC_CACHE:
+        return None
+    return SemanticCache(
+        get_embedder(),
+        threshold=config.SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds=config.SEMANTIC_CACHE_TTL,
+        max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES
+    )
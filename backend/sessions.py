@@ -0,0 +1,83 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SessionRegistry(Generic[T]):
+    """Keeps one long-lived object per session id.
+
+    Entries are kept in least-recently-used order, so expiring idle sessions
+    (older than ``ttl_seconds``) only has to look at the front of the map, and
+    the least recently used session is evicted once ``max_sessions`` is reached.
+    """
+
+    def __init__(self, factory: Callable[[], T], max_sessions: int, ttl_seconds: float):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def _expire_idle(self, now: float):
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used < self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self.expirations += 1
+            logger.info(f"Expired idle session {session_id}")
+
+    def get(self, session_id: str) -> T:
+        """Return the session's object, creating it on first use"""
+        now = time.monotonic()
+        self._expire_idle(now)
+        entry = self._sessions.get(session_id)
+        if entry is not None:
+            self.hits += 1
+            entry[1] = now
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+        self.misses += 1
+        value = self.factory()
+        self._sessions[session_id] = [value, now]
+        while len(self._sessions) > self.max_sessions:
+            evicted_id, _ = self._sessions.popitem(last=False)
+            self.evictions += 1
+            logger.info(f"Evicted least recently used session {evicted_id}")
+        return value
+
+    def peek(self, session_id: str) -> Optional[T]:
+        """Return the session's object if it is live, without touching its LRU position"""
+        entry = self._sessions.get(session_id)
+        return entry[0] if entry is not None else None
+
+    def discard(self, session_id: str):
+        """Drop a session, e.g. when its connection closes"""
+        self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "live": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+import config
+import timing
+import whisper_worker
+from openai_client import transcribe as transcribe_with_openai
+
+logger = logging.getLogger(__name__)
+
+class STTBackend(ABC):
+    """Turns an encoded audio clip (a named file-like object) into text"""
+
+    name = "base"
+
+    async def start(self):
+        """Prepare the backend before the first request (load and warm up models)"""
+
+    @abstractmethod
+    async def transcribe(self, audio_file) -> str:
+        ...
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": self.name}
+
+    def close(self):
+        pass
+
+class OpenAISTT(STTBackend):
+    """whisper-1 through the OpenAI API"""
+
+    name = "openai"
+
+    async def transcribe(self, audio_file) -> str:
+        return await transcribe_with_openai(audio_file)
+
+class LocalWhisperSTT(STTBackend):
+    """faster-whisper on the CPU, in a pool of worker processes.
+
+    Each worker loads the model once (int8 by default) and runs one clip at a
+    time, so inference neither holds the event loop's GIL nor blocks it, and
+    ``workers`` clips can be transcribed in parallel. ``start`` spawns every
+    worker and waits until each has loaded and warmed up its model.
+    """
+
+    name = "local"
+
+    def __init__(self, model: str, compute_type: str, workers: int, cpu_threads: int, language: str = "", beam_size: int = 1):
+        self.model = model
+        self.workers = workers
+        # Spawned rather than forked: the server process has threads and an event loop
+        context = multiprocessing.get_context("spawn")
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=whisper_worker.load_model,
+            initargs=(model, compute_type, cpu_threads, language, beam_size, context.Barrier(workers))
+        )
+        self.clips = 0
+        self.audio_seconds = 0.0
+        self.inference_seconds = 0.0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        logger.info(f"Loading local STT model {self.model} in {self.workers} worker processes")
+        try:
+            # One ready job per worker; each blocks until all workers have loaded the model
+            pids = await asyncio.gather(*[loop.run_in_executor(self.pool, whisper_worker.ready) for _ in range(self.workers)])
+        except BrokenProcessPool:
+            # The worker's own traceback (missing package, unknown model, ...) is on stderr
+            raise RuntimeError(f"Could not load local STT model {self.model!r}, see the worker error above") from None
+        logger.info(f"Local STT ready in processes {sorted(pids)}")
+
+    async def transcribe(self, audio_file) -> str:
+        loop = asyncio.get_running_loop()
+        with timing.stage("transcription"):
+            try:
+                text, audio_seconds, inference_seconds = await asyncio.wait_for(
+                    loop.run_in_executor(self.pool, whisper_worker.transcribe, audio_file.getvalue()),
+                    config.STT_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.error(f"Local transcription timed out after {config.STT_TIMEOUT}s")
+                raise TimeoutError(f"transcription timed out after {config.STT_TIMEOUT}s")
+        self.clips += 1
+        self.audio_seconds += audio_seconds
+        self.inference_seconds += inference_seconds
+        return text
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": self.name,
+            "model": self.model,
+            "workers": self.workers,
+            "clips": self.clips,
+            "audio_seconds": self.audio_seconds,
+            # Inference time per second of audio; below 1 is faster than real time
+            "real_time_factor": self.inference_seconds / self.audio_seconds if self.audio_seconds else None
+        }
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+def create_stt_backend(backend: Optional[str] = None) -> STTBackend:
+    """Speech-to-text backend configured from the environment (STT_BACKEND)"""
+    backend = backend or config.STT_BACKEND
+    if backend == "openai":
+        return OpenAISTT()
+    if backend == "local":
+        return LocalWhisperSTT(
+            model=config.STT_LOCAL_MODEL,
+            compute_type=config.STT_LOCAL_COMPUTE_TYPE,
+            workers=config.STT_LOCAL_WORKERS,
+            cpu_threads=config.STT_LOCAL_THREADS,
+            language=config.STT_LANGUAGE,
+            beam_size=config.STT_LOCAL_BEAM_SIZE
+        )
+    raise ValueError(f"Unknown STT_BACKEND {backend!r}, expected 'openai' or 'local'")
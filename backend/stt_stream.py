@@ -0,0 +1,128 @@
+import asyncio
+import io
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+import config
+import timing
+
+logger = logging.getLogger(__name__)
+
+# Container formats a client may stream, mapped to the file name Whisper sees
+AUDIO_FILENAMES = {
+    "webm": "audio.webm",
+    "ogg": "audio.ogg",
+    "wav": "audio.wav",
+    "mp3": "audio.mp3",
+    "m4a": "audio.m4a",
+}
+
+class AudioStreamBuffer:
+    """Accumulates streamed audio chunks.
+
+    Chunks are appended to one bytearray (amortized constant time per chunk)
+    instead of re-concatenating immutable bytes on every frame, so a window is
+    only copied once, when it is taken for transcription.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.chunks = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def append(self, chunk: bytes):
+        self._buffer += chunk
+        self.chunks += 1
+
+    def snapshot(self) -> bytes:
+        """Copy of everything received so far (the buffer keeps growing while it is uploaded)"""
+        return bytes(self._buffer)
+
+class StreamingTranscription:
+    """Transcribes an utterance while its audio is still arriving.
+
+    Compressed containers can only be decoded from the start, so each partial
+    transcription covers the whole growing window. A new window is taken when
+    enough new audio has arrived since the last one, or right away when the
+    client reports a pause. At most one partial runs at a time, and the final
+    transcription reuses the last partial when no audio arrived after it.
+    """
+
+    def __init__(
+        self,
+        transcribe: Callable[[io.BytesIO], Awaitable[str]],
+        on_partial: Callable[[str], Awaitable[None]],
+        audio_format: str = "webm",
+        partials_allowed: Callable[[], bool] = lambda: True
+    ):
+        self.transcribe = transcribe
+        self.on_partial = on_partial
+        # Checked before each partial so they can be skipped while the server is saturated
+        self.partials_allowed = partials_allowed
+        self.filename = AUDIO_FILENAMES.get(audio_format, "audio.webm")
+        self.buffer = AudioStreamBuffer()
+        self._partial_task: Optional[asyncio.Task] = None
+        self._partial_text: Optional[str] = None
+        self._partial_bytes = 0
+        # Window length of the partial currently running
+        self._inflight_bytes = 0
+        self._last_window_at = time.monotonic()
+
+    def add_chunk(self, chunk: bytes):
+        self.buffer.append(chunk)
+        new_bytes = len(self.buffer) - self._partial_bytes
+        waited = time.monotonic() - self._last_window_at
+        if new_bytes >= config.STT_PARTIAL_MIN_BYTES and waited >= config.STT_PARTIAL_INTERVAL:
+            self._start_partial()
+
+    def pause(self):
+        """The client detected a pause in speech; transcribe what we have now"""
+        if len(self.buffer) > self._partial_bytes:
+            self._start_partial()
+
+    def _start_partial(self):
+        if self._partial_task is not None and not self._partial_task.done():
+            return
+        if not self.partials_allowed():
+            return
+        self._last_window_at = time.monotonic()
+        snapshot = self.buffer.snapshot()
+        self._inflight_bytes = len(snapshot)
+        self._partial_task = asyncio.create_task(self._run_partial(snapshot))
+
+    async def _transcribe_window(self, audio: bytes) -> str:
+        audio_file = io.BytesIO(audio)
+        audio_file.name = self.filename
+        return await self.transcribe(audio_file)
+
+    async def _run_partial(self, audio: bytes):
+        # Partials run between turns; keep them out of any turn's latency breakdown
+        timing.current_turn.set(None)
+        try:
+            text = await self._transcribe_window(audio)
+        except Exception as e:
+            logger.warning(f"Partial transcription failed: {str(e)}")
+            return
+        self._partial_text = text
+        self._partial_bytes = len(audio)
+        if text:
+            await self.on_partial(text)
+
+    async def finish(self) -> str:
+        """Return the transcription of the complete utterance"""
+        if self._partial_task is not None and not self._partial_task.done():
+            if self._inflight_bytes == len(self.buffer):
+                # The running partial already covers the whole utterance
+                await self._partial_task
+            else:
+                self._partial_task.cancel()
+        if self._partial_text is not None and self._partial_bytes == len(self.buffer):
+            logger.info("Final transcription reused from the last partial")
+            return self._partial_text
+        return await self._transcribe_window(self.buffer.snapshot())
+
+    def cancel(self):
+        if self._partial_task is not None:
+            self._partial_task.cancel()
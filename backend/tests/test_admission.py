@@ -0,0 +1,68 @@
+import asyncio
+from admission import AdmissionController
+
+async def ignore(position: int):
+    pass
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+def test_turns_wait_in_order_then_busy():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queued=1)
+        order, positions, busy = [], [], []
+        gate = asyncio.Event()
+
+        async def turn(name: str):
+            order.append(name)
+            await gate.wait()
+
+        async def on_queued(position: int):
+            positions.append(position)
+
+        async def on_busy():
+            busy.append(True)
+
+        first = asyncio.create_task(controller.run(turn("first"), on_queued, on_busy))
+        second = asyncio.create_task(controller.run(turn("second"), on_queued, on_busy))
+        await settle()
+        await controller.run(turn("third"), on_queued, on_busy)
+        assert order == ["first"] and positions == [1] and busy == [True]
+        gate.set()
+        await asyncio.gather(first, second)
+        assert order == ["first", "second"]
+        assert controller.active == 0 and controller.stats()["rejected"] == 1
+
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_already_dropped_by_release():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queued=4)
+        assert await controller._acquire(ignore)
+        waiting = asyncio.create_task(controller._acquire(ignore))
+        await settle()
+        # Cancelled, then skipped by a release before the task gets to run again
+        waiting.cancel()
+        controller._release()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert waiting.cancelled()
+        assert controller.active == 0 and not controller._waiters
+
+    asyncio.run(scenario())
+
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on():
+    async def scenario():
+        controller = AdmissionController(max_active=1, max_queued=4)
+        assert await controller._acquire(ignore)
+        handed = asyncio.create_task(controller._acquire(ignore))
+        behind = asyncio.create_task(controller._acquire(ignore))
+        await settle()
+        controller._release()
+        handed.cancel()
+        await asyncio.gather(handed, return_exceptions=True)
+        assert handed.cancelled()
+        assert await behind
+        assert controller.active == 1 and not controller._waiters
+
+    asyncio.run(scenario())
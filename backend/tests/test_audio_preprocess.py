@@ -0,0 +1,60 @@
+import asyncio
+import numpy as np
+import pytest
+import audio_preprocess
+from audio_preprocess import ANALYSIS_SAMPLE_RATE, _write_wav, prepare_for_transcription
+
+def speech_like_clip(seconds: float = 2.0, rate: int = 16000, silence: float = 0.5) -> bytes:
+    """16-bit mono WAV: a modulated 150 Hz voice-like tone with silence on both sides"""
+    t = np.arange(int(seconds * rate)) / rate
+    voice = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 6))
+    voice *= 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t) ** 2
+    pad = np.zeros(int(silence * rate))
+    samples = np.concatenate([pad, voice / np.abs(voice).max() * 0.5, pad])
+    return _write_wav(np.round(samples * 32767), rate)
+
+def prepare(clip: bytes):
+    return asyncio.run(prepare_for_transcription(clip, "audio.wav"))
+
+@pytest.mark.parametrize("padding", [0.0, 0.05, 0.1])
+def test_tightly_trimmed_speech_is_kept(padding):
+    prepared = prepare(speech_like_clip(seconds=1.5, silence=padding))
+    assert prepared.has_speech
+    assert prepared.sent_seconds >= 1.4
+
+def test_silence_around_speech_is_trimmed():
+    prepared = prepare(speech_like_clip(seconds=1.5, silence=1.0))
+    assert prepared.has_speech
+    assert 1.5 <= prepared.sent_seconds < 2.0
+    assert prepared.sent_bytes < prepared.original_bytes
+
+def test_digital_silence_has_no_speech():
+    prepared = prepare(_write_wav(np.zeros(ANALYSIS_SAMPLE_RATE * 2), ANALYSIS_SAMPLE_RATE))
+    assert not prepared.has_speech
+    assert prepared.sent_bytes == 0
+
+def test_quiet_hiss_has_no_speech():
+    noise = np.random.default_rng(0).normal(0, 30, ANALYSIS_SAMPLE_RATE * 2)
+    assert not prepare(_write_wav(np.round(noise), ANALYSIS_SAMPLE_RATE)).has_speech
+
+def test_cancelled_decode_kills_ffmpeg(monkeypatch):
+    started = []
+    real_exec = asyncio.create_subprocess_exec
+
+    async def slow_ffmpeg(*args, **kwargs):
+        # Stands in for an ffmpeg that is still decoding when the turn is interrupted
+        process = await real_exec("sleep", "30", **kwargs)
+        started.append(process)
+        return process
+
+    async def scenario():
+        monkeypatch.setattr(audio_preprocess, "FFMPEG", "ffmpeg")
+        monkeypatch.setattr(asyncio, "create_subprocess_exec", slow_ffmpeg)
+        task = asyncio.create_task(audio_preprocess._ffmpeg(["-f", "s16le"], b"\0" * 1024))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert started and started[0].returncode is not None
+
+    asyncio.run(scenario())
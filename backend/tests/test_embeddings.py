@@ -0,0 +1,29 @@
+import pytest
+import config
+from embeddings import HashingEmbedder
+
+embedder = HashingEmbedder(512)
+
+def similarity(a: str, b: str) -> float:
+    return float(embedder.embed_one(a) @ embedder.embed_one(b))
+
+@pytest.mark.parametrize("a, b", [
+    ("What is not a prime number?", "What is a prime number?"),
+    ("How do plants make food?", "Why do plants make food?"),
+    ("How do I add fractions?", "Why do I add fractions?"),
+    ("I don't understand fractions", "I understand fractions"),
+    ("When did the war start?", "Where did the war start?"),
+    ("Explain it again", "Explain it"),
+    ("What comes next?", "What comes?"),
+])
+def test_different_questions_are_not_cache_hits(a, b):
+    assert similarity(a, b) < config.SEMANTIC_CACHE_THRESHOLD
+
+@pytest.mark.parametrize("a, b", [
+    ("What is a prime number?", "what is a prime number"),
+    ("Can you explain fractions please?", "can you explain fractions"),
+    ("Explain the water cycle", "Can you explain the water cycle?"),
+    ("How do I add fractions?", "How do I add two fractions?"),
+])
+def test_rephrased_questions_are_cache_hits(a, b):
+    assert similarity(a, b) >= config.SEMANTIC_CACHE_THRESHOLD
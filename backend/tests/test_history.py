@@ -0,0 +1,167 @@
+import asyncio
+import types
+import fakeredis.aioredis
+import pytest
+from langchain.schema import AIMessage, HumanMessage
+from history import InProcessHistoryStore, RedisHistoryStore, SessionHistory, history_stats
+from memory import BoundedConversationMemory
+
+def make_store(kind: str, max_messages: int = 4, ttl_seconds: float = 60):
+    if kind == "redis":
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        return RedisHistoryStore(client, max_messages, ttl_seconds)
+    return InProcessHistoryStore(max_messages, ttl_seconds)
+
+def turn(n: int):
+    return [HumanMessage(content=f"question {n}"), AIMessage(content=f"answer {n}")]
+
+@pytest.mark.parametrize("kind", ["redis", "inprocess"])
+def test_save_appends_trims_and_versions(kind):
+    async def scenario():
+        store = make_store(kind)
+        assert await store.version("s1") == 0
+        assert await store.save("s1", {"math": turn(1)}, {"current_agent": "math"}) == 1
+        assert await store.save("s1", {"math": turn(2) + turn(3)}, {}) == 2
+        snapshot = await store.load("s1", ["math", "orchestrator"])
+        assert snapshot.version == 2 == await store.version("s1")
+        # Trimmed to the newest max_messages, in order
+        assert [m.content for m in snapshot.lists["math"]] == ["question 2", "answer 2", "question 3", "answer 3"]
+        assert isinstance(snapshot.lists["math"][0], HumanMessage) and isinstance(snapshot.lists["math"][1], AIMessage)
+        assert snapshot.lists["orchestrator"] == []
+        assert snapshot.fields == {"current_agent": "math"}
+
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("kind", ["redis", "inprocess"])
+def test_delete_only_removes_that_session(kind):
+    async def scenario():
+        store = make_store(kind)
+        await store.save("s1", {"math": turn(1)}, {"current_agent": "math"})
+        await store.save("s10", {"math": turn(1)}, {"current_agent": "math"})
+        await store.delete("s1")
+        assert await store.version("s1") == 0
+        assert (await store.load("s1", ["math"])).lists["math"] == []
+        assert await store.version("s10") == 1
+
+    asyncio.run(scenario())
+
+def test_redis_keys_share_a_hash_tag_and_expire():
+    async def scenario():
+        store = make_store("redis", ttl_seconds=30)
+        await store.save("s1", {"math": turn(1), "orchestrator": turn(1)}, {"current_agent": "math"})
+        keys = sorted(await store.client.keys("*"))
+        assert keys == ["history:{s1}:fields", "history:{s1}:list:math", "history:{s1}:list:orchestrator", "history:{s1}:version"]
+        for key in keys:
+            assert 0 < await store.client.ttl(key) <= 30
+        await store.delete("s1")
+        assert await store.client.keys("*") == []
+
+    asyncio.run(scenario())
+
+def test_in_process_sessions_expire():
+    async def scenario():
+        store = make_store("inprocess", ttl_seconds=0.05)
+        await store.save("s1", {"math": turn(1)}, {})
+        await asyncio.sleep(0.1)
+        assert await store.version("s1") == 0
+        assert (await store.load("s1", ["math"])).lists["math"] == []
+
+    asyncio.run(scenario())
+
+def orchestrator():
+    def memory():
+        return BoundedConversationMemory(token_budget=10000, max_messages=20)
+
+    return types.SimpleNamespace(
+        memory=memory(),
+        agents={"math": types.SimpleNamespace(memory=memory()), "science": types.SimpleNamespace(memory=memory())},
+        current_agent_key=None,
+        current_agent=None
+    )
+
+def answer(worker, agent_key: str, n: int):
+    """What a turn does to an orchestrator's memories"""
+    worker.current_agent_key = agent_key
+    worker.current_agent = worker.agents[agent_key]
+    worker.memory.add_user_message(f"question {n}")
+    worker.memory.add_ai_message(f"Selected {agent_key}")
+    worker.current_agent.memory.add_user_message(f"question {n}")
+    worker.current_agent.memory.add_ai_message(f"answer {n}")
+
+def contents(memory):
+    return [m.content for m in memory.chat_memory.messages]
+
+@pytest.mark.parametrize("kind", ["redis", "inprocess"])
+def test_session_continues_on_another_worker(kind):
+    async def scenario():
+        store = make_store(kind, max_messages=40)
+        first, second = orchestrator(), orchestrator()
+        first_history = SessionHistory(store, "s1", first)
+        second_history = SessionHistory(store, "s1", second)
+
+        await first_history.refresh()
+        answer(first, "math", 1)
+        await first_history.save()
+
+        await second_history.refresh()
+        assert second.current_agent_key == "math" and second.current_agent is second.agents["math"]
+        assert contents(second.agents["math"].memory) == contents(first.agents["math"].memory)
+        answer(second, "science", 2)
+        await second_history.save()
+
+        # Only what the turn added is appended, so nothing is stored twice
+        await first_history.refresh()
+        assert contents(first.memory) == ["question 1", "Selected math", "question 2", "Selected science"]
+        assert contents(first.agents["science"].memory) == ["question 2", "answer 2"]
+        assert first.current_agent_key == "science"
+
+        # Unchanged since the last save or load: no reload
+        reloads = history_stats.reloads
+        await first_history.refresh()
+        await second_history.refresh()
+        assert history_stats.reloads == reloads
+
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("kind", ["redis", "inprocess"])
+def test_interleaved_saves_reload_on_the_next_turn(kind):
+    async def scenario():
+        store = make_store(kind, max_messages=40)
+        first, second = orchestrator(), orchestrator()
+        first_history = SessionHistory(store, "s1", first)
+        second_history = SessionHistory(store, "s1", second)
+        await first_history.refresh()
+        await second_history.refresh()
+
+        # Both answer from the same version; the second save lands on top of the first
+        answer(first, "math", 1)
+        answer(second, "math", 2)
+        await first_history.save()
+        await second_history.save()
+
+        await second_history.refresh()
+        assert contents(second.agents["math"].memory) == ["question 1", "answer 1", "question 2", "answer 2"]
+        await first_history.refresh()
+        assert contents(first.agents["math"].memory) == contents(second.agents["math"].memory)
+
+    asyncio.run(scenario())
+
+def test_store_failures_leave_local_state_alone():
+    class BrokenStore(InProcessHistoryStore):
+        async def version(self, session_id):
+            raise ConnectionError("store down")
+
+        async def save(self, session_id, appended, fields):
+            raise ConnectionError("store down")
+
+    async def scenario():
+        worker = orchestrator()
+        history = SessionHistory(BrokenStore(40, 60), "s1", worker)
+        failures = history_stats.failures
+        await history.refresh()
+        answer(worker, "math", 1)
+        await history.save()
+        assert history_stats.failures == failures + 2
+        assert contents(worker.agents["math"].memory) == ["question 1", "answer 1"]
+
+    asyncio.run(scenario())
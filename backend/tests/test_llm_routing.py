@@ -0,0 +1,173 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, List
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+import config
+from llm_routing import HedgedChatModel, ProviderHealth, ProviderRoute
+
+WORDS = ["A", "fraction", "is", "part", "of", "a", "whole."]
+MESSAGES = [HumanMessage(content="What is a fraction?")]
+
+class MockProvider(BaseChatModel):
+    """Answers after a fixed delay; can fail before its first token or after a few tokens"""
+
+    delay: float = 0.0
+    fail: bool = False
+    fail_after_tokens: int = -1
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    async def _first_token(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("503 Service Unavailable")
+
+    async def _astream(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        yield ChatGenerationChunk(message=AIMessageChunk(content=""))
+        await self._first_token()
+        for i, word in enumerate(WORDS):
+            if i == self.fail_after_tokens:
+                raise RuntimeError("connection reset")
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await self._first_token()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=" ".join(WORDS)))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+@pytest.fixture(autouse=True)
+def fast_settings(monkeypatch):
+    monkeypatch.setattr(config, "LLM_HEDGE_INITIAL_DELAY", 0.05)
+    monkeypatch.setattr(config, "LLM_HEDGE_MIN_SAMPLES", 1000)
+    monkeypatch.setattr(config, "LLM_BREAKER_WINDOW", 10)
+    monkeypatch.setattr(config, "LLM_BREAKER_MIN_CALLS", 3)
+    monkeypatch.setattr(config, "LLM_BREAKER_FAILURE_RATIO", 0.5)
+    monkeypatch.setattr(config, "LLM_BREAKER_COOLDOWN", 0.1)
+    monkeypatch.setattr(config, "LLM_BREAKER_SLOW_SECONDS", 0.2)
+
+def hedged(preferred: MockProvider, alternate: MockProvider, hedging: bool = True) -> HedgedChatModel:
+    # Fresh health per test, so breakers and counters don't carry over
+    routes = [
+        ProviderRoute("preferred", preferred, ProviderHealth("preferred")),
+        ProviderRoute("alternate", alternate, ProviderHealth("alternate"))
+    ]
+    return HedgedChatModel(routes=routes, hedging=hedging)
+
+async def stream_text(model: HedgedChatModel) -> str:
+    return "".join([chunk.content async for chunk in model.astream(MESSAGES)])
+
+def health(model: HedgedChatModel):
+    return model.routes[0].health, model.routes[1].health
+
+@pytest.mark.parametrize("streaming", [True, False])
+def test_slow_provider_is_hedged(streaming):
+    async def scenario():
+        model = hedged(MockProvider(delay=1.0), MockProvider(delay=0.01))
+        started = time.perf_counter()
+        text = await stream_text(model) if streaming else (await model.ainvoke(MESSAGES)).content
+        assert text.split() == WORDS
+        assert time.perf_counter() - started < 0.5
+        preferred, alternate = health(model)
+        assert (preferred.requests, alternate.requests) == (1, 1)
+        assert (alternate.hedges, alternate.hedge_wins) == (1, 1)
+
+    asyncio.run(scenario())
+
+def test_fast_provider_is_not_hedged():
+    async def scenario():
+        model = hedged(MockProvider(delay=0.01), MockProvider())
+        assert (await stream_text(model)).split() == WORDS
+        preferred, alternate = health(model)
+        assert (preferred.requests, alternate.requests) == (1, 0)
+        assert list(preferred.breaker.outcomes) == [True]
+
+    asyncio.run(scenario())
+
+def test_failure_before_first_token_fails_over():
+    async def scenario():
+        model = hedged(MockProvider(fail=True), MockProvider(delay=0.01), hedging=False)
+        assert (await stream_text(model)).split() == WORDS
+        preferred, alternate = health(model)
+        assert preferred.errors == 1 and alternate.requests == 1
+
+    asyncio.run(scenario())
+
+def test_breaker_opens_then_trial_call_closes_it():
+    async def scenario():
+        preferred = MockProvider(fail=True)
+        model = hedged(preferred, MockProvider(delay=0.01))
+        breaker = model.routes[0].health.breaker
+        for _ in range(3):
+            await stream_text(model)
+        assert breaker.state == "open" and breaker.trips == 1
+        # While open the provider is skipped
+        await stream_text(model)
+        assert preferred.calls == 3
+
+        await asyncio.sleep(0.15)
+        assert breaker.available() and breaker.state == "half_open"
+        preferred.fail = False
+        assert (await stream_text(model)).split() == WORDS
+        assert preferred.calls == 4 and breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+def test_failed_trial_call_reopens_the_breaker():
+    async def scenario():
+        preferred = MockProvider(fail=True)
+        model = hedged(preferred, MockProvider(delay=0.01))
+        breaker = model.routes[0].health.breaker
+        for _ in range(3):
+            await stream_text(model)
+        await asyncio.sleep(0.15)
+        await stream_text(model)
+        assert preferred.calls == 4
+        assert breaker.state == "open" and breaker.trips == 2
+
+    asyncio.run(scenario())
+
+def test_slow_first_token_counts_against_the_breaker():
+    async def scenario():
+        model = hedged(MockProvider(delay=0.25), MockProvider(), hedging=False)
+        await stream_text(model)
+        preferred, _ = health(model)
+        assert preferred.slow == 1 and list(preferred.breaker.outcomes) == [False]
+
+    asyncio.run(scenario())
+
+def test_mid_stream_failure_is_raised_and_recorded_once():
+    async def scenario():
+        model = hedged(MockProvider(delay=0.01, fail_after_tokens=3), MockProvider(delay=0.01))
+        received = []
+        with pytest.raises(RuntimeError, match="connection reset"):
+            async for chunk in model.astream(MESSAGES):
+                received.append(chunk.content)
+        # Tokens already streamed stay with their provider: no failover mid-answer
+        assert "".join(received).split() == WORDS[:3]
+        preferred, alternate = health(model)
+        assert alternate.requests == 0
+        assert preferred.errors == 1 and list(preferred.breaker.outcomes) == [False]
+
+    asyncio.run(scenario())
+
+def test_stream_closed_early_counts_as_success():
+    async def scenario():
+        model = hedged(MockProvider(delay=0.01), MockProvider())
+        stream = model.astream(MESSAGES)
+        async for chunk in stream:
+            if chunk.content:
+                break
+        await stream.aclose()
+        preferred, _ = health(model)
+        assert preferred.errors == 0 and list(preferred.breaker.outcomes) == [True]
+
+    asyncio.run(scenario())
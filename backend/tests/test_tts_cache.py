@@ -0,0 +1,25 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tts_cache import DiskTier
+
+def test_disk_tier_survives_concurrent_use(tmp_path):
+    tier = DiskTier(str(tmp_path), max_bytes=64)
+
+    def churn(worker: int):
+        for i in range(200):
+            key = f"k{(worker + i) % 12}"
+            tier.put(key, bytes([i % 256]) * 16)
+            tier.get(key)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(churn, range(8)))
+    assert tier.size == sum(tier._entries.values()) <= 64
+    on_disk = {name[:-len(".audio")] for name in os.listdir(tmp_path) if name.endswith(".audio")}
+    assert on_disk == set(tier._entries)
+
+def test_disk_tier_treats_missing_file_as_miss(tmp_path):
+    tier = DiskTier(str(tmp_path), max_bytes=64)
+    tier.put("a", b"audio")
+    os.remove(tmp_path / "a.audio")
+    assert tier.get("a") is None
+    assert tier.size == 0 and len(tier) == 0
@@ -0,0 +1,22 @@
+import asyncio
+import gc
+import logging
+from turn_graph import TurnGraph
+
+async def fail():
+    raise RuntimeError("stage failed")
+
+def test_cancel_retrieves_failed_stages(caplog):
+    async def scenario():
+        graph = TurnGraph()
+        graph.add("failing", fail)
+        await asyncio.sleep(0)
+        graph.cancel()
+        await asyncio.sleep(0)
+
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(scenario())
+        gc.collect()
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("Stage failing of a cancelled turn failed" in message for message in messages)
+    assert not any("never retrieved" in message for message in messages)
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+import config
+import timing
+
+logger = logging.getLogger(__name__)
+
+class TextDeltaCoalescer:
+    """Forwards streamed tokens to the client in batches.
+
+    The first token is sent right away so text appears as early as possible.
+    After that tokens are buffered and sent once ``max_chars`` have collected
+    or ``interval`` seconds after the first buffered token, whichever comes
+    first. Sends never overlap: tokens arriving while a frame is being sent
+    join the next frame, so a slow client gets fewer, larger frames.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]], interval: float = None, max_chars: int = None):
+        self.send = send
+        self.interval = config.TEXT_DELTA_INTERVAL_MS / 1000 if interval is None else interval
+        self.max_chars = config.TEXT_DELTA_MAX_CHARS if max_chars is None else max_chars
+        self.parts: List[str] = []
+        self.pending_chars = 0
+        self.frames = 0
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def tap(self, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Pass tokens through unchanged while sending them to the client"""
+        try:
+            async for token in tokens:
+                if token:
+                    self.parts.append(token)
+                    self.pending_chars += len(token)
+                    if self.frames == 0 or self.pending_chars >= self.max_chars:
+                        await self.flush()
+                    elif self._timer is None:
+                        self._timer = asyncio.create_task(self._flush_later())
+                yield token
+            await self.flush()
+        finally:
+            if self._timer is not None:
+                self._timer.cancel()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        # Detach first so the flush below can't cancel its own timer
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Send everything buffered so far as one frame"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self.parts:
+                return
+            text = "".join(self.parts)
+            self.parts.clear()
+            self.pending_chars = 0
+            self.frames += 1
+            timing.mark("first_text")
+            await self.send(text)
@@ -0,0 +1,120 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TurnTimer:
+    """Latency breakdown of a single conversation turn.
+
+    Stages accumulate wall time (concurrent stages such as sentence TTS add up),
+    marks record the first time a milestone is reached relative to the turn start,
+    and spans record when a stage of the turn graph started and finished.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+        self.spans: Dict[str, Tuple[float, float]] = {}
+        self.critical_path: List[str] = []
+        self.llm_calls = 0
+        # Agent that answered, used as the metrics label, and how the turn ended
+        self.agent: Optional[str] = None
+        self.outcome = "ok"
+        self.observed = False
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def record(self, name: str, seconds: float):
+        """Add a stage duration measured by the caller"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter() - self.start
+        try:
+            yield
+        finally:
+            self.spans[name] = (started, time.perf_counter() - self.start)
+
+    def mark(self, name: str):
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.start
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {
+            "kind": self.kind,
+            "total_ms": round(self.elapsed() * 1000, 1),
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            "marks_ms": {name: round(seconds * 1000, 1) for name, seconds in self.marks.items()},
+            "llm_calls": self.llm_calls
+        }
+        if self.spans:
+            summary["spans_ms"] = {
+                name: [round(start * 1000, 1), round(end * 1000, 1)] for name, (start, end) in self.spans.items()
+            }
+            summary["critical_path"] = self.critical_path
+        return summary
+
+# The turn being processed by the current task; tasks spawned during the turn inherit it
+current_turn: ContextVar[Optional[TurnTimer]] = ContextVar("current_turn", default=None)
+
+def start_turn(kind: str) -> TurnTimer:
+    """Begin timing a new turn in the current context"""
+    turn = TurnTimer(kind)
+    current_turn.set(turn)
+    return turn
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of the current turn, if there is one"""
+    turn = current_turn.get()
+    if turn is None:
+        yield
+        return
+    with turn.stage(name):
+        yield
+
+@contextmanager
+def span(name: str):
+    """Record when a turn graph stage runs, if there is a current turn"""
+    turn = current_turn.get()
+    if turn is None:
+        yield
+        return
+    with turn.span(name):
+        yield
+
+def mark(name: str):
+    turn = current_turn.get()
+    if turn is not None:
+        turn.mark(name)
+
+def record(name: str, seconds: float):
+    turn = current_turn.get()
+    if turn is not None:
+        turn.record(name, seconds)
+
+def set_agent(name: str):
+    """Label the current turn with the agent answering it"""
+    turn = current_turn.get()
+    if turn is not None:
+        turn.agent = name
+
+def count_llm_call():
+    turn = current_turn.get()
+    if turn is not None:
+        turn.llm_calls += 1
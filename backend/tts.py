@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import multiprocessing
+from abc import ABC, abstractmethod
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+import config
+import timing
+import tts_worker
+from audio_preprocess import FFMPEG
+from openai_client import synthesize_speech
+
+logger = logging.getLogger(__name__)
+
+class TTSBackend(ABC):
+    """Turns one sentence of text into audio, in the backend's audio format.
+
+    ``audio_format`` is mp3, opus (a self-contained Ogg file per sentence) or
+    pcm (raw 16-bit little-endian mono at ``sample_rate``). ``model`` and
+    ``voice`` identify what the audio sounds like, for caching.
+    """
+
+    name = "base"
+    model = ""
+    voice = ""
+    audio_format = "mp3"
+    sample_rate: Optional[int] = None
+
+    async def start(self):
+        """Prepare the backend before the first request (load and warm up voices)"""
+
+    @abstractmethod
+    async def synthesize(self, text: str) -> bytes:
+        ...
+
+    def format_info(self) -> Dict[str, object]:
+        """What clients need to know to play the audio"""
+        return {"codec": self.audio_format, "sample_rate": self.sample_rate}
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": self.name, "format": self.audio_format}
+
+    def close(self):
+        pass
+
+class OpenAITTS(TTSBackend):
+    """tts-1 through the OpenAI API"""
+
+    name = "openai"
+    FORMATS = ("mp3", "opus", "pcm")
+
+    def __init__(self, model: str = "tts-1", voice: str = "alloy", audio_format: str = "mp3"):
+        if audio_format not in self.FORMATS:
+            raise ValueError(f"Unsupported TTS_FORMAT {audio_format!r} for OpenAI TTS, expected one of {self.FORMATS}")
+        self.model = model
+        self.voice = voice
+        self.audio_format = audio_format
+        # The API's raw PCM is 24 kHz
+        self.sample_rate = 24000 if audio_format == "pcm" else None
+
+    async def synthesize(self, text: str) -> bytes:
+        return await synthesize_speech(text, model=self.model, voice=self.voice, response_format=self.audio_format)
+
+class LocalTTS(TTSBackend):
+    """Piper voices on the CPU, in a pool of worker processes.
+
+    Each worker loads the voice once and synthesizes one sentence at a time.
+    The speech pipeline already keeps several sentences of an answer in
+    flight, so they are synthesized in parallel on different workers and
+    still delivered in order. ``start`` spawns every worker and waits until
+    each has loaded and warmed up its voice.
+    """
+
+    name = "local"
+    FORMATS = ("pcm", "opus")
+
+    def __init__(self, model_path: str, workers: int, speaker: Optional[int] = None, audio_format: str = "pcm", opus_bitrate: str = "32k"):
+        if audio_format not in self.FORMATS:
+            raise ValueError(f"Unsupported TTS_FORMAT {audio_format!r} for local TTS, expected one of {self.FORMATS}")
+        if audio_format == "opus" and FFMPEG is None:
+            raise ValueError("TTS_FORMAT=opus with local TTS needs ffmpeg on the PATH")
+        self.model_path = model_path
+        self.model = "piper:" + os.path.splitext(os.path.basename(model_path))[0]
+        self.voice = str(speaker) if speaker is not None else "default"
+        self.audio_format = audio_format
+        self.workers = workers
+        # Spawned rather than forked: the server process has threads and an event loop
+        context = multiprocessing.get_context("spawn")
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=tts_worker.load_voice,
+            initargs=(model_path, speaker, audio_format, FFMPEG, opus_bitrate, context.Barrier(workers))
+        )
+        self.sentences = 0
+        self.audio_seconds = 0.0
+        self.synthesis_seconds = 0.0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        logger.info(f"Loading local TTS voice {self.model_path} in {self.workers} worker processes")
+        try:
+            # One ready job per worker; each blocks until all workers have loaded the voice
+            workers = await asyncio.gather(*[loop.run_in_executor(self.pool, tts_worker.ready) for _ in range(self.workers)])
+        except BrokenProcessPool:
+            # The worker's own traceback (missing package, unknown voice, ...) is on stderr
+            raise RuntimeError(f"Could not load local TTS voice {self.model_path!r}, see the worker error above") from None
+        # Opus is always encoded at 48 kHz; raw PCM keeps the voice's rate
+        self.sample_rate = 48000 if self.audio_format == "opus" else workers[0][1]
+        logger.info(f"Local TTS ready in processes {sorted(pid for pid, _ in workers)}")
+
+    async def synthesize(self, text: str) -> bytes:
+        loop = asyncio.get_running_loop()
+        with timing.stage("tts"):
+            try:
+                audio, audio_seconds, synthesis_seconds = await asyncio.wait_for(
+                    loop.run_in_executor(self.pool, tts_worker.synthesize, text),
+                    config.TTS_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.error(f"Local TTS timed out after {config.TTS_TIMEOUT}s")
+                raise TimeoutError(f"tts timed out after {config.TTS_TIMEOUT}s")
+        self.sentences += 1
+        self.audio_seconds += audio_seconds
+        self.synthesis_seconds += synthesis_seconds
+        return audio
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": self.name,
+            "format": self.audio_format,
+            "model": self.model,
+            "workers": self.workers,
+            "sentences": self.sentences,
+            "audio_seconds": self.audio_seconds,
+            # Synthesis time per second of speech; below 1 is faster than real time
+            "real_time_factor": self.synthesis_seconds / self.audio_seconds if self.audio_seconds else None
+        }
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+def create_tts_backend(backend: Optional[str] = None, audio_format: Optional[str] = None) -> TTSBackend:
+    """Text-to-speech backend configured from the environment (TTS_BACKEND, TTS_FORMAT)"""
+    backend = backend or config.TTS_BACKEND
+    audio_format = audio_format or config.TTS_FORMAT
+    if backend == "openai":
+        return OpenAITTS(audio_format=audio_format or "mp3")
+    if backend == "local":
+        return LocalTTS(
+            model_path=config.TTS_LOCAL_MODEL,
+            workers=config.TTS_LOCAL_WORKERS,
+            speaker=int(config.TTS_LOCAL_SPEAKER) if config.TTS_LOCAL_SPEAKER else None,
+            audio_format=audio_format or "pcm",
+            opus_bitrate=config.TTS_OPUS_BITRATE
+        )
+    raise ValueError(f"Unknown TTS_BACKEND {backend!r}, expected 'openai' or 'local'")
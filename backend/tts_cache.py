@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+import config
+from tts import TTSBackend
+
+logger = logging.getLogger(__name__)
+
+def cache_key(text: str, voice: str, model: str, audio_format: str = "mp3") -> str:
+    """Content address of a synthesized sentence; whitespace differences don't matter"""
+    normalized = " ".join(text.split())
+    # mp3 entries keep the keys they had before other formats existed
+    identity = f"{model}\0{voice}" if audio_format == "mp3" else f"{model}\0{voice}\0{audio_format}"
+    return hashlib.sha256(f"{identity}\0{normalized}".encode("utf-8")).hexdigest()
+
+class MemoryTier:
+    """LRU of recently used audio, capped by total bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        audio = self._entries.get(key)
+        if audio is not None:
+            self._entries.move_to_end(key)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._entries[key] = audio
+        self.size += len(audio)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+class DiskTier:
+    """One file per entry under ``directory``, capped by total bytes.
+
+    Least recently used files are deleted first. Recency survives restarts
+    through file modification times, which are refreshed on every hit. Reads
+    and writes run in worker threads, so the index is guarded by a lock.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith(".audio"):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, name[:-len(".audio")], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self.size += size
+        self._evict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    audio = f.read()
+                os.utime(path)
+            except OSError:
+                audio = b""
+            if not audio:
+                # Deleted behind our back, or empty
+                self._forget(key)
+                return None
+            self._entries.move_to_end(key)
+            return audio
+
+    def put(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        path = self._path(key)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(audio)
+        with self._lock:
+            if key in self._entries:
+                os.remove(temporary)
+                return
+            # Atomic, so concurrent readers never see a partial file
+            os.replace(temporary, path)
+            self._entries[key] = len(audio)
+            self.size += len(audio)
+            self._evict()
+
+    def _forget(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self.size -= size
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+class TTSCache:
+    """Content-addressed cache in front of a TTS backend.
+
+    Used per sentence by the speech pipeline, so sentences that recur across
+    different answers (greetings, encouragement, follow-up prompts) are served
+    without a TTS call. Lookups try memory, then disk. Concurrent misses for the
+    same sentence share one synthesis call.
+    """
+
+    def __init__(self, backend: TTSBackend, memory_bytes: int, directory: Optional[str] = None, disk_bytes: int = 0):
+        self.backend = backend
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = DiskTier(directory, disk_bytes) if directory and disk_bytes > 0 else None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def synthesize(self, text: str) -> bytes:
+        key = cache_key(text, self.backend.voice, self.backend.model, self.backend.audio_format)
+        audio = self.memory.get(key)
+        if audio is not None:
+            self.memory_hits += 1
+            return audio
+
+        task = self._inflight.get(key)
+        if task is None:
+            # Shared by every concurrent request for this sentence, and shielded so
+            # one client going away doesn't cancel it for the others
+            task = asyncio.create_task(self._load_or_synthesize(key, text))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _load_or_synthesize(self, key: str, text: str) -> bytes:
+        if self.disk is not None:
+            audio = await asyncio.to_thread(self.disk.get, key)
+            if audio is not None:
+                self.disk_hits += 1
+                self.memory.put(key, audio)
+                return audio
+
+        self.misses += 1
+        audio = await self.backend.synthesize(text)
+        self.memory.put(key, audio)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.put, key, audio)
+            except OSError as e:
+                logger.warning(f"Could not write TTS cache entry: {str(e)}")
+        return audio
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses + self.coalesced
+        return {
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size,
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "disk_bytes": self.disk.size if self.disk is not None else 0
+        }
+
+def create_tts_cache(backend: TTSBackend) -> Optional[TTSCache]:
+    """TTS cache configured from the environment, or None when TTS_CACHE is off"""
+    if not config.TTS_CACHE:
+        return None
+    return TTSCache(
+        backend,
+        memory_bytes=config.TTS_CACHE_MEMORY_MB * 1024 * 1024,
+        directory=config.TTS_CACHE_DIR or None,
+        disk_bytes=config.TTS_CACHE_DISK_MB * 1024 * 1024
+    )
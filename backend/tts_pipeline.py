@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import re
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple
+import config
+
+logger = logging.getLogger(__name__)
+
+# End of a sentence: terminal punctuation (plus closing quotes/brackets) followed by
+# whitespace, or a line break such as the end of a list item
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+
+async def split_sentences(tokens: AsyncIterator[str], min_chars: int = None) -> AsyncIterator[str]:
+    """Regroup a token stream into sentences, yielding each one as soon as it is complete"""
+    min_chars = config.TTS_MIN_SENTENCE_CHARS if min_chars is None else min_chars
+    buffer = ""
+    async for token in tokens:
+        buffer += token
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(buffer):
+            sentence = buffer[start:match.end()].strip()
+            if len(sentence) >= min_chars:
+                yield sentence
+                start = match.end()
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+class SpeechPipeline:
+    """Streams LLM tokens to speech one sentence at a time.
+
+    Sentences are handed to ``synthesize`` as soon as they finish, with up to
+    ``max_pending`` synthesis calls running ahead of the sentence currently being
+    delivered, and audio is yielded strictly in sentence order.
+    """
+
+    def __init__(self, synthesize: Callable[[str], Awaitable[bytes]], max_pending: int = None):
+        self.synthesize = synthesize
+        self.max_pending = config.TTS_MAX_PENDING if max_pending is None else max_pending
+        self.text_parts: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """Full text of the tokens consumed so far"""
+        return "".join(self.text_parts)
+
+    async def _collect(self, tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+        async for token in tokens:
+            self.text_parts.append(token)
+            yield token
+
+    async def _produce(self, tokens: AsyncIterator[str], queue: asyncio.Queue, tasks: List[asyncio.Task]):
+        try:
+            async for sentence in split_sentences(self._collect(tokens)):
+                task = asyncio.create_task(self.synthesize(sentence))
+                tasks.append(task)
+                await queue.put((sentence, task))
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(None)
+
+    async def run(self, tokens: AsyncIterator[str]) -> AsyncIterator[Tuple[int, str, bytes]]:
+        """Yield (sequence number, sentence, audio) for each sentence of the token stream"""
+        # In flight: the task being awaited, the queued ones and the one the producer holds
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.max_pending - 2))
+        tasks: List[asyncio.Task] = []
+        producer = asyncio.create_task(self._produce(tokens, queue, tasks))
+        try:
+            seq = 0
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                sentence, task = item
+                audio = await task
+                yield seq, sentence, audio
+                seq += 1
+            logger.info(f"Speech pipeline finished with {seq} sentence chunks")
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,61 @@
+"""Worker-process side of the local text-to-speech backend.
+
+Each process of the pool loads one Piper voice (an ONNX model run on the CPU)
+when it starts and keeps it for its lifetime, and synthesizes one sentence at
+a time. Kept free of the web app's imports so spawning a worker stays cheap.
+"""
+import os
+import subprocess
+import time
+from typing import Optional
+
+_voice = None
+_syn_config = None
+_format = "pcm"
+_ffmpeg: Optional[str] = None
+_opus_bitrate = "32k"
+_started = None
+
+def load_voice(model_path: str, speaker: Optional[int], audio_format: str, ffmpeg: Optional[str], opus_bitrate: str, started=None):
+    """Pool initializer: load the voice once per worker process and warm it up.
+
+    started is a barrier with one party per worker, waited on by ``ready``.
+    """
+    global _voice, _syn_config, _format, _ffmpeg, _opus_bitrate, _started
+    from piper import PiperVoice, SynthesisConfig
+    _voice = PiperVoice.load(model_path)
+    _syn_config = SynthesisConfig(speaker_id=speaker)
+    _format, _ffmpeg, _opus_bitrate = audio_format, ffmpeg, opus_bitrate
+    synthesize("Hello.")
+    _started = started
+
+def ready() -> tuple:
+    """Startup job, one per worker: returns (pid, sample rate) once every worker has loaded its voice"""
+    if _started is not None:
+        _started.wait()
+    return os.getpid(), _voice.config.sample_rate
+
+def synthesize(text: str) -> tuple:
+    """Return (audio, audio seconds, synthesis seconds) for one sentence"""
+    started = time.perf_counter()
+    pcm = b"".join(chunk.audio_int16_bytes for chunk in _voice.synthesize(text, _syn_config))
+    seconds = len(pcm) / 2 / _voice.config.sample_rate
+    audio = encode_opus(pcm, _voice.config.sample_rate) if _format == "opus" else pcm
+    return audio, seconds, time.perf_counter() - started
+
+def encode_opus(pcm: bytes, sample_rate: int) -> bytes:
+    """16-bit mono PCM to a self-contained Ogg Opus file, so each sentence decodes on its own"""
+    result = subprocess.run(
+        [
+            _ffmpeg, "-hide_banner", "-loglevel", "error",
+            "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+            # Opus only runs at 8-48 kHz; Piper voices are usually 22.05 kHz
+            "-ar", "48000", "-c:a", "libopus", "-b:a", _opus_bitrate, "-application", "voip",
+            "-f", "ogg", "pipe:1"
+        ],
+        input=pcm,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
+import timing
+
+logger = logging.getLogger(__name__)
+
+class TurnGraph:
+    """The stages of one turn as a small dependency graph of asyncio tasks.
+
+    Each stage starts as soon as the stages it depends on have finished and is
+    called with their results, so independent stages overlap. Every stage is
+    recorded as a span of the current turn; ``critical_path`` names the chain of
+    stages that determined when a given stage could start.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.dependencies: Dict[str, Tuple[str, ...]] = {}
+        self.finished_at: Dict[str, float] = {}
+
+    def add(self, name: str, stage: Callable[..., Awaitable[Any]], *args, after: Sequence[str] = ()) -> asyncio.Task:
+        """Schedule stage(*results of after, *args) to run once the stages in after are done"""
+        dependencies = tuple(after)
+
+        async def run():
+            results = [await self.tasks[dependency] for dependency in dependencies]
+            with timing.span(name):
+                result = await stage(*results, *args)
+            self.finished_at[name] = time.perf_counter()
+            return result
+
+        self.dependencies[name] = dependencies
+        self.tasks[name] = asyncio.create_task(run())
+        return self.tasks[name]
+
+    def __getitem__(self, name: str) -> asyncio.Task:
+        return self.tasks[name]
+
+    def cancel(self):
+        for name, task in self.tasks.items():
+            task.cancel()
+            # Nobody awaits the stages of a cancelled turn, so collect their failures here
+            task.add_done_callback(lambda task, name=name: self._log_failure(name, task))
+
+    @staticmethod
+    def _log_failure(name: str, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Stage %s of a cancelled turn failed: %r", name, task.exception())
+
+    def critical_path(self, *names: str) -> List[str]:
+        """The chain of stages ending at whichever of names finished last"""
+        path: List[str] = []
+        candidates = [name for name in names if name in self.finished_at]
+        while candidates:
+            last = max(candidates, key=lambda name: self.finished_at[name])
+            path.append(last)
+            candidates = [name for name in self.dependencies[last] if name in self.finished_at]
+        return path[::-1]
+
+    def record_critical_path(self, *names: str, then: Sequence[str] = ()):
+        """Store the critical path into names, followed by the stages in then, on the current turn"""
+        turn = timing.current_turn.get()
+        if turn is not None:
+            turn.critical_path = self.critical_path(*names) + list(then)
@@ -0,0 +1,51 @@
+"""Worker-process side of the local speech-to-text backend.
+
+Each process of the pool loads one faster-whisper model (CTranslate2, int8 on
+CPU by default) when it starts and keeps it for its lifetime. Kept free of
+the web app's imports so spawning a worker stays cheap.
+"""
+import io
+import os
+import time
+
+_model = None
+_options = {}
+_started = None
+
+def load_model(model: str, compute_type: str, cpu_threads: int, language: str, beam_size: int, started=None):
+    """Pool initializer: load the model once per worker process and warm it up.
+
+    started is a barrier with one party per worker, waited on by ``ready``.
+    """
+    global _model, _options, _started
+    from faster_whisper import WhisperModel
+    _model = WhisperModel(model, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+    _options = {"language": language or None, "beam_size": beam_size}
+    warm_up()
+    _started = started
+
+def ready() -> int:
+    """Startup job, one per worker: returns only once every worker has loaded its model.
+
+    A worker waiting here can't take another ready job, so each one has to
+    run its own, and a worker that is still loading holds all of them back.
+    """
+    if _started is not None:
+        _started.wait()
+    return os.getpid()
+
+def transcribe(audio: bytes) -> tuple:
+    """Return (text, audio seconds, inference seconds) for an encoded clip"""
+    started = time.perf_counter()
+    segments, info = _model.transcribe(io.BytesIO(audio), **_options)
+    # Segments are decoded lazily, so joining them is where inference happens
+    text = "".join(segment.text for segment in segments).strip()
+    return text, info.duration, time.perf_counter() - started
+
+def warm_up(seconds: float = 1.0) -> float:
+    """Run one inference on silence so the first real clip doesn't pay for lazy initialization"""
+    import numpy as np
+    started = time.perf_counter()
+    segments, _ = _model.transcribe(np.zeros(int(16000 * seconds), dtype=np.float32), **_options)
+    list(segments)
+    return time.perf_counter() - started
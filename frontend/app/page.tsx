@@ -18,6 +18,69 @@ interface AudioDevice {
   label: string;
 }
 
+// How the server encodes response audio, announced in the session message
+interface AudioFormat {
+  codec: 'mp3' | 'opus' | 'pcm';
+  sample_rate: number | null;
+}
+
+// Decode synchronously so audio chunks are queued in the order they arrive
+const base64ToBytes = (base64: string) => {
+  const binary = atob(base64)
+  const bytes = new Uint8Array(binary.length)
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i)
+  }
+  return bytes
+}
+
+// Raw 16-bit mono PCM gets a WAV header so the audio element can play it
+const wavHeader = (dataBytes: number, sampleRate: number) => {
+  const header = new DataView(new ArrayBuffer(44))
+  const text = (offset: number, value: string) => {
+    for (let i = 0; i < value.length; i++) header.setUint8(offset + i, value.charCodeAt(i))
+  }
+  text(0, 'RIFF')
+  header.setUint32(4, 36 + dataBytes, true)
+  text(8, 'WAVEfmt ')
+  header.setUint32(16, 16, true)
+  header.setUint16(20, 1, true)
+  header.setUint16(22, 1, true)
+  header.setUint32(24, sampleRate, true)
+  header.setUint32(28, sampleRate * 2, true)
+  header.setUint16(32, 2, true)
+  header.setUint16(34, 16, true)
+  text(36, 'data')
+  header.setUint32(40, dataBytes, true)
+  return header.buffer
+}
+
+const audioBlob = (bytes: ArrayBuffer | Uint8Array, format: AudioFormat) => {
+  if (format.codec === 'pcm') {
+    return new Blob([wavHeader(bytes.byteLength, format.sample_rate ?? 24000), bytes], { type: 'audio/wav' })
+  }
+  return new Blob([bytes], { type: format.codec === 'opus' ? 'audio/ogg' : 'audio/mpeg' })
+}
+
+// Ends (in ms) of the pauses inside an utterance: stretches of at least minMs of 20 ms frames
+// below the level the server's VAD treats as silence (about -40 dBFS)
+const findPauses = (samples: Float32Array, sampleRate: number, minMs = 300, threshold = 0.01) => {
+  const frame = Math.floor(sampleRate * 0.02)
+  const pauses: number[] = []
+  let quietMs = 0
+  for (let start = 0; start + frame <= samples.length; start += frame) {
+    let energy = 0
+    for (let i = start; i < start + frame; i++) energy += samples[i] * samples[i]
+    if (Math.sqrt(energy / frame) < threshold) {
+      quietMs += 20
+      if (quietMs === minMs) pauses.push((start + frame) / sampleRate * 1000)
+    } else {
+      quietMs = 0
+    }
+  }
+  return pauses
+}
+
 export default function VoiceChat() {
   const [recording, setRecording] = useState(false)
   const [status, setStatus] = useState("Idle")
@@ -25,6 +88,8 @@ export default function VoiceChat() {
   const [isAIPlaying, setIsAIPlaying] = useState(false)
   const [messages, setMessages] = useState<Message[]>([])
   const [liveTranscript, setLiveTranscript] = useState("")
+  // Answer text received so far through ai_text_delta, shown until ai_response arrives
+  const [streamingAnswer, setStreamingAnswer] = useState("")
   const audioRef = useRef<HTMLAudioElement | null>(null)
   const streamRef = useRef<MediaStream | null>(null)
   const silenceTimeoutRef = useRef<NodeJS.Timeout | null>(null)
@@ -44,6 +109,12 @@ export default function VoiceChat() {
   const [audioDevices, setAudioDevices] = useState<AudioDevice[]>([])
   const [selectedDeviceId, setSelectedDeviceId] = useState<string>("")
   const [showDeviceSelector, setShowDeviceSelector] = useState(false)
+  const audioQueueRef = useRef<string[]>([])
+  const chunkPlayingRef = useRef(false)
+  const responseDoneRef = useRef(true)
+  // Set while a cancelled answer may still have audio in flight
+  const cancellingRef = useRef(false)
+  const audioFormatRef = useRef<AudioFormat>({ codec: 'mp3', sample_rate: null })
 
   // Load available audio input devices
   useEffect(() => {
@@ -83,9 +154,63 @@ export default function VoiceChat() {
     }
   }, [])
 
+  // Play queued audio chunks one after another
+  const playNextChunk = async () => {
+    const url = audioQueueRef.current.shift()
+    if (!url) {
+      chunkPlayingRef.current = false
+      return
+    }
+    chunkPlayingRef.current = true
+    setAiAudioUrl(url)
+    setStatus("AI is speaking...")
+    setIsAIPlaying(true)
+    
+    if (audioRef.current) {
+      // If there's a previous play promise pending, wait for it
+      if (playPromiseRef.current) {
+        try {
+          await playPromiseRef.current
+        } catch (err) {
+          console.error("Previous playback error:", err)
+        }
+      }
+      
+      // Stop any current playback
+      audioRef.current.pause()
+      audioRef.current.currentTime = 0
+      
+      // Set new source and play
+      audioRef.current.src = url
+      try {
+        playPromiseRef.current = audioRef.current.play()
+        await playPromiseRef.current
+        playPromiseRef.current = null
+      } catch (err) {
+        console.error("Error auto-playing audio:", err)
+        setStatus("Click to play AI response")
+        setIsAIPlaying(false)
+        chunkPlayingRef.current = false
+        playPromiseRef.current = null
+      }
+    }
+  }
+
+  const enqueueAudio = (url: string) => {
+    if (cancellingRef.current) {
+      return
+    }
+    audioQueueRef.current.push(url)
+    if (!chunkPlayingRef.current) {
+      playNextChunk()
+    }
+  }
+
   useEffect(() => {
     // Initialize WebSocket connection
-    wsRef.current = new WebSocket('wss://ai-voice-chat-zxsh.onrender.com/ws')
+    // Ask for raw binary audio frames instead of base64 audio inside JSON
+    wsRef.current = new WebSocket('wss://ai-voice-chat-zxsh.onrender.com/ws?audio_transport=binary')
+    wsRef.current.binaryType = 'arraybuffer'
     
     wsRef.current.onopen = () => {
       console.log('WebSocket connected')
@@ -93,13 +218,45 @@ export default function VoiceChat() {
     }
     
     wsRef.current.onmessage = async (event) => {
+      if (event.data instanceof ArrayBuffer) {
+        // Binary audio frame: 4-byte big-endian sequence id followed by the audio bytes
+        const seq = new DataView(event.data).getUint32(0)
+        console.log(`Received audio chunk ${seq}`)
+        enqueueAudio(URL.createObjectURL(audioBlob(event.data.slice(4), audioFormatRef.current)))
+        return
+      }
+      
       const data = JSON.parse(event.data)
       
-      if (data.type === 'transcription') {
+      if (data.type === 'session') {
+        console.log('Audio transport:', data.audio_transport, 'format:', data.audio_format)
+        if (data.audio_format) {
+          audioFormatRef.current = data.audio_format
+        }
+      } else if (data.type === 'transcription') {
+        // Partial transcriptions are refined until the final one arrives
         lastTranscriptRef.current = data.text
         setLiveTranscript(data.text)
+      } else if (data.type === 'ai_text_delta') {
+        // Answer text streamed ahead of its audio; dropped while an interrupted answer winds down
+        if (!cancellingRef.current) {
+          setStreamingAnswer(prev => prev + data.text)
+        }
+      } else if (data.type === 'ai_audio_chunk') {
+        // Sentence-level audio arrives while the rest of the answer is still being generated
+        if (data.seq === 0) {
+          responseDoneRef.current = false
+          // A new answer has started, so any cancelled one is over
+          cancellingRef.current = false
+        }
+        // In binary mode the audio follows in its own frame
+        if (data.audio) {
+          enqueueAudio(URL.createObjectURL(audioBlob(base64ToBytes(data.audio), audioFormatRef.current)))
+        }
       } else if (data.type === 'ai_response') {
         const finalTranscript = lastTranscriptRef.current || liveTranscript
+        responseDoneRef.current = true
+        cancellingRef.current = false
         
         // Clear animation
         if (animationRef.current) {
@@ -112,47 +269,35 @@ export default function VoiceChat() {
         // Then in a separate update, add the AI response
         setTimeout(() => {
           setMessages(prev => [...prev, { type: 'ai', text: data.text }])
+          setStreamingAnswer("")
           setLiveTranscript("")
           setDisplayedText("")
           lastTranscriptRef.current = ""
         }, 100)
         
-        // Handle audio response
-        const audioBlob = await fetch(`data:audio/mpeg;base64,${data.audio}`).then(r => r.blob())
-        const url = URL.createObjectURL(audioBlob)
-        setAiAudioUrl(url)
-        setStatus("AI is speaking...")
-        setIsAIPlaying(true)
-        
-        if (audioRef.current) {
-          // If there's a previous play promise pending, wait for it
-          if (playPromiseRef.current) {
-            try {
-              await playPromiseRef.current
-            } catch (err) {
-              console.error("Previous playback error:", err)
-            }
-          }
-          
-          // Stop any current playback
-          audioRef.current.pause()
-          audioRef.current.currentTime = 0
-          
-          // Set new source and play
-          audioRef.current.src = url
-          try {
-            playPromiseRef.current = audioRef.current.play()
-            await playPromiseRef.current
-            playPromiseRef.current = null
-          } catch (err) {
-            console.error("Error auto-playing audio:", err)
-            setStatus("Click to play AI response")
-            setIsAIPlaying(false)
-            playPromiseRef.current = null
-          }
+        if (data.audio) {
+          // Whole-answer audio from servers that don't stream sentences
+          enqueueAudio(URL.createObjectURL(audioBlob(base64ToBytes(data.audio), audioFormatRef.current)))
+        } else if (!chunkPlayingRef.current && audioQueueRef.current.length === 0) {
+          setIsAIPlaying(false)
+          setStatus("Idle")
         }
+      } else if (data.type === 'cancelled') {
+        // Everything of the interrupted answer has been dropped server-side (idle: it had already finished)
+        cancellingRef.current = false
+        setStreamingAnswer("")
+      } else if (data.type === 'queued') {
+        // The server is at capacity; the turn will start when its slot frees up
+        setStatus(`Server busy, you are number ${data.position} in line...`)
+      } else if (data.type === 'busy') {
+        // The waiting line is full too, so this turn was dropped
+        setStatus("Server is busy, please try again in a moment")
+      } else if (data.type === 'no_speech') {
+        // The server found no speech in the clip, so no answer is coming
+        setStatus("No speech detected")
       } else if (data.type === 'error') {
         console.error("Server error:", data.message)
+        cancellingRef.current = false
         setStatus(`Error: ${data.message}`)
       }
     }
@@ -237,28 +382,48 @@ export default function VoiceChat() {
             mimeType: 'audio/webm;codecs=opus'
           })
           
-          const chunks: Blob[] = []
-          mediaRecorder.ondataavailable = (e) => chunks.push(e.data)
+          const ws = wsRef.current
+          if (ws?.readyState !== WebSocket.OPEN) {
+            console.error("WebSocket is not connected")
+            setStatus("Error: Not connected to server")
+            setRecording(true) // Re-enable recording on error
+            vad.start()
+            return
+          }
+
+          const duration = audioBuffer.length / audioBuffer.sampleRate * 1000
+          // Pauses close to the end are covered by audio_end
+          const pauses = findPauses(audioData, 16000).filter(end => end < duration - 500)
+          let replayStartedAt = 0
+
+          // Stream the utterance in small chunks so the server can transcribe while it arrives
+          ws.send(JSON.stringify({ type: 'audio_start', format: 'webm' }))
+          mediaRecorder.ondataavailable = (e) => {
+            // Blobs are queued synchronously, so chunks keep their order
+            if (e.data.size > 0 && ws.readyState === WebSocket.OPEN) {
+              ws.send(e.data)
+              // The audio up to a pause has been sent: the server can transcribe it right away
+              const sent = performance.now() - replayStartedAt
+              if (pauses.length > 0 && pauses[0] <= sent) {
+                while (pauses.length > 0 && pauses[0] <= sent) pauses.shift()
+                ws.send(JSON.stringify({ type: 'audio_pause' }))
+              }
+            }
+          }
           
           return new Promise<void>((resolve) => {
-            mediaRecorder.onstop = async () => {
-              const blob = new Blob(chunks, { type: 'audio/webm' })
-              
-              if (wsRef.current?.readyState === WebSocket.OPEN) {
-                wsRef.current.send(await blob.arrayBuffer())
-              } else {
-                console.error("WebSocket is not connected")
-                setStatus("Error: Not connected to server")
-                setRecording(true) // Re-enable recording on error
-                vad.start()
+            mediaRecorder.onstop = () => {
+              // The final chunk is delivered before stop, so the utterance is complete
+              if (ws.readyState === WebSocket.OPEN) {
+                ws.send(JSON.stringify({ type: 'audio_end' }))
               }
               resolve()
             }
             
-            mediaRecorder.start()
+            mediaRecorder.start(250)
             source.start()
+            replayStartedAt = performance.now()
             
-            const duration = audioBuffer.length / audioBuffer.sampleRate * 1000
             setTimeout(() => {
               mediaRecorder.stop()
               source.stop()
@@ -392,6 +557,13 @@ export default function VoiceChat() {
         audioRef.current.pause()
         audioRef.current.currentTime = 0
       }
+      audioQueueRef.current = []
+      chunkPlayingRef.current = false
+      // Stop the server generating and synthesizing the rest of the answer
+      if (!responseDoneRef.current && wsRef.current?.readyState === WebSocket.OPEN) {
+        cancellingRef.current = true
+        wsRef.current.send(JSON.stringify({ type: 'cancel' }))
+      }
       setIsAIPlaying(false)
       setStatus("AI response stopped")
       startRecording() // Start recording when AI is stopped manually
@@ -515,6 +687,13 @@ export default function VoiceChat() {
               </div>
             </div>
           )}
+          {streamingAnswer && (
+            <div className="flex justify-start">
+              <div className="max-w-[80%] p-3 rounded-lg bg-gray-700/70 text-white">
+                {streamingAnswer}
+              </div>
+            </div>
+          )}
         </div>
         
         {/* Text input form */}
@@ -594,6 +773,16 @@ export default function VoiceChat() {
               className="w-full"
               autoPlay
               onEnded={() => {
+                // Keep speaking while more sentence chunks are queued or on their way
+                if (audioQueueRef.current.length > 0) {
+                  playNextChunk()
+                  return
+                }
+                chunkPlayingRef.current = false
+                if (!responseDoneRef.current) {
+                  return
+                }
+                
                 setIsAIPlaying(false)
                 setStatus("Idle")
                 playPromiseRef.current = null